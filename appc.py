@@ -1,15 +1,40 @@
 import streamlit as st
+from streamlit import runtime
 import pandas as pd
-import plotly.express as px
-from datetime import datetime, timedelta, time
-import numpy as np
-import io
-import requests
+from datetime import datetime, date
+from functools import partial
+import time
+import uuid
+
+from archivio import archivio_piani
+from caricamento import leggi_ordini
+from carico import CaricoMacchine, figura_carico
+from calendario import SETTIMANA_DEFAULT, WorkCalendar, leggi_festivi, leggi_turni
+from diagnostica import HA_PYINSTRUMENT, Diagnostica, Profilo, cronometrata, registra_metriche, storico_metriche
+from esportazione import FORMATI, MIME_EXCEL, esporta, formati_disponibili
+from gantt import figura_gantt
+from liste_lavoro import (
+    OpzioniLista, excel_lista, excel_multifoglio, html_lista, liste_export, liste_stampa,
+    nome_file, zip_liste,
+)
+from ottimizzatore import Ottimizzatore
+from percorso_critico import COLONNE_CRITICHE, analizza
+from pianificatore import GRUPPI_MACCHINE, pianifica, prepara_dati, versione_piano
+from ritardi import aggiorna_ritardi
+from scenari import Scenario, confronta_scenari
+from sorgenti import fonte_drive
 
 st.set_page_config(page_title="Pianificazione Produzione", layout="wide")
 
 st.title("📅 Pianificazione Produzione - Gantt Interattivo")
 
+# --- Diagnostica: tempi per fase di questa esecuzione (pannello in fondo alla barra laterale) ---
+diagnostica = Diagnostica(memoria=st.session_state.get("diagnostica_memoria", False))
+profilo = None
+if st.session_state.pop("profila_prossimo", False):
+    profilo = Profilo()
+    profilo.avvia()
+
 st.sidebar.header("⚙️ Impostazioni")
 
 # --- Caricamento ID Google Drive dai secrets ---
@@ -24,7 +49,7 @@ caricamento_tipo = st.sidebar.radio(
     ["☁️ Google Drive (auto-aggiornamento)", "📤 Carica file manualmente"]
 )
 
-file_data = None
+df_input = None
 
 if caricamento_tipo == "☁️ Google Drive (auto-aggiornamento)":
     st.sidebar.markdown("### Configurazione Google Drive")
@@ -61,112 +86,123 @@ if caricamento_tipo == "☁️ Google Drive (auto-aggiornamento)":
             placeholder="Incolla qui l'ID del file"
         )
     
-    auto_refresh = st.sidebar.checkbox("🔄 Auto-aggiornamento ogni 5 minuti", value=False)
+    auto_refresh = st.sidebar.checkbox("🔄 Aggiornamento automatico quando il file cambia", value=False)
     
     if auto_refresh:
-        st.sidebar.info("La pagina si aggiornerà automaticamente")
-        st_autorefresh = st.sidebar.empty()
-        st_autorefresh.markdown(
-            '<meta http-equiv="refresh" content="300">',
-            unsafe_allow_html=True
+        minuti_verifica = st.sidebar.number_input(
+            "Verifica modifiche ogni (minuti):", min_value=1, max_value=60, value=5,
+            help="Il file viene controllato in background; la pagina si aggiorna solo se il contenuto è cambiato"
         )
     
     if gdrive_file_id:
         try:
             with st.spinner("⏳ Caricamento da Google Drive..."):
-                download_url = f"https://drive.google.com/uc?export=download&id={gdrive_file_id}"
-                response = requests.get(download_url)
-                
-                if response.status_code == 200:
-                    file_data = io.BytesIO(response.content)
-                    st.sidebar.success("✅ File caricato da Google Drive")
-                    st.sidebar.caption(f"Ultimo aggiornamento: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-                else:
-                    st.sidebar.error("❌ Errore nel caricamento. Verifica che il file sia condiviso pubblicamente.")
+                with diagnostica.fase("download"):
+                    esito = fonte_drive(gdrive_file_id).scarica()
+                with diagnostica.fase("lettura"):
+                    df_input = esito.versione.dataframe()
+
+            if esito.errore:
+                st.sidebar.warning(f"⚠️ Google Drive non raggiungibile, uso l'ultima versione scaricata ({esito.errore})")
+            else:
+                st.sidebar.success("✅ File caricato da Google Drive")
+            st.sidebar.caption(f"Ultimo aggiornamento: {esito.versione.scaricato_il.strftime('%d/%m/%Y %H:%M:%S')}")
+            if esito.verificato_il:
+                st.sidebar.caption(f"Ultima verifica: {esito.verificato_il.strftime('%d/%m/%Y %H:%M:%S')}")
         except Exception as e:
             st.sidebar.error(f"❌ Errore: {str(e)}")
 
+    if auto_refresh and df_input is not None:
+        # Un solo controllo in background per file, condiviso da tutte le sessioni: qui si confronta
+        # solo l'hash in memoria e, se è cambiato, si riesegue lo script senza ricaricare la pagina
+        fonte = fonte_drive(gdrive_file_id)
+        hash_caricato = esito.versione.hash
+        intervallo_verifica = int(minuti_verifica * 60)
+        fonte.sorveglia(intervallo_verifica)
+
+        @st.fragment(run_every=min(intervallo_verifica, 30))
+        def controlla_aggiornamenti():
+            fonte.sorveglia(intervallo_verifica)
+            if fonte.hash is not None and fonte.hash != hash_caricato:
+                st.rerun()
+            st.caption(f"🔄 Controllo modifiche attivo (ogni {minuti_verifica} min)")
+
+        with st.sidebar:
+            controlla_aggiornamenti()
+
 else:
     file_path = st.sidebar.file_uploader("Carica file Excel", type=["xlsx"])
     if file_path:
-        file_data = file_path
-
-# --- Parametri orari ---
-ORE_GIORNALIERE = 9
-INIZIO_GIORNO = time(8, 0)
-FINE_GIORNO = (datetime.combine(datetime.today(), INIZIO_GIORNO) + timedelta(hours=ORE_GIORNALIERE)).time()
-
-# --- Gruppi macchine che non possono lavorare insieme ---
-gruppi_macchine = [
-    {"nome": "GruppoGornatiPontiggia", "macchine": ["Gornati", "Pontiggia"]},
-]
-
-# --- Priorità operazioni per ordinamento ---
-ORDINE_OPERAZIONI = {
-    "tornitura": 1,
-    "fresatura": 2,
-    "foratura": 2,
-}
-
-def prossima_data_lavoro(dt):
-    """Restituisce la prossima data utile saltando i weekend."""
-    while dt.weekday() >= 5:
-        dt += timedelta(days=1)
-    return dt
-
-def aggiungi_ore_lavoro(start_time, ore):
-    """Aggiunge ore lavorative rispettando orario e weekend."""
-    current = start_time
-    ore_restanti = ore
-    while ore_restanti > 0:
-        current = prossima_data_lavoro(current)
-        fine_giorno = datetime.combine(current.date(), FINE_GIORNO)
-        tempo_disponibile = (fine_giorno - current).total_seconds() / 3600
-
-        if ore_restanti <= tempo_disponibile:
-            current += timedelta(hours=ore_restanti)
-            ore_restanti = 0
-        else:
-            ore_restanti -= tempo_disponibile
-            current = datetime.combine(current.date() + timedelta(days=1), INIZIO_GIORNO)
-    return current
-
-def get_ordine_operazione(operazione):
-    """Restituisce l'ordine di priorità dell'operazione (1=prima, valori più alti=dopo)."""
-    if pd.isna(operazione):
-        return 999
-    operazione_lower = str(operazione).lower().strip()
-    for key, value in ORDINE_OPERAZIONI.items():
-        if key in operazione_lower:
-            return value
-    return 10
-
-if file_data:
-    df = pd.read_excel(file_data)
-
-    # --- Gestione colonne Dipendenza e Priorità ---
-    if "Dipendenza" not in df.columns:
-        df["Dipendenza"] = ""
-    df["Dipendenza"] = df["Dipendenza"].fillna("").astype(str)
-    
-    if "Priorità" not in df.columns:
-        df["Priorità"] = 5
-    df["Priorità"] = pd.to_numeric(df["Priorità"], errors="coerce").fillna(5)
-
-    # --- Conversione colonne tempo ---
-    for col in ["Tempo unitario (h)", "Setup (h)"]:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-    df["Quantità"] = pd.to_numeric(df["Quantità"], errors="coerce").fillna(1)
-    df["Data richiesta"] = pd.to_datetime(df["Data richiesta"], errors="coerce")
-
-    # --- Aggiunta colonna per ordinamento operazioni ---
-    df["_ordine_operazione"] = df["Operazione"].apply(get_ordine_operazione)
+        with diagnostica.fase("lettura"):
+            df_input = leggi_ordini(file_path.getvalue())
+
+# --- Calendario di lavoro ---
+with st.sidebar.expander("🗓️ Calendario di lavoro"):
+    turni_testo = st.text_input(
+        "Turni giornalieri:",
+        value="08:00-17:00",
+        help="Più turni separati da virgola, es. 06:00-14:00, 14:00-22:00"
+    )
+    sabato_lavorativo = st.checkbox("Sabato lavorativo", value=False)
+    festivi_testo = st.text_area(
+        "Festività aziendali:",
+        placeholder="25/12/2025\n26/12/2025",
+        help="Una data per riga (GG/MM/AAAA)"
+    )
 
-    # --- Ordinamento del DataFrame ---
-    df = df.sort_values(
-        by=["Priorità", "Codice pezzo", "_ordine_operazione"],
-        ascending=[True, True, True]
-    ).reset_index(drop=True)
+try:
+    calendario = WorkCalendar(
+        leggi_turni(turni_testo),
+        leggi_festivi(festivi_testo),
+        settimana="1111110" if sabato_lavorativo else SETTIMANA_DEFAULT
+    )
+except ValueError as e:
+    st.sidebar.error(f"❌ {str(e)}")
+    calendario = WorkCalendar()
+
+# --- Pianificazione (motore in pianificatore.py) ---
+@st.cache_data(show_spinner=False)
+def prepara_dati_cached(df):
+    return prepara_dati(df)
+
+@st.cache_resource(show_spinner="⏳ Pianificazione in corso...", max_entries=8)
+def pianifica_cached(df, calendario, giorno, chiave=None):
+    # Il giorno fa parte della chiave: il piano parte da quel giorno a inizio turno.
+    # Il Piano è condiviso (non copiato) e va trattato in sola lettura.
+    return pianifica(df, calendario, GRUPPI_MACCHINE, inizio=giorno, chiave=chiave)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def percorso_critico_cached(versione, giorno, _piano):
+    # Il piano non viene hashato: versione e giorno di inizio lo identificano
+    return analizza(_piano)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def html_lista_cached(versione, macchina, lavori_stampa, mostra_ritardi, ritardi):
+    # La versione del piano fa parte della chiave: la vista si genera una volta per versione
+    return html_lista(macchina, lavori_stampa, mostra_ritardi, ritardi).encode("utf-8")
+
+def spazio_di_lavoro():
+    """Spazio delle modifiche manuali: l'utente autenticato, altrimenti un codice nell'URL della scheda.
+
+    Il codice nell'URL sopravvive al ricaricamento della pagina; chi apre lo
+    stesso URL condivide le modifiche.
+    """
+    if st.user.get("is_logged_in") and st.user.get("email"):
+        return st.user["email"]
+    if "spazio" not in st.query_params:
+        st.query_params["spazio"] = uuid.uuid4().hex[:12]
+    return st.query_params["spazio"]
+
+def url_stampa(html_content, macchina):
+    """URL breve della vista di stampa, servita dal server di Streamlit come file media."""
+    if not runtime.exists():
+        return None
+    return runtime.get_instance().media_file_mgr.add(html_content, "text/html", f"stampa_{macchina}")
+
+if df_input is not None:
+    with diagnostica.fase("preparazione"):
+        df = prepara_dati_cached(df_input)
+    diagnostica.info["operazioni"] = len(df_input)
 
     st.subheader("📋 Dati di produzione ordinati")
     st.caption("Le operazioni sono ordinate per: Priorità → Codice pezzo → Tipo operazione (tornitura → fresatura/foratura)")
@@ -176,85 +212,103 @@ if file_data:
 
     st.subheader("📊 Generazione automatica del Gantt")
 
-    pianificazione = []
-    disponibilita = {}
-
-    # Inizializza disponibilità macchine
-    for macchina in df["Macchina"].unique():
-        disponibilita[macchina] = datetime.combine(datetime.today(), INIZIO_GIORNO)
-
-    for _, row in df.iterrows():
-        codice = row["Codice pezzo"]
-        macchina = row["Macchina"]
-        tempo = row["Tempo unitario (h)"] * row["Quantità"] + row["Setup (h)"]
-        dip = row["Dipendenza"].strip()
-        priorita = row["Priorità"]
-
-        # Gestione gruppi (Gornati-Pontiggia)
-        gruppo_macchina = next((g for g in gruppi_macchine if macchina in g["macchine"]), None)
-        if gruppo_macchina:
-            disponibilita_macchina = min(disponibilita[m] for m in gruppo_macchina["macchine"])
-        else:
-            disponibilita_macchina = disponibilita[macchina]
-
-        start_time = prossima_data_lavoro(disponibilita_macchina)
-
-        # Gestione dipendenze
-        if dip:
-            task_dip = next((t for t in pianificazione if t["Codice pezzo"] == dip), None)
-            if task_dip:
-                start_time = max(start_time, task_dip["Fine"])
-
-        end_time = aggiungi_ore_lavoro(start_time, tempo)
+    modalita = st.radio(
+        "Modalità di pianificazione:",
+        ["⚡ Rapida (greedy)", "🧠 Ottimizzata (ritardi e durata)"],
+        horizontal=True
+    )
 
-        # Aggiorna disponibilità
-        if gruppo_macchina:
-            for m in gruppo_macchina["macchine"]:
-                disponibilita[m] = end_time
+    # Una versione resta pianificata dal giorno in cui è stata archiviata la prima volta:
+    # le modifiche manuali restano valide anche i giorni successivi, finché gli ordini non cambiano
+    archivio = archivio_piani()
+    spazio = spazio_di_lavoro()
+    with diagnostica.fase("pianificazione"):
+        versione_greedy = versione_piano(df, calendario, GRUPPI_MACCHINE)
+        giorno = archivio.inizio_piano(versione_greedy) or date.today()
+        piano = pianifica_cached(df_input, calendario, giorno)
+    if giorno < date.today():
+        col_giorno, col_oggi = st.columns([4, 1])
+        col_giorno.caption(f"📌 Piano calcolato dal {giorno:%d/%m/%Y}, quando questi ordini sono stati pianificati la prima volta")
+        if col_oggi.button(
+            "📅 Ripianifica da oggi",
+            help="Ricalcola il piano da oggi: le modifiche manuali salvate per questi ordini (di tutti gli utenti) vengono eliminate",
+        ):
+            # Piano greedy e, se c'è, piano con la sequenza ottimizzata (stessa versione calcolata da pianifica)
+            versioni = {versione_greedy}
+            chiave_ottimizzata = st.session_state.get("chiavi_ottimizzate", {}).pop(versione_greedy, None)
+            if chiave_ottimizzata is not None:
+                versioni.add(versione_piano(df, calendario, GRUPPI_MACCHINE, chiave_ottimizzata))
+            for versione in versioni:
+                archivio.elimina_piano(versione)
+            for chiave in list(st.session_state):
+                prefisso, _, resto = str(chiave).partition("_")
+                if prefisso in ("base", "gantt", "salvate") and resto.partition("_")[0] in versioni:
+                    del st.session_state[chiave]
+            st.rerun()
+
+    if modalita == "🧠 Ottimizzata (ritardi e durata)":
+        # Sequenze ottimizzate, per versione del piano greedy di partenza
+        chiavi_ottimizzate = st.session_state.setdefault("chiavi_ottimizzate", {})
+        col_budget, col_avvio = st.columns([3, 1])
+        with col_budget:
+            budget = st.slider("Tempo massimo di ottimizzazione (secondi):", 10, 300, 30, step=10)
+        with col_avvio:
+            avvia = st.button("▶️ Avvia ottimizzazione")
+
+        if avvia:
+            stato_ottimizzazione = st.empty()
+            anteprima = st.empty()
+            ottimizzatore = Ottimizzatore(df_input, calendario, GRUPPI_MACCHINE, inizio=giorno)
+            ultimo_disegno = 0.0
+            avvio_ottimizzazione = time.perf_counter()
+            for soluzione in ottimizzatore.esegui(budget):
+                valutazione = soluzione.valutazione
+                chiavi_ottimizzate[piano.versione] = soluzione.chiave
+                stato_ottimizzazione.info(
+                    f"🧠 {soluzione.origine} (iterazione {soluzione.iterazione}, {soluzione.secondi:.0f}s): "
+                    f"{valutazione.operazioni_in_ritardo} operazioni in ritardo, "
+                    f"ritardo pesato {valutazione.ritardo_pesato:.0f} h, durata {valutazione.makespan:.0f} h lavorative"
+                )
+                # Migliore soluzione finora, ridisegnata al massimo ogni 2 secondi
+                if time.monotonic() - ultimo_disegno > 2:
+                    anteprima.plotly_chart(
+                        figura_gantt(ottimizzatore.piano(soluzione).gantt_df, calendario, "🧠 Migliore soluzione finora"),
+                        use_container_width=True
+                    )
+                    ultimo_disegno = time.monotonic()
+            anteprima.empty()
+            diagnostica.fasi["ottimizzazione"] = {"secondi": time.perf_counter() - avvio_ottimizzazione, "chiamate": 1}
+
+        if piano.versione in chiavi_ottimizzate:
+            with diagnostica.fase("pianificazione"):
+                piano = pianifica_cached(df_input, calendario, giorno, chiavi_ottimizzate[piano.versione])
+            st.success("✅ Piano calcolato con la sequenza ottimizzata")
         else:
-            disponibilita[macchina] = end_time
-
-        pianificazione.append({
-            "Commessa": row["Commessa"],
-            "Codice pezzo": codice,
-            "Operazione": row["Operazione"],
-            "Macchina": macchina,
-            "Priorità": priorita,
-            "Inizio": start_time,
-            "Fine": end_time
-        })
-
-    gantt_df = pd.DataFrame(pianificazione)
-
-    # --- Calcolo ritardi rispetto alla data richiesta ---
-    # Mappa per collegare ogni operazione alla sua data richiesta
-    data_richiesta_map = df.set_index("Codice pezzo")["Data richiesta"].to_dict()
-    
-    gantt_df["Data richiesta"] = gantt_df["Codice pezzo"].map(data_richiesta_map)
-    
-    # Calcola il ritardo in giorni (solo giorni lavorativi)
-    def calcola_ritardo_giorni(row):
-        if pd.isna(row["Data richiesta"]):
-            return 0
-        
-        fine = row["Fine"].date() if isinstance(row["Fine"], datetime) else row["Fine"]
-        richiesta = row["Data richiesta"].date() if isinstance(row["Data richiesta"], datetime) else row["Data richiesta"]
-        
-        if fine <= richiesta:
-            return 0
-        
-        # Conta solo i giorni lavorativi (esclude weekend)
-        giorni_ritardo = 0
-        current_date = richiesta + timedelta(days=1)
-        while current_date <= fine:
-            if current_date.weekday() < 5:  # Lunedì=0, Venerdì=4
-                giorni_ritardo += 1
-            current_date += timedelta(days=1)
-        
-        return giorni_ritardo
-    
-    gantt_df["Ritardo (giorni)"] = gantt_df.apply(calcola_ritardo_giorni, axis=1)
-    gantt_df["In ritardo"] = gantt_df["Ritardo (giorni)"] > 0
+            st.info("👆 Avvia l'ottimizzazione per migliorare il piano greedy")
+
+    gantt_df = piano.gantt_df
+    diagnostica.info["versione"] = piano.versione
+    sessione = f"{piano.versione}_{giorno:%Y%m%d}"  # stato dell'editor per piano e giorno di inizio
+
+    # Piano e modifiche manuali (per spazio di lavoro) restano nell'archivio SQLite: alla riapertura vengono riapplicate
+    with diagnostica.fase("archivio"):
+        archivio.salva_piano(piano.versione, gantt_df, inizio=giorno)
+        if f"base_{sessione}" not in st.session_state:
+            # Una volta per sessione: il data editor lavora poi su questa base
+            st.session_state[f"base_{sessione}"] = archivio.applica_modifiche(piano.versione, spazio, gantt_df)
+            st.session_state.pop(f"salvate_{sessione}", None)
+    gantt_df_base, manuali_salvate = st.session_state[f"base_{sessione}"]
+    if manuali_salvate:
+        st.caption(f"💾 Riapplicate {len(manuali_salvate)} modifiche manuali salvate per questo piano")
+
+    with diagnostica.fase("percorso critico"):
+        critico = percorso_critico_cached(piano.versione, giorno, piano)
+
+    avvisi = gantt_df.attrs.get("avvisi", [])
+    if avvisi:
+        with st.expander(f"⚠️ {len(avvisi)} avvisi sulle dipendenze"):
+            for avviso in avvisi:
+                st.write(f"- {avviso}")
 
     st.subheader("📈 Gantt interattivo")
     
@@ -266,56 +320,135 @@ if file_data:
         st.success("✅ Nessuna operazione in ritardo")
     
     st.caption("Puoi modificare manualmente le date nelle celle qui sotto, poi aggiornare il grafico.")
+    ripianifica_cascata = st.checkbox(
+        "🔁 Sposta a cascata le operazioni successive",
+        value=True,
+        help="Le date modificate restano fisse; le operazioni successive sulla stessa macchina (o gruppo) e quelle dipendenti vengono ripianificate"
+    )
 
     gantt_df_edit = st.data_editor(
-        gantt_df,
+        gantt_df_base.join(critico.tempi),
         column_config={
             "Inizio": st.column_config.DatetimeColumn("Inizio"),
             "Fine": st.column_config.DatetimeColumn("Fine"),
             "Priorità": st.column_config.NumberColumn("Priorità", help="1=massima urgenza, valori più alti=meno urgente"),
+            "Inizio minimo": st.column_config.DatetimeColumn("Inizio minimo", help="Il più presto possibile con la sequenza del piano"),
+            "Inizio massimo": st.column_config.DatetimeColumn("Inizio massimo", help="Il più tardi possibile senza ritardare una data richiesta"),
+            "Slack (ore)": st.column_config.NumberColumn("Slack (ore)", help="Ore lavorative di margine; negativo = già in ritardo a valle"),
+            "Critica": st.column_config.CheckboxColumn("Critica", help="Slack nullo o negativo (calcolato sul piano, prima delle modifiche manuali)"),
         },
+        disabled=COLONNE_CRITICHE,
         num_rows="dynamic",
-        use_container_width=True
-    )
-
-    # Disegno Gantt aggiornato
-    fig = px.timeline(
-        gantt_df_edit,
-        x_start="Inizio",
-        x_end="Fine",
-        y="Macchina",
-        color="Codice pezzo",
-        text="Codice pezzo",
-        hover_data=["Commessa", "Operazione", "Priorità"],
-        title="📆 Gantt di Produzione (Aggiornato)"
+        use_container_width=True,
+        key=f"gantt_{sessione}"
     )
 
-    fig.update_yaxes(autorange="reversed")
-    fig.update_traces(textposition='inside', textfont_size=10)
-    fig.update_layout(
-        xaxis_title="Data",
-        yaxis_title="Macchina",
-        hovermode="closest",
-        height=700,
-        xaxis=dict(showgrid=True, tickformat="%d-%m %H:%M"),
-    )
-
-    # Evidenzia weekend
-    min_date = gantt_df_edit["Inizio"].min().date()
-    max_date = gantt_df_edit["Fine"].max().date()
-    giorno = min_date
-    while giorno <= max_date:
-        if giorno.weekday() >= 5:
-            fig.add_vrect(
-                x0=giorno,
-                x1=giorno + timedelta(days=1),
-                fillcolor="lightgray",
-                opacity=0.3,
-                line_width=0,
+    # Modifiche manuali (salvate e di questa sessione): solo le righe toccate e quelle a valle vengono ricalcolate
+    stato_editor = st.session_state[f"gantt_{sessione}"]
+    righe_modificate = stato_editor.get("edited_rows", {})
+    etichette_modificate = [gantt_df_base.index[int(pos)] for pos in righe_modificate]
+    manuali = manuali_salvate | set(etichette_modificate)
+    fissate = {}
+    for etichetta in manuali:
+        if etichetta in gantt_df.index and etichetta in gantt_df_edit.index:
+            inizio_riga, fine_riga = gantt_df_edit.at[etichetta, "Inizio"], gantt_df_edit.at[etichetta, "Fine"]
+            if pd.notna(inizio_riga) and pd.notna(fine_riga) and (
+                abs(inizio_riga - gantt_df.at[etichetta, "Inizio"]) >= pd.Timedelta(seconds=1)
+                or abs(fine_riga - gantt_df.at[etichetta, "Fine"]) >= pd.Timedelta(seconds=1)
+            ):
+                fissate[etichetta] = (inizio_riga, fine_riga)
+
+    if fissate and ripianifica_cascata:
+        try:
+            with diagnostica.fase("ripianificazione"):
+                gantt_df_edit, spostate = piano.ripianifica(fissate, gantt_df_edit)
+        except ValueError as e:
+            st.error(f"❌ {e}: correggi le date, le operazioni successive non sono state spostate")
+        else:
+            st.info(f"🔁 {len(fissate)} operazioni modificate, {len(spostate)} operazioni successive ripianificate")
+
+    # Ritardi ricalcolati sulle righe modificate a mano o aggiunte
+    with diagnostica.fase("ritardi"):
+        altre_righe = set(etichette_modificate) | set(gantt_df_edit.index.difference(gantt_df.index))
+        if not ripianifica_cascata:
+            altre_righe |= set(fissate)
+        aggiorna_ritardi(gantt_df_edit, [r for r in altre_righe if r in gantt_df_edit.index], calendario)
+
+    # Salvataggio solo quando l'editor (o la cascata) cambia; riepiloghi, finestre e liste arrivano dall'archivio
+    with diagnostica.fase("archivio"):
+        firma_editor = repr((righe_modificate, stato_editor.get("added_rows", []), stato_editor.get("deleted_rows", []),
+                             ripianifica_cascata))
+        if st.session_state.setdefault(f"salvate_{sessione}", firma_editor) != firma_editor:
+            archivio.salva_modifiche(piano.versione, spazio, gantt_df, gantt_df_edit, manuali)
+            st.session_state[f"salvate_{sessione}"] = firma_editor
+        ritardi_macchina = archivio.riepilogo_ritardi(piano.versione, "Macchina", spazio)
+        ritardi_commessa = archivio.riepilogo_ritardi(piano.versione, "Commessa", spazio)
+
+    # Disegno Gantt aggiornato: solo la finestra e le macchine scelte sono disegnate in dettaglio
+    col_finestra, col_macchine_gantt, col_evidenza = st.columns([2, 3, 2])
+    with col_finestra:
+        primo_giorno = gantt_df_edit["Inizio"].min().date()
+        ultimo_giorno = gantt_df_edit["Fine"].max().date()
+        finestra = st.date_input(
+            "Periodo visualizzato:",
+            value=(primo_giorno, ultimo_giorno),
+            min_value=primo_giorno,
+            max_value=ultimo_giorno,
+            format="DD/MM/YYYY"
+        )
+    with col_macchine_gantt:
+        macchine_gantt = st.multiselect(
+            "Macchine visualizzate (vuoto = tutte):",
+            options=sorted(gantt_df_edit["Macchina"].dropna().unique())
+        )
+    with col_evidenza:
+        evidenza = st.selectbox(
+            "🎯 Evidenzia:",
+            ["Nessuna", "Operazioni critiche"] + [f"Catena critica {c}" for c in critico.riepilogo.index],
+            help="Catene in ordine di slack: le prime sono le commesse con meno margine",
+        )
+    commessa_evidenziata = evidenza.removeprefix("Catena critica ") if evidenza.startswith("Catena critica ") else None
+    inizio_finestra, fine_finestra = None, None
+    if len(finestra) == 2 and tuple(finestra) != (primo_giorno, ultimo_giorno):
+        inizio_finestra = datetime.combine(finestra[0], datetime.min.time())
+        fine_finestra = datetime.combine(finestra[1], datetime.max.time())
+    with diagnostica.fase("gantt"):
+        gantt_finestra = gantt_df_edit
+        if inizio_finestra is not None or macchine_gantt:
+            gantt_finestra = archivio.operazioni(
+                piano.versione, spazio, macchine=macchine_gantt or None, inizio=inizio_finestra, fine=fine_finestra
             )
-        giorno += timedelta(days=1)
-
-    st.plotly_chart(fig, use_container_width=True)
+        if evidenza == "Operazioni critiche":
+            gantt_finestra = gantt_finestra.assign(
+                Evidenziata=critico.tempi["Critica"].reindex(gantt_finestra.index, fill_value=False)
+            )
+        elif commessa_evidenziata is not None:
+            gantt_finestra = gantt_finestra.assign(
+                Evidenziata=gantt_finestra.index.isin(critico.catena(commessa_evidenziata))
+            )
+        fig = figura_gantt(
+            gantt_finestra, calendario,
+            inizio=inizio_finestra, fine=fine_finestra, macchine=macchine_gantt,
+            evidenzia="Evidenziata" if evidenza != "Nessuna" else None
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # --- Carico macchine: matrice per giorno lavorativo della sessione, aggiornata solo sulle righe cambiate ---
+    st.subheader("🌡️ Carico macchine")
+    periodo_carico = st.radio(
+        "Dettaglio del carico:", ["settimana", "giorno"], horizontal=True, format_func=str.capitalize,
+        help="Ore pianificate rispetto alle ore lavorative disponibili nel periodo visualizzato; "
+             "un gruppo di macchine esclusive ha la capacità di una sola macchina"
+    )
+    with diagnostica.fase("carico"):
+        versione_carico, carico = st.session_state.get("carico", (None, None))
+        if versione_carico != piano.versione:
+            carico = CaricoMacchine(calendario, GRUPPI_MACCHINE)
+            st.session_state["carico"] = (piano.versione, carico)
+        carico.aggiorna(gantt_df_edit)
+        carico_periodo, capacita_periodo = carico.tabella(periodo_carico, inizio_finestra, fine_finestra)
+        fig_carico = figura_carico(carico_periodo, capacita_periodo)
+    st.plotly_chart(fig_carico, use_container_width=True)
 
     # --- Statistiche di riepilogo ---
     st.subheader("📊 Statistiche di pianificazione")
@@ -329,8 +462,10 @@ if file_data:
     with col3:
         st.metric("Macchine coinvolte", gantt_df_edit["Macchina"].nunique())
     with col4:
-        num_ritardi = int(gantt_df_edit["In ritardo"].sum())
-        ritardo_medio = gantt_df_edit[gantt_df_edit["In ritardo"]]["Ritardo (giorni)"].mean() if num_ritardi > 0 else 0
+        num_ritardi = int(ritardi_commessa["In ritardo"].sum())
+        ritardo_medio = (
+            gantt_df_edit["Ritardo (giorni)"].sum() / num_ritardi if num_ritardi > 0 else 0
+        )
         st.metric(
             "Operazioni in ritardo", 
             num_ritardi,
@@ -341,21 +476,109 @@ if file_data:
     # Tabella dettaglio ritardi
     if num_ritardi > 0:
         st.subheader("⚠️ Dettaglio operazioni in ritardo")
-        ritardi_df = gantt_df_edit[gantt_df_edit["In ritardo"]].sort_values("Ritardo (giorni)", ascending=False)
+        ritardi_df = archivio.operazioni(piano.versione, spazio, solo_in_ritardo=True, ordina="ritardo")
         st.dataframe(
             ritardi_df[["Commessa", "Codice pezzo", "Operazione", "Macchina", "Data richiesta", "Fine", "Ritardo (giorni)"]],
             use_container_width=True
         )
 
-    # Esportazione Excel aggiornata
-    output = io.BytesIO()
-    gantt_df_edit.to_excel(output, index=False, engine="openpyxl")
-    st.download_button(
-        label="💾 Scarica pianificazione aggiornata (Excel)",
-        data=output.getvalue(),
-        file_name="pianificazione_aggiornata.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        st.subheader("📁 Ritardi per commessa")
+        st.dataframe(
+            ritardi_commessa[ritardi_commessa["In ritardo"] > 0].sort_values("Ritardo massimo (giorni)", ascending=False),
+            use_container_width=True
+        )
+
+    # --- Percorso critico: commesse con meno margine e operazioni che ne determinano la fine ---
+    st.subheader("🧭 Percorso critico per commessa")
+    st.caption(
+        "Calcolato sul piano (prima delle modifiche manuali) da dipendenze e sequenza sulle macchine. "
+        "La catena critica risale dall'ultima operazione della commessa lungo le operazioni che ne vincolano l'inizio, "
+        "anche di altre commesse in coda sulle stesse macchine."
     )
+    st.dataframe(critico.riepilogo, use_container_width=True)
+    if commessa_evidenziata is not None:
+        st.markdown(f"**Catena critica della commessa {commessa_evidenziata}**")
+        catena = critico.catena(commessa_evidenziata)
+        st.dataframe(
+            gantt_df.loc[catena, ["Commessa", "Codice pezzo", "Operazione", "Macchina", "Inizio", "Fine"]]
+            .join(critico.tempi[["Slack (ore)"]]),
+            use_container_width=True
+        )
+
+    # --- Scenari what-if ---
+    with st.expander("🔮 Scenari what-if"):
+        st.caption(
+            "Una riga per scenario: ogni scenario parte dai dati attuali e applica solo le modifiche indicate. "
+            "Gli scenari vengono pianificati in parallelo e confrontati con il piano attuale."
+        )
+        scenari_df = st.data_editor(
+            pd.DataFrame({
+                "Nome": ["Sabato lavorativo"],
+                "Sabato lavorativo": [True],
+                "Macchina ferma": [None],
+                "Fermo dal": [None],
+                "Fermo al": [None],
+                "Commessa": [None],
+                "Nuova priorità": [None],
+                "Senza gruppi macchine": [False],
+            }),
+            column_config={
+                "Macchina ferma": st.column_config.SelectboxColumn(
+                    options=sorted(df_input["Macchina"].dropna().astype(str).unique())
+                ),
+                "Fermo dal": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                "Fermo al": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                "Commessa": st.column_config.SelectboxColumn(
+                    options=sorted(df_input["Commessa"].dropna().astype(str).unique())
+                ),
+                "Nuova priorità": st.column_config.NumberColumn(min_value=1, step=1),
+            },
+            num_rows="dynamic",
+            use_container_width=True,
+            key="scenari"
+        )
+
+        if st.button("▶️ Confronta scenari"):
+            scenari = []
+            for n, riga in enumerate(scenari_df.to_dict("records"), start=1):
+                fermi = ()
+                if pd.notna(riga["Macchina ferma"]) and pd.notna(riga["Fermo dal"]):
+                    fermo_al = riga["Fermo al"] if pd.notna(riga["Fermo al"]) else riga["Fermo dal"]
+                    fermi = ((riga["Macchina ferma"], riga["Fermo dal"], fermo_al),)
+                priorita = {}
+                if pd.notna(riga["Commessa"]) and pd.notna(riga["Nuova priorità"]):
+                    priorita = {riga["Commessa"]: riga["Nuova priorità"]}
+                scenari.append(Scenario(
+                    nome=riga["Nome"] if pd.notna(riga["Nome"]) and riga["Nome"] else f"Scenario {n}",
+                    settimana="1111110" if riga["Sabato lavorativo"] is True else None,
+                    fermi=fermi,
+                    priorita=priorita,
+                    gruppi=[] if riga["Senza gruppi macchine"] is True else None,
+                ))
+            with st.spinner("⏳ Pianificazione degli scenari in corso..."), diagnostica.fase("scenari"):
+                st.session_state["confronto_scenari"] = confronta_scenari(
+                    df_input, scenari, calendario, GRUPPI_MACCHINE, inizio=giorno
+                )
+
+        if "confronto_scenari" in st.session_state:
+            st.dataframe(
+                st.session_state["confronto_scenari"].style.format({"Ritardo medio (giorni)": "{:.1f}"}),
+                use_container_width=True
+            )
+
+    # Esportazione del piano aggiornato: file generati al click, una volta per versione
+    formati_export = formati_disponibili()
+    for col_export, formato in zip(st.columns(len(formati_export)), formati_export):
+        etichetta, mime, estensione = FORMATI[formato]
+        with col_export:
+            st.download_button(
+                label=f"💾 Scarica pianificazione aggiornata ({etichetta})",
+                data=cronometrata(f"esportazione_{formato}", partial(esporta, gantt_df_edit, formato)),
+                file_name=f"pianificazione_aggiornata.{estensione}",
+                mime=mime,
+                on_click="ignore",
+                key=f"export_{formato}"
+            )
     
     # --- SEZIONE LISTE DI LAVORO PER MACCHINA ---
     st.markdown("---")
@@ -389,70 +612,35 @@ if file_data:
         with col3:
             mostra_ritardi = st.checkbox("Evidenzia ritardi", value=True)
         
-        # Genera le liste per ogni macchina
-        for macchina in macchine_selezionate:
-            lavori_macchina = gantt_df_edit[gantt_df_edit["Macchina"] == macchina].copy()
-            lavori_macchina = lavori_macchina.sort_values("Inizio")
-            
+        # Tabelle di tutte le macchine in un solo passaggio; HTML ed Excel solo al download
+        opzioni_lista = OpzioniLista(formato_data, mostra_priorita, mostra_tempi, mostra_ritardi)
+        with diagnostica.fase("liste"):
+            lavori_macchine = archivio.operazioni(piano.versione, spazio, macchine=macchine_selezionate)
+            liste = liste_stampa(lavori_macchine, macchine_selezionate, opzioni_lista)
+            periodo_macchina = archivio.periodi_macchine(piano.versione, macchine_selezionate, spazio)
+        ritardi_per_macchina = ritardi_macchina["In ritardo"].to_dict()
+
+        def highlight_ritardi_stampa(row):
+            if row.get("In ritardo", False):
+                return ['background-color: #ffcccc'] * len(row)
+            return [''] * len(row)
+
+        for macchina, lavori_stampa in liste.items():
             st.markdown(f"### 🔧 {macchina}")
             
             # Statistiche macchina
             col_stat1, col_stat2, col_stat3 = st.columns(3)
             with col_stat1:
-                st.metric("Operazioni", len(lavori_macchina))
+                st.metric("Operazioni", len(lavori_stampa))
             with col_stat2:
-                ritardi_macchina = lavori_macchina["In ritardo"].sum()
-                st.metric("In ritardo", int(ritardi_macchina))
+                ritardi_macchina_n = ritardi_per_macchina.get(macchina, 0)
+                st.metric("In ritardo", int(ritardi_macchina_n))
             with col_stat3:
-                if len(lavori_macchina) > 0:
-                    inizio_primo = lavori_macchina["Inizio"].min()
-                    fine_ultimo = lavori_macchina["Fine"].max()
-                    durata = (fine_ultimo - inizio_primo).days
-                    st.metric("Durata totale", f"{durata} giorni")
-            
-            # Prepara tabella stampabile
-            colonne_stampa = ["Commessa", "Codice pezzo", "Operazione"]
-            
-            if mostra_priorita:
-                colonne_stampa.append("Priorità")
-            
-            # Formattazione date
-            lavori_macchina["Inizio_formattato"] = lavori_macchina["Inizio"].apply(
-                lambda x: x.strftime("%d/%m/%Y") if formato_data == "GG/MM/AAAA" 
-                else (x.strftime("%d/%m/%Y %H:%M") if formato_data == "GG/MM/AAAA HH:MM"
-                else x.strftime("%A %d/%m/%Y alle %H:%M"))
-            )
-            lavori_macchina["Fine_formattato"] = lavori_macchina["Fine"].apply(
-                lambda x: x.strftime("%d/%m/%Y") if formato_data == "GG/MM/AAAA" 
-                else (x.strftime("%d/%m/%Y %H:%M") if formato_data == "GG/MM/AAAA HH:MM"
-                else x.strftime("%A %d/%m/%Y alle %H:%M"))
-            )
-            
-            colonne_stampa.extend(["Inizio_formattato", "Fine_formattato"])
-            
-            if mostra_tempi:
-                lavori_macchina["Durata (ore)"] = (
-                    (lavori_macchina["Fine"] - lavori_macchina["Inizio"]).dt.total_seconds() / 3600
-                ).round(1)
-                colonne_stampa.append("Durata (ore)")
-            
-            if mostra_ritardi:
-                colonne_stampa.extend(["Ritardo (giorni)", "In ritardo"])
-            
-            # Rinomina colonne per stampa
-            lavori_stampa = lavori_macchina[colonne_stampa].copy()
-            lavori_stampa = lavori_stampa.rename(columns={
-                "Inizio_formattato": "Inizio",
-                "Fine_formattato": "Fine"
-            })
+                durata = (periodo_macchina.at[macchina, "fine"] - periodo_macchina.at[macchina, "inizio"]).days
+                st.metric("Durata totale", f"{durata} giorni")
             
             # Mostra tabella con stile
             if mostra_ritardi:
-                def highlight_ritardi_stampa(row):
-                    if row.get("In ritardo", False):
-                        return ['background-color: #ffcccc'] * len(row)
-                    return [''] * len(row)
-                
                 st.dataframe(
                     lavori_stampa.style.apply(highlight_ritardi_stampa, axis=1),
                     use_container_width=True,
@@ -461,184 +649,65 @@ if file_data:
             else:
                 st.dataframe(lavori_stampa, use_container_width=True, hide_index=True)
             
-            # Genera HTML per stampa
-            html_content = f"""
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <style>
-                    @page {{
-                        size: A4;
-                        margin: 1cm;
-                    }}
-                    body {{
-                        font-family: Arial, sans-serif;
-                        margin: 20px;
-                    }}
-                    h1 {{
-                        color: #2c3e50;
-                        border-bottom: 3px solid #3498db;
-                        padding-bottom: 10px;
-                    }}
-                    .info {{
-                        background-color: #ecf0f1;
-                        padding: 15px;
-                        border-radius: 5px;
-                        margin-bottom: 20px;
-                    }}
-                    table {{
-                        width: 100%;
-                        border-collapse: collapse;
-                        margin-top: 20px;
-                    }}
-                    th {{
-                        background-color: #3498db;
-                        color: white;
-                        padding: 12px;
-                        text-align: left;
-                        font-weight: bold;
-                    }}
-                    td {{
-                        padding: 10px;
-                        border-bottom: 1px solid #ddd;
-                    }}
-                    tr:nth-child(even) {{
-                        background-color: #f9f9f9;
-                    }}
-                    tr:hover {{
-                        background-color: #f5f5f5;
-                    }}
-                    .ritardo {{
-                        background-color: #ffcccc !important;
-                    }}
-                    .footer {{
-                        margin-top: 30px;
-                        text-align: center;
-                        color: #7f8c8d;
-                        font-size: 12px;
-                    }}
-                    @media print {{
-                        .no-print {{
-                            display: none;
-                        }}
-                    }}
-                </style>
-            </head>
-            <body>
-                <h1>📋 Lista Lavori - {macchina}</h1>
-                <div class="info">
-                    <p><strong>Data generazione:</strong> {datetime.now().strftime('%d/%m/%Y alle %H:%M')}</p>
-                    <p><strong>Numero operazioni:</strong> {len(lavori_macchina)}</p>
-                    <p><strong>Operazioni in ritardo:</strong> {int(ritardi_macchina)}</p>
-                </div>
-                <table>
-                    <thead>
-                        <tr>
-            """
-            
-            # Aggiungi intestazioni
-            for col in lavori_stampa.columns:
-                html_content += f"<th>{col}</th>"
-            
-            html_content += """
-                        </tr>
-                    </thead>
-                    <tbody>
-            """
-            
-            # Aggiungi righe
-            for idx, row in lavori_stampa.iterrows():
-                classe_ritardo = ' class="ritardo"' if mostra_ritardi and row.get("In ritardo", False) else ''
-                html_content += f"<tr{classe_ritardo}>"
-                for col in lavori_stampa.columns:
-                    valore = row[col]
-                    if col == "In ritardo":
-                        valore = "✓ SÌ" if valore else "No"
-                    html_content += f"<td>{valore}</td>"
-                html_content += "</tr>"
-            
-            html_content += """
-                    </tbody>
-                </table>
-                <div class="footer">
-                    <p>Sistema di Pianificazione Produzione</p>
-                </div>
-            </body>
-            </html>
-            """
-            
+            with diagnostica.fase("liste"):
+                html_content = html_lista_cached(piano.versione, macchina, lavori_stampa, mostra_ritardi, ritardi_macchina_n)
+
             # Bottoni per download e stampa
             col_btn1, col_btn2, col_btn3 = st.columns(3)
             
             with col_btn1:
                 st.download_button(
                     label=f"📄 Scarica HTML - {macchina}",
-                    data=html_content,
-                    file_name=f"lista_lavori_{macchina.replace(' ', '_')}.html",
+                    data=cronometrata("lista_html", partial(html_lista, macchina, lavori_stampa, mostra_ritardi, ritardi_macchina_n)),
+                    file_name=f"{nome_file(macchina)}.html",
                     mime="text/html",
+                    on_click="ignore",
                     key=f"html_{macchina}"
                 )
             
             with col_btn2:
-                # Excel per questa macchina
-                output_macchina = io.BytesIO()
-                lavori_stampa.to_excel(output_macchina, index=False, engine="openpyxl")
+                # Excel per questa macchina, generato al click
                 st.download_button(
                     label=f"📊 Scarica Excel - {macchina}",
-                    data=output_macchina.getvalue(),
-                    file_name=f"lista_lavori_{macchina.replace(' ', '_')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    data=cronometrata("lista_excel", partial(excel_lista, lavori_stampa)),
+                    file_name=f"{nome_file(macchina)}.xlsx",
+                    mime=MIME_EXCEL,
+                    on_click="ignore",
                     key=f"excel_{macchina}"
                 )
             
             with col_btn3:
-                st.markdown(f"""
-                <a href="data:text/html;charset=utf-8,{html_content.replace('#', '%23')}" 
-                   download="lista_lavori_{macchina.replace(' ', '_')}.html" 
-                   target="_blank">
-                    <button style="
-                        background-color: #2ecc71;
-                        color: white;
-                        padding: 0.5rem 1rem;
-                        border: none;
-                        border-radius: 0.25rem;
-                        cursor: pointer;
-                        font-size: 14px;
-                    ">
-                        🖨️ Apri per stampare
-                    </button>
-                </a>
-                """, unsafe_allow_html=True)
+                # La vista di stampa è servita come file a parte: nella pagina c'è solo il link
+                with diagnostica.fase("liste"):
+                    url = url_stampa(html_content, macchina)
+                if url:
+                    st.link_button("🖨️ Apri per stampare", url)
             
             st.markdown("---")
         
-        # Bottone per scaricare tutte le liste in un unico file Excel
+        # Bottoni per scaricare tutte le liste insieme (file generati al click)
         st.subheader("📦 Download multiplo")
         
-        output_multiplo = io.BytesIO()
-        with pd.ExcelWriter(output_multiplo, engine='openpyxl') as writer:
-            for macchina in macchine_selezionate:
-                lavori_macchina = gantt_df_edit[gantt_df_edit["Macchina"] == macchina].copy()
-                lavori_macchina = lavori_macchina.sort_values("Inizio")
-                
-                colonne_export = ["Commessa", "Codice pezzo", "Operazione", "Inizio", "Fine"]
-                if mostra_priorita:
-                    colonne_export.insert(3, "Priorità")
-                if mostra_ritardi:
-                    colonne_export.extend(["Ritardo (giorni)", "In ritardo"])
-                
-                lavori_macchina[colonne_export].to_excel(
-                    writer, 
-                    sheet_name=macchina[:31],  # Excel limita i nomi a 31 caratteri
-                    index=False
-                )
-        
-        st.download_button(
-            label="📥 Scarica tutte le liste (Excel multi-foglio)",
-            data=output_multiplo.getvalue(),
-            file_name=f"liste_lavoro_tutte_macchine_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        col_multi1, col_multi2 = st.columns(2)
+        with col_multi1:
+            st.download_button(
+                label="📥 Scarica tutte le liste (Excel multi-foglio)",
+                data=cronometrata(
+                    "liste_excel_multifoglio",
+                    lambda: excel_multifoglio(liste_export(lavori_macchine, macchine_selezionate, opzioni_lista))
+                ),
+                file_name=f"liste_lavoro_tutte_macchine_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                mime=MIME_EXCEL,
+                on_click="ignore"
+            )
+        with col_multi2:
+            st.download_button(
+                label="🗜️ Scarica tutte le liste (ZIP con HTML ed Excel)",
+                data=cronometrata("liste_zip", lambda: zip_liste(liste, mostra_ritardi, ritardi_per_macchina)),
+                file_name=f"liste_lavoro_{datetime.now().strftime('%Y%m%d')}.zip",
+                mime="application/zip",
+                on_click="ignore"
+            )
     
     else:
         st.info("👆 Seleziona almeno una macchina per generare le liste di lavoro")
@@ -693,3 +762,45 @@ else:
     - **Dipendenza** (opzionale)
     - **Priorità** (opzionale, 1=massima urgenza)
     """)
+
+
+# --- Pannello diagnostica ---
+if profilo is not None:
+    profilo.ferma()
+registra_metriche(diagnostica.chiudi())
+
+with st.sidebar.expander("🩺 Diagnostica"):
+    st.checkbox(
+        "Misura la memoria per fase",
+        key="diagnostica_memoria",
+        help="Usa tracemalloc: rallenta sensibilmente l'aggiornamento"
+    )
+    st.caption(f"Ultimo aggiornamento: {diagnostica.totale:.2f} s")
+    st.dataframe(
+        diagnostica.tabella().style.format({"secondi": "{:.3f}", "picco_mb": "{:.1f}", "quota %": "{:.1f}"}),
+        use_container_width=True
+    )
+
+    st.button(
+        "🔬 Profila un aggiornamento",
+        help="Riesegue la pagina registrando il profilo completo con " + ("pyinstrument" if HA_PYINSTRUMENT else "cProfile"),
+        on_click=lambda: st.session_state.update(profila_prossimo=True)
+    )
+    if profilo is not None:
+        st.session_state["profilo"] = (profilo.testo(), *profilo.file())
+    if "profilo" in st.session_state:
+        testo_profilo, file_profilo, estensione_profilo, mime_profilo = st.session_state["profilo"]
+        st.code(testo_profilo, language=None)
+        st.download_button(
+            "💾 Scarica profilo",
+            data=file_profilo,
+            file_name=f"profilo.{estensione_profilo}",
+            mime=mime_profilo
+        )
+
+    if st.checkbox("Mostra storico delle metriche"):
+        storico = storico_metriche()
+        if storico.empty:
+            st.caption("Nessuna metrica registrata")
+        else:
+            st.dataframe(storico, use_container_width=True)
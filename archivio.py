@@ -0,0 +1,442 @@
+"""Archivio persistente dei piani e delle modifiche manuali (SQLite).
+
+Ogni versione del piano viene salvata una volta, riga per riga, nella tabella
+`operazioni`, che contiene il piano calcolato e non cambia più. Le modifiche
+sono separate per spazio di lavoro (un utente, o una scheda del browser): la
+tabella `modificate` contiene le righe che in quello spazio differiscono dal
+piano (modifiche manuali e spostamenti a cascata), `modifiche` se la modifica
+è manuale e se la riga è stata eliminata. Alla riapertura della pagina le
+modifiche manuali dello spazio vengono riapplicate; le modifiche di uno
+spazio non toccate da `GIORNI_MODIFICHE` giorni vengono eliminate.
+
+Liste di lavoro, ritardi e finestre del Gantt si leggono con query su
+intervalli servite dagli indici su macchina, inizio, commessa e codice
+pezzo: il piano con sopra le righe modificate dello spazio. Le date sono
+salvate come millisecondi dall'epoca; i codici come testo, riportati in
+lettura al tipo che hanno nel piano (codici numerici restano numeri).
+"""
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from caricamento import CARTELLA_CACHE
+
+FILE_ARCHIVIO = Path(os.environ.get("PIANIFICAZIONE_ARCHIVIO", CARTELLA_CACHE.parent / "piani.sqlite"))
+MAX_PIANI_ARCHIVIATI = 50  # piani senza modifiche conservati, i più recenti
+GIORNI_MODIFICHE = 90  # modifiche di uno spazio conservate dall'ultimo salvataggio
+VERSIONE_SCHEMA = 3
+
+# colonna del piano -> colonna SQL
+COLONNE_SQL = {
+    "Commessa": "commessa",
+    "Codice pezzo": "codice_pezzo",
+    "Operazione": "operazione",
+    "Macchina": "macchina",
+    "Priorità": "priorita",
+    "Inizio": "inizio",
+    "Fine": "fine",
+    "Data richiesta": "data_richiesta",
+    "Ritardo (giorni)": "ritardo_giorni",
+    "In ritardo": "in_ritardo",
+}
+COLONNE_DATA = ("Inizio", "Fine", "Data richiesta")
+COLONNE_CODICE = ("Commessa", "Codice pezzo", "Operazione", "Macchina")
+RAGGRUPPAMENTI = ("Commessa", "Codice pezzo", "Macchina")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS piani (
+    versione TEXT PRIMARY KEY,
+    creato_il TEXT NOT NULL,
+    sorgente TEXT,
+    operazioni INTEGER NOT NULL,
+    inizio TEXT,
+    tipi TEXT
+);
+CREATE TABLE IF NOT EXISTS operazioni (
+    versione TEXT NOT NULL,
+    riga INTEGER NOT NULL,
+    commessa TEXT,
+    codice_pezzo TEXT,
+    operazione TEXT,
+    macchina TEXT,
+    priorita REAL,
+    inizio INTEGER,
+    fine INTEGER,
+    data_richiesta INTEGER,
+    ritardo_giorni INTEGER,
+    in_ritardo INTEGER,
+    PRIMARY KEY (versione, riga)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS operazioni_macchina ON operazioni (versione, macchina, inizio);
+CREATE INDEX IF NOT EXISTS operazioni_inizio ON operazioni (versione, inizio);
+CREATE INDEX IF NOT EXISTS operazioni_commessa ON operazioni (versione, commessa);
+CREATE INDEX IF NOT EXISTS operazioni_codice ON operazioni (versione, codice_pezzo);
+CREATE INDEX IF NOT EXISTS operazioni_in_ritardo ON operazioni (versione, ritardo_giorni) WHERE in_ritardo = 1;
+CREATE TABLE IF NOT EXISTS modificate (
+    versione TEXT NOT NULL,
+    spazio TEXT NOT NULL,
+    riga INTEGER NOT NULL,
+    commessa TEXT,
+    codice_pezzo TEXT,
+    operazione TEXT,
+    macchina TEXT,
+    priorita REAL,
+    inizio INTEGER,
+    fine INTEGER,
+    data_richiesta INTEGER,
+    ritardo_giorni INTEGER,
+    in_ritardo INTEGER,
+    PRIMARY KEY (versione, spazio, riga)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS modifiche (
+    versione TEXT NOT NULL,
+    spazio TEXT NOT NULL,
+    riga INTEGER NOT NULL,
+    manuale INTEGER NOT NULL,
+    eliminata INTEGER NOT NULL DEFAULT 0,
+    modificata_il TEXT NOT NULL,
+    PRIMARY KEY (versione, spazio, riga)
+) WITHOUT ROWID;
+"""
+_COLONNE = ", ".join(COLONNE_SQL.values())
+
+_archivi = {}
+_archivi_lock = threading.Lock()
+
+
+def _a_millisecondi(date):
+    date = pd.to_datetime(pd.Series(date))
+    valori = date.to_numpy(dtype="datetime64[ms]").astype(np.int64).astype(object)
+    valori[date.isna().to_numpy()] = None
+    return valori
+
+
+def _record(chiave, gantt_df):
+    """Tuple da inserire per le righe di `gantt_df`, precedute da `chiave` (versione o versione e spazio)."""
+    colonne = []
+    for col in COLONNE_SQL:
+        valori = gantt_df[col] if col in gantt_df.columns else pd.Series(None, index=gantt_df.index)
+        if col in COLONNE_DATA:
+            colonne.append(_a_millisecondi(valori))
+        elif col == "In ritardo":
+            colonne.append([None if pd.isna(v) else int(bool(v)) for v in valori])
+        elif col == "Ritardo (giorni)":
+            colonne.append([None if pd.isna(v) else int(v) for v in valori])
+        elif col == "Priorità":
+            colonne.append([None if pd.isna(v) else float(v) for v in valori])
+        else:
+            colonne.append([None if pd.isna(v) else str(v) for v in valori])
+    return list(zip(*([valore] * len(gantt_df) for valore in chiave), map(int, gantt_df.index), *colonne))
+
+
+def _tipi_codici(gantt_df):
+    tipi = {}
+    for col in COLONNE_CODICE:
+        if col in gantt_df.columns:
+            tipo = gantt_df[col].dtype
+            if isinstance(tipo, pd.CategoricalDtype):
+                tipo = tipo.categories.dtype
+            if pd.api.types.is_numeric_dtype(tipo) and not pd.api.types.is_bool_dtype(tipo):
+                tipi[col] = str(tipo)
+    return tipi
+
+
+def _al_tipo(valori, tipo):
+    try:
+        return valori.astype(tipo)
+    except (ValueError, TypeError):
+        # Ad esempio un codice reso testuale da una modifica manuale
+        return valori
+
+
+def _righe_diverse(piano_df, modificato_df):
+    """Etichette comuni ai due piani con almeno un valore diverso."""
+    comuni = modificato_df.index.intersection(piano_df.index)
+    colonne = [c for c in COLONNE_SQL if c in piano_df.columns and c in modificato_df.columns]
+    a = piano_df.loc[comuni, colonne]
+    b = modificato_df.loc[comuni, colonne]
+    uguali = (a == b) | (a.isna() & b.isna())
+    return comuni[~uguali.all(axis=1).to_numpy()]
+
+
+class ArchivioPiani:
+    """Archivio SQLite condiviso tra le sessioni (una connessione protetta da lock)."""
+
+    def __init__(self, percorso=FILE_ARCHIVIO, max_piani=MAX_PIANI_ARCHIVIATI, giorni_modifiche=GIORNI_MODIFICHE):
+        self.percorso = Path(percorso)
+        self.max_piani = max_piani
+        self.giorni_modifiche = giorni_modifiche
+        self.percorso.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.percorso, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        schema = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if schema < 2:
+            # Schema 1: modifiche non separate per spazio e scritte sopra il piano, versioni legate al giorno
+            self._db.executescript("DROP TABLE IF EXISTS modifiche; DROP TABLE IF EXISTS operazioni; DROP TABLE IF EXISTS piani;")
+        elif schema == 2:
+            self._db.execute("ALTER TABLE piani ADD COLUMN tipi TEXT")
+        self._db.executescript(SCHEMA)
+        self._db.execute(f"PRAGMA user_version = {VERSIONE_SCHEMA}")
+        self._lock = threading.RLock()
+        self._firme = {}  # (versione, spazio) -> firma delle ultime modifiche salvate
+        self._tipi = {}  # versione -> tipo numerico dei codici nel piano
+
+    def salva_piano(self, versione, gantt_df, sorgente=None, inizio=None):
+        """Salva il piano calcolato dal giorno `inizio` se la versione non è già in archivio; True se salvato ora."""
+        with self._lock, self._db:
+            if self._db.execute("SELECT 1 FROM piani WHERE versione = ?", (versione,)).fetchone():
+                return False
+            self._db.execute(
+                "INSERT INTO piani VALUES (?, ?, ?, ?, ?, ?)",
+                (versione, datetime.now().isoformat(timespec="seconds"), sorgente, len(gantt_df),
+                 inizio.isoformat() if inizio is not None else None, json.dumps(_tipi_codici(gantt_df))),
+            )
+            self._db.executemany(
+                f"INSERT INTO operazioni VALUES ({', '.join('?' * (len(COLONNE_SQL) + 2))})",
+                _record((versione,), gantt_df),
+            )
+            self._elimina_vecchi()
+        return True
+
+    def inizio_piano(self, versione):
+        """Giorno da cui è stato calcolato il piano archiviato, o None se la versione non c'è."""
+        with self._lock:
+            riga = self._db.execute("SELECT inizio FROM piani WHERE versione = ?", (versione,)).fetchone()
+        return date.fromisoformat(riga[0]) if riga and riga[0] else None
+
+    def elimina_piano(self, versione):
+        """Toglie dall'archivio il piano e le modifiche di tutti gli spazi."""
+        with self._lock, self._db:
+            for tabella in ("modificate", "modifiche", "operazioni", "piani"):
+                self._db.execute(f"DELETE FROM {tabella} WHERE versione = ?", (versione,))
+        self._firme = {k: v for k, v in self._firme.items() if k[0] != versione}
+        self._tipi.pop(versione, None)
+
+    def _tipi_codici(self, versione):
+        """Colonne codice numeriche del piano archiviato, col loro tipo (le altre sono testo)."""
+        if versione not in self._tipi:
+            with self._lock:
+                riga = self._db.execute("SELECT tipi FROM piani WHERE versione = ?", (versione,)).fetchone()
+            if riga is None:
+                return {}
+            self._tipi[versione] = json.loads(riga[0] or "{}")
+        return self._tipi[versione]
+
+    def _codici(self, versione, df, colonne=COLONNE_CODICE):
+        """Riporta le colonne codice lette dall'archivio (testo) al tipo che hanno nel piano."""
+        for col, tipo in self._tipi_codici(versione).items():
+            if col in colonne and col in df.columns:
+                df[col] = _al_tipo(df[col], tipo)
+        return df
+
+    def _elimina_vecchi(self):
+        limite = (datetime.now() - timedelta(days=self.giorni_modifiche)).isoformat(timespec="seconds")
+        scadute = self._db.execute(
+            "SELECT versione, spazio FROM modifiche GROUP BY versione, spazio HAVING MAX(modificata_il) < ?",
+            (limite,),
+        ).fetchall()
+        for tabella in ("modificate", "modifiche"):
+            self._db.executemany(f"DELETE FROM {tabella} WHERE versione = ? AND spazio = ?", scadute)
+
+        vecchi = [v for (v,) in self._db.execute(
+            """SELECT versione FROM piani
+               WHERE versione NOT IN (SELECT DISTINCT versione FROM modifiche)
+               ORDER BY creato_il DESC LIMIT -1 OFFSET ?""",
+            (self.max_piani,),
+        )]
+        for versione in vecchi:
+            self._db.execute("DELETE FROM operazioni WHERE versione = ?", (versione,))
+            self._db.execute("DELETE FROM piani WHERE versione = ?", (versione,))
+
+    def _correnti(self, versione, spazio, condizioni=(), parametri=()):
+        """SELECT (e parametri) delle righe correnti che soddisfano `condizioni`.
+
+        Senza `spazio` è il piano calcolato; con uno spazio, il piano meno le
+        righe modificate o eliminate nello spazio, più le righe modificate.
+        """
+        filtro = "".join(f" AND {c}" for c in condizioni)
+        if spazio is None:
+            return f"SELECT riga, {_COLONNE} FROM operazioni WHERE versione = ?{filtro}", [versione, *parametri]
+        sql = f"""SELECT riga, {_COLONNE} FROM operazioni o WHERE versione = ?{filtro} AND NOT EXISTS (
+                      SELECT 1 FROM modifiche m WHERE m.versione = o.versione AND m.spazio = ? AND m.riga = o.riga)
+                  UNION ALL
+                  SELECT riga, {_COLONNE} FROM modificate WHERE versione = ? AND spazio = ?{filtro}"""
+        return sql, [versione, *parametri, spazio, versione, spazio, *parametri]
+
+    def applica_modifiche(self, versione, spazio, gantt_df):
+        """Piano con le modifiche manuali salvate nello spazio riapplicate, e le etichette delle righe modificate a mano."""
+        with self._lock:
+            modifiche = self._db.execute(
+                """SELECT riga, eliminata FROM modifiche
+                   WHERE versione = ? AND spazio = ? AND (manuale = 1 OR eliminata = 1)""",
+                (versione, spazio),
+            ).fetchall()
+        manuali = [riga for riga, eliminata in modifiche if not eliminata]
+        eliminate = [riga for riga, eliminata in modifiche if eliminata]
+        risultato = gantt_df.drop(index=[r for r in eliminate if r in gantt_df.index])
+        if manuali:
+            salvate = self.operazioni(versione, spazio, righe=manuali)
+            salvate = salvate[[c for c in risultato.columns if c in salvate.columns]]
+            esistenti = salvate.index.intersection(risultato.index)
+            risultato = risultato.copy()
+            for col in salvate.columns:
+                # I codici tornano dall'archivio come testo: si riportano al tipo del piano
+                # (le colonne categoriche diventano semplici, una modifica può introdurre un valore nuovo)
+                if isinstance(risultato[col].dtype, pd.CategoricalDtype):
+                    risultato[col] = risultato[col].astype(risultato[col].dtype.categories.dtype)
+                if salvate[col].dtype != risultato[col].dtype:
+                    try:
+                        salvate[col] = salvate[col].astype(risultato[col].dtype)
+                    except (ValueError, TypeError):
+                        risultato[col] = risultato[col].astype(object)
+                risultato.loc[esistenti, col] = salvate.loc[esistenti, col].to_numpy()
+            nuove = salvate.index.difference(risultato.index)
+            if len(nuove):
+                risultato = pd.concat([risultato, salvate.loc[nuove]])
+        return risultato, set(manuali)
+
+    def salva_modifiche(self, versione, spazio, piano_df, modificato_df, manuali=()):
+        """Sostituisce le modifiche dello spazio con quelle del piano modificato.
+
+        `piano_df` è il piano calcolato, `modificato_df` quello attuale dello
+        spazio e `manuali` le etichette modificate a mano (le altre righe
+        diverse sono spostamenti a cascata). Gli altri spazi non vengono
+        toccati. Restituisce il numero di righe scritte.
+        """
+        diverse = _righe_diverse(piano_df, modificato_df)
+        aggiunte = modificato_df.index.difference(piano_df.index)
+        eliminate = piano_df.index.difference(modificato_df.index)
+        cambiate = diverse.union(aggiunte)
+        manuali = set(manuali) | set(aggiunte)
+
+        h = hashlib.sha1(repr((sorted(manuali & set(cambiate)), list(eliminate))).encode())
+        if len(cambiate):
+            righe = modificato_df.loc[cambiate, [c for c in COLONNE_SQL if c in modificato_df.columns]]
+            h.update(pd.util.hash_pandas_object(righe.astype(str)).to_numpy().tobytes())
+        firma = h.hexdigest()
+        if self._firme.get((versione, spazio)) == firma:
+            return 0
+
+        ora = datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._db:
+            for tabella in ("modificate", "modifiche"):
+                self._db.execute(f"DELETE FROM {tabella} WHERE versione = ? AND spazio = ?", (versione, spazio))
+            self._db.executemany(
+                f"INSERT INTO modificate VALUES ({', '.join('?' * (len(COLONNE_SQL) + 3))})",
+                _record((versione, spazio), modificato_df.loc[cambiate]),
+            )
+            self._db.executemany(
+                "INSERT INTO modifiche VALUES (?, ?, ?, ?, ?, ?)",
+                [(versione, spazio, int(r), int(r in manuali), 0, ora) for r in cambiate]
+                + [(versione, spazio, int(r), 1, 1, ora) for r in eliminate],
+            )
+        self._firme[(versione, spazio)] = firma
+        return len(cambiate) + len(eliminate)
+
+    def operazioni(self, versione, spazio=None, macchine=None, inizio=None, fine=None, commesse=None, codici=None,
+                   righe=None, solo_in_ritardo=False, ordina="inizio"):
+        """Operazioni correnti del piano nello `spazio` che soddisfano i filtri, indicizzate per riga.
+
+        Senza `spazio` si legge il piano calcolato. `inizio` e `fine`
+        selezionano le operazioni che si sovrappongono alla finestra;
+        `ordina` è "inizio" oppure "ritardo" (decrescente).
+        """
+        condizioni = []
+        parametri = []
+        for colonna, valori in (("macchina", macchine), ("commessa", commesse), ("codice_pezzo", codici),
+                                ("riga", righe)):
+            if valori is not None:
+                valori = list(valori)
+                condizioni.append(f"{colonna} IN ({', '.join('?' * len(valori))})")
+                parametri.extend(int(v) if colonna == "riga" else str(v) for v in valori)
+        if inizio is not None:
+            condizioni.append("fine >= ?")
+            parametri.append(int(_a_millisecondi([inizio])[0]))
+        if fine is not None:
+            condizioni.append("inizio <= ?")
+            parametri.append(int(_a_millisecondi([fine])[0]))
+        if solo_in_ritardo:
+            condizioni.append("in_ritardo = 1")
+        ordine = {"inizio": "inizio, riga", "ritardo": "ritardo_giorni DESC, riga"}[ordina]
+
+        sql, parametri = self._correnti(versione, spazio, condizioni, parametri)
+        with self._lock:
+            dati = self._db.execute(f"{sql} ORDER BY {ordine}", parametri).fetchall()
+        df = pd.DataFrame.from_records(dati, columns=["riga", *COLONNE_SQL]).set_index("riga")
+        df.index.name = None
+        for col in COLONNE_DATA:
+            df[col] = pd.to_datetime(df[col].astype("float64"), unit="ms")
+        df["Priorità"] = df["Priorità"].astype("float64")
+        df["In ritardo"] = df["In ritardo"].fillna(0).astype(bool)
+        return self._codici(versione, df)
+
+    def riepilogo_ritardi(self, versione, per, spazio=None):
+        """Come `ritardi.riepilogo_ritardi`, calcolato dall'archivio con un GROUP BY."""
+        if per not in RAGGRUPPAMENTI:
+            raise ValueError(f"Raggruppamento non supportato: {per}")
+        colonna = COLONNE_SQL[per]
+        sql, parametri = self._correnti(versione, spazio, [f"{colonna} IS NOT NULL"])
+        with self._lock:
+            dati = self._db.execute(
+                f"""SELECT {colonna}, COUNT(*), SUM(in_ritardo),
+                           COALESCE(AVG(CASE WHEN in_ritardo = 1 THEN ritardo_giorni END), 0),
+                           MAX(ritardo_giorni)
+                    FROM ({sql}) GROUP BY {colonna} ORDER BY {colonna}""",
+                parametri,
+            ).fetchall()
+        riepilogo = self._codici(versione, pd.DataFrame.from_records(dati, columns=[
+            per, "Operazioni", "In ritardo", "Ritardo medio (giorni)", "Ritardo massimo (giorni)",
+        ]))
+        # Ordinati come nel piano: i codici numerici per valore, non come testo
+        return riepilogo.set_index(per).sort_index(kind="stable")
+
+    def periodi_macchine(self, versione, macchine=None, spazio=None):
+        """Primo inizio e ultima fine di ogni macchina (colonne `inizio` e `fine`)."""
+        condizioni, parametri = [], []
+        if macchine is not None:
+            macchine = list(macchine)
+            condizioni.append(f"macchina IN ({', '.join('?' * len(macchine))})")
+            parametri.extend(map(str, macchine))
+        sql, parametri = self._correnti(versione, spazio, condizioni, parametri)
+        with self._lock:
+            dati = self._db.execute(
+                f"SELECT macchina, MIN(inizio), MAX(fine) FROM ({sql}) GROUP BY macchina", parametri
+            ).fetchall()
+        df = self._codici(versione, pd.DataFrame.from_records(dati, columns=["Macchina", "inizio", "fine"]))
+        df = df.set_index("Macchina")
+        for col in ("inizio", "fine"):
+            df[col] = pd.to_datetime(df[col].astype("float64"), unit="ms")
+        return df
+
+    def versioni(self):
+        """Piani in archivio, dal più recente, con gli spazi che li modificano e le righe modificate."""
+        with self._lock:
+            return pd.read_sql_query(
+                """SELECT p.versione, p.creato_il, p.sorgente, p.operazioni, p.inizio,
+                          COUNT(DISTINCT m.spazio) AS spazi, COUNT(m.riga) AS modifiche
+                   FROM piani p LEFT JOIN modifiche m ON m.versione = p.versione
+                   GROUP BY p.versione ORDER BY p.creato_il DESC""",
+                self._db,
+            )
+
+    def chiudi(self):
+        with self._lock:
+            self._db.close()
+
+
+def archivio_piani(percorso=FILE_ARCHIVIO):
+    """Archivio condiviso (uno per file) tra tutte le sessioni del processo."""
+    percorso = Path(percorso)
+    with _archivi_lock:
+        archivio = _archivi.get(percorso)
+        if archivio is None:
+            archivio = _archivi[percorso] = ArchivioPiani(percorso)
+        return archivio
@@ -0,0 +1,308 @@
+"""Benchmark della pipeline di pianificazione su ordini sintetici.
+
+Esempi:
+
+    python benchmark.py --dimensioni 100 1000 10000 100000 --out risultati.json
+    python benchmark.py --dimensioni 1000000 --macchine 60 --no-excel
+    python benchmark.py --dimensioni 1000 10000 --confronta risultati_precedenti.json
+    python benchmark.py --dimensioni 1000 100000 --reparti 4 --verifica
+
+Per ogni dimensione genera un file ordini riproducibile (stesso seme, stessi
+dati) e misura separatamente ogni fase: lettura Excel, preparazione, grafo
+delle dipendenze, calcolo dei tempi, conversione in date, ritardi, Gantt ed
+esportazioni. Per ogni fase registra i secondi e il picco di memoria
+(tracemalloc, in una seconda passata per non falsare i tempi) e salva tutto
+in JSON, per confrontare commit diversi.
+
+Con `--verifica` controlla anche che le scorciatoie del calcolo dei tempi
+diano esattamente il risultato del ciclo riga per riga: code indipendenti
+calcolate in blocco contro il solo ciclo, componenti in parallelo (forzate
+anche sotto la soglia) contro il calcolo in un solo processo.
+"""
+import argparse
+from datetime import date, datetime
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from calendario import WorkCalendar
+from caricamento import HA_PYARROW, leggi_ordini
+from dipendenze import GrafoDipendenze
+from esportazione import csv_bytes, excel_bytes, parquet_bytes
+from gantt import figura_gantt
+from partizione import calcola_tempi_parallelo, componenti
+from pianificatore import Scheduler, gantt_da_tempi, prepara_dati
+from ritardi import aggiungi_ritardi
+
+OPERAZIONI = ["Tornitura", "Fresatura", "Foratura", "Rettifica", "Assemblaggio"]
+INIZIO = date(2026, 1, 5)
+MAX_EXCEL = 100_000  # oltre, lettura ed esportazione Excel sono saltate (lente e poco utili)
+
+
+def genera_ordini(operazioni, macchine=12, codici=None, frazione_dipendenze=0.3, lunghezza_catene=3,
+                  gruppi=1, commesse=None, seme=0, inizio=INIZIO, reparti=1):
+    """File ordini sintetico e gruppi di macchine esclusive, riproducibili dato il seme.
+
+    Ogni codice pezzo ha un ciclo di almeno un'operazione (in media
+    `operazioni / codici`); una frazione dei codici dipende da uno dei
+    `lunghezza_catene` codici precedenti (catene di dipendenze). I gruppi sono coppie di macchine
+    consecutive. Le date richieste cadono tra 1 e 26 settimane da `inizio`.
+    Con `reparti` > 1 macchine e codici sono divisi in reparti (blocchi di
+    macchine consecutive) senza operazioni né dipendenze in comune.
+    """
+    reparti = max(1, min(reparti, macchine))
+    per_reparto = macchine // reparti
+    rng = np.random.default_rng(seme)
+    codici = codici or max(1, operazioni // 3)
+    commesse = commesse or max(1, codici // 20)
+    nomi_macchine = np.array([f"M{m:02d}" for m in range(macchine)])
+
+    # Assegna le operazioni ai codici: ogni codice ne ha almeno una
+    codice = np.sort(np.concatenate([
+        np.arange(min(codici, operazioni)),
+        rng.integers(0, codici, max(0, operazioni - codici)),
+    ]))
+    fase = np.arange(operazioni) - np.searchsorted(codice, codice)
+
+    dipende = rng.random(codici) < frazione_dipendenze
+    salto = rng.integers(1, lunghezza_catene + 1, codici)
+    dipendenza_codice = np.arange(codici) - salto * reparti  # stesso reparto (codice % reparti)
+    dipende &= dipendenza_codice >= 0
+    nomi_codici = np.char.add("P", np.char.zfill(np.arange(codici).astype(str), 6))
+    dipendenza = np.where(dipende, nomi_codici[np.maximum(dipendenza_codice, 0)], "")
+
+    priorita_codice = rng.choice([1, 2, 3, 4, 5, 6, 7, 8, 9], codici,
+                                 p=[.05, .1, .15, .2, .2, .12, .1, .05, .03])
+    richiesta_codice = pd.Timestamp(inizio) + pd.to_timedelta(rng.integers(7, 183, codici), unit="D")
+    commessa_codice = np.char.add("C", rng.integers(0, commesse, codici).astype(str))
+
+    df = pd.DataFrame({
+        "Commessa": commessa_codice[codice],
+        "Codice pezzo": nomi_codici[codice],
+        "Operazione": np.array(OPERAZIONI)[np.minimum(fase, len(OPERAZIONI) - 1)],
+        "Macchina": nomi_macchine[rng.integers(0, per_reparto, operazioni) + codice % reparti * per_reparto],
+        "Quantità": rng.integers(1, 200, operazioni),
+        "Tempo unitario (h)": np.round(rng.gamma(2.0, 0.05, operazioni), 3),
+        "Setup (h)": np.round(rng.choice([0, 0.5, 1, 2, 3], operazioni), 1),
+        "Data richiesta": richiesta_codice[codice],
+        "Dipendenza": dipendenza[codice],
+        "Priorità": priorita_codice[codice],
+    })
+    gruppi_macchine = [
+        {"nome": f"Gruppo{g}", "macchine": [str(nomi_macchine[2 * g]), str(nomi_macchine[2 * g + 1])]}
+        for g in range(min(gruppi, macchine // 2))
+    ]
+    return df, gruppi_macchine
+
+
+class Misure:
+    """Tempo e picco di memoria di ogni fase, in ordine di esecuzione."""
+
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.fasi = {}
+
+    def misura(self, nome, funzione, *args):
+        gc.collect()
+        if self.memoria:
+            tracemalloc.start()
+        t = time.perf_counter()
+        risultato = funzione(*args)
+        secondi = time.perf_counter() - t
+        fase = {"secondi": round(secondi, 4)}
+        if self.memoria:
+            fase["picco_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+        self.fasi[nome] = fase
+        return risultato
+
+    def salta(self, nome, motivo):
+        self.fasi[nome] = {"saltata": motivo}
+
+
+def verifica_tempi(scheduler, ordine, grafo, operazioni, inizio_ore, processi=None):
+    """Confronta le scorciatoie del calcolo dei tempi con il calcolo di riferimento.
+
+    Restituisce, per ogni confronto, se i tempi coincidono esattamente e la
+    differenza massima in ore, più il numero di operazioni calcolate in
+    blocco e di componenti indipendenti.
+    """
+    def confronto(tempi, riferimento):
+        differenza = max(
+            float(np.nanmax(np.abs(a - b), initial=0)) for a, b in zip(tempi, riferimento)
+        )
+        uguali = all(np.array_equal(a, b, equal_nan=True) for a, b in zip(tempi, riferimento))
+        return {"uguali": uguali, "differenza_max_ore": differenza}
+
+    righe = scheduler.calcola_tempi(ordine, grafo, operazioni, inizio_ore, in_blocco=False)
+    seriale = scheduler.calcola_tempi(ordine, grafo, operazioni, inizio_ore)
+    parallelo = calcola_tempi_parallelo(
+        scheduler, ordine, grafo, operazioni, inizio_ore, max(2, processi or 0), minimo=0
+    )
+    return {
+        "in_blocco": int(sum(len(p) for _, p in scheduler.code_indipendenti(ordine, grafo, operazioni))),
+        "componenti": int(componenti(operazioni, grafo).max(initial=-1) + 1),
+        "blocco_vs_righe": confronto(seriale, righe),
+        "parallelo_vs_seriale": confronto(parallelo, seriale),
+    }
+
+
+def esegui(operazioni, args, memoria=False):
+    """Misura tutte le fasi della pipeline per un file di `operazioni` righe."""
+    misure = Misure(memoria)
+    df, gruppi = misure.misura(
+        "generazione", genera_ordini, operazioni, args.macchine, None, args.dipendenze,
+        args.catene, args.gruppi, None, args.seme, INIZIO, args.reparti,
+    )
+    cal = WorkCalendar()
+    excel = not args.no_excel and operazioni <= args.max_excel
+
+    if excel:
+        contenuto = misure.misura("scrittura_ordini", excel_bytes, {"Ordini": df})
+        df = misure.misura("lettura", leggi_ordini, contenuto, None, None)
+    else:
+        misure.salta("lettura", f"oltre {args.max_excel} operazioni o --no-excel")
+
+    scheduler = Scheduler(cal, gruppi)
+    df = misure.misura("preparazione", prepara_dati, df)
+    grafo = misure.misura("grafo_dipendenze", GrafoDipendenze, df)
+    ordine = misure.misura("ordine_topologico", grafo.ordine_topologico)
+    compatte = scheduler.operazioni(df)
+    inizio_ore = cal.a_ore(cal.inizio_pianificazione(INIZIO))
+    inizi_ore, fini_ore = misure.misura(
+        "calcolo_tempi", calcola_tempi_parallelo, scheduler, ordine, grafo, compatte, inizio_ore, args.processi
+    )
+
+    def in_date():
+        inizi = cal.date_da_ore(inizi_ore)
+        fini = np.where(fini_ore > inizi_ore, cal.date_da_ore(fini_ore, fine=True), inizi)
+        return gantt_da_tempi(df, inizi, fini)
+
+    gantt_df = misure.misura("conversione_date", in_date)
+    gantt_df = misure.misura("ritardi", aggiungi_ritardi, gantt_df, cal)
+    misure.misura("gantt", lambda: figura_gantt(gantt_df, cal).to_json())
+
+    if excel:
+        misure.misura("esportazione_excel", excel_bytes, {"Pianificazione": gantt_df})
+    else:
+        misure.salta("esportazione_excel", f"oltre {args.max_excel} operazioni o --no-excel")
+    misure.misura("esportazione_csv", csv_bytes, gantt_df)
+    if HA_PYARROW:
+        misure.misura("esportazione_parquet", parquet_bytes, gantt_df)
+    else:
+        misure.salta("esportazione_parquet", "pyarrow non installato")
+
+    risultato = {
+        "operazioni": operazioni,
+        "archi_dipendenze": grafo.archi,
+        "macchine": args.macchine,
+        "secondi_totali": round(sum(f.get("secondi", 0) for f in misure.fasi.values()), 4),
+        "fasi": misure.fasi,
+    }
+    if args.verifica and not memoria:
+        risultato["verifica"] = verifica_tempi(scheduler, ordine, grafo, compatte, inizio_ore, args.processi)
+    return risultato
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def confronta(attuali, precedenti):
+    """Stampa il rapporto attuale/precedente dei tempi per fase, per le dimensioni in comune."""
+    per_dimensione = {r["operazioni"]: r for r in precedenti["risultati"]}
+    print(f"\nConfronto con {precedenti.get('commit') or 'risultati precedenti'} (attuale / precedente):")
+    for risultato in attuali["risultati"]:
+        vecchio = per_dimensione.get(risultato["operazioni"])
+        if vecchio is None:
+            continue
+        print(f"  {risultato['operazioni']:>9} operazioni")
+        for fase, misura in risultato["fasi"].items():
+            prima = vecchio["fasi"].get(fase, {}).get("secondi")
+            if "secondi" in misura and prima:
+                rapporto = misura["secondi"] / prima
+                segno = "  ⚠️" if rapporto > 1.2 else ""
+                print(f"    {fase:<22} {misura['secondi']:>9.3f}s  ×{rapporto:.2f}{segno}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark della pipeline di pianificazione")
+    p.add_argument("--dimensioni", type=int, nargs="+", default=[100, 1_000, 10_000],
+                   help="numero di operazioni da generare (da 100 a 1.000.000)")
+    p.add_argument("--macchine", type=int, default=12)
+    p.add_argument("--gruppi", type=int, default=1, help="gruppi di macchine esclusive (coppie)")
+    p.add_argument("--dipendenze", type=float, default=0.3, help="frazione di codici con dipendenza")
+    p.add_argument("--catene", type=int, default=3, help="distanza massima della dipendenza tra codici")
+    p.add_argument("--reparti", type=int, default=1, help="reparti indipendenti (componenti per il calcolo parallelo)")
+    p.add_argument("--seme", type=int, default=0)
+    p.add_argument("--processi", type=int, help="processi per le componenti indipendenti (default: numero di CPU)")
+    p.add_argument("--max-excel", type=int, default=MAX_EXCEL)
+    p.add_argument("--no-excel", action="store_true", help="salta lettura ed esportazione Excel")
+    p.add_argument("--no-memoria", action="store_true", help="non misurare la memoria (tempi più fedeli)")
+    p.add_argument("--out", help="file JSON dei risultati")
+    p.add_argument("--confronta", help="file JSON di un'esecuzione precedente")
+    p.add_argument("--verifica", action="store_true",
+                   help="controlla che blocchi e parallelo diano gli stessi tempi del ciclo riga per riga")
+    args = p.parse_args(argv)
+
+    risultati = {
+        "commit": _commit(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "piattaforma": platform.platform(),
+        "parametri": {k: v for k, v in vars(args).items() if k not in ("out", "confronta")},
+        "risultati": [],
+    }
+    for operazioni in args.dimensioni:
+        risultato = esegui(operazioni, args)
+        if not args.no_memoria:
+            # tracemalloc rallenta molto: la memoria si misura in una seconda passata
+            for fase, misura in esegui(operazioni, args, memoria=True)["fasi"].items():
+                if "picco_mb" in misura:
+                    risultato["fasi"][fase]["picco_mb"] = misura["picco_mb"]
+        risultati["risultati"].append(risultato)
+        print(f"{operazioni:>9} operazioni, {risultato['archi_dipendenze']} archi: {risultato['secondi_totali']:.2f}s")
+        for fase, misura in risultato["fasi"].items():
+            if "saltata" in misura:
+                print(f"    {fase:<22} saltata ({misura['saltata']})")
+            else:
+                memoria = f"  {misura['picco_mb']:>9.1f} MB" if "picco_mb" in misura else ""
+                print(f"    {fase:<22} {misura['secondi']:>9.3f}s{memoria}")
+        if "verifica" in risultato:
+            verifica = risultato["verifica"]
+            print(f"    verifica ({verifica['in_blocco']} operazioni in blocco, {verifica['componenti']} componenti)")
+            for nome in ("blocco_vs_righe", "parallelo_vs_seriale"):
+                esito = verifica[nome]
+                stato = "ok" if esito["uguali"] else f"DIVERSI (fino a {esito['differenza_max_ore']:.6g} h)"
+                print(f"      {nome:<20} {stato}")
+        sys.stdout.flush()
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(risultati, f, indent=2, ensure_ascii=False)
+    if args.confronta:
+        with open(args.confronta, encoding="utf-8") as f:
+            confronta(risultati, json.load(f))
+    if any(
+        not esito["uguali"]
+        for r in risultati["risultati"] for nome, esito in r.get("verifica", {}).items() if isinstance(esito, dict)
+    ):
+        sys.exit("Verifica non superata: i tempi calcolati differiscono dal riferimento")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Calendario di lavoro: turni giornalieri, giorni lavorativi e festività aziendali.
+
+Il tempo lavorativo viene misurato come offset cumulativo in ore a partire da
+un giorno lavorativo di riferimento. I giorni interi si contano con
+`numpy.busday_count`/`busday_offset`, le frazioni di giorno con una ricerca
+binaria sui turni: somma di ore e differenze costano O(1) (O(log turni)).
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date, time, timedelta
+import math
+
+import numpy as np
+
+TURNI_DEFAULT = ((time(8, 0), time(17, 0)),)
+SETTIMANA_DEFAULT = "1111100"  # lunedì-venerdì
+
+# Tolleranza per gli arrotondamenti in virgola mobile (circa 4 ms)
+_EPS = 1e-6
+
+
+def _ore_da_mezzanotte(t):
+    return t.hour + t.minute / 60 + t.second / 3600 + t.microsecond / 3_600_000_000
+
+
+def leggi_turni(testo):
+    """Converte un testo tipo "06:00-14:00, 14:00-22:00" in una tupla di turni."""
+    turni = []
+    for parte in testo.replace(";", ",").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        try:
+            inizio, fine = (datetime.strptime(x.strip(), "%H:%M").time() for x in parte.split("-"))
+        except ValueError:
+            raise ValueError(f"Turno non valido: '{parte}' (formato atteso HH:MM-HH:MM)")
+        turni.append((inizio, fine))
+    return tuple(turni)
+
+
+def leggi_festivi(testo):
+    """Converte un testo con una data per riga (GG/MM/AAAA) in una tupla di date."""
+    festivi = []
+    for riga in testo.replace(",", "\n").splitlines():
+        riga = riga.strip()
+        if not riga:
+            continue
+        try:
+            festivi.append(datetime.strptime(riga, "%d/%m/%Y").date())
+        except ValueError:
+            raise ValueError(f"Data festiva non valida: '{riga}' (formato atteso GG/MM/AAAA)")
+    return tuple(sorted(set(festivi)))
+
+
+class WorkCalendar:
+    """Calendario di lavoro precalcolato con turni multipli e festività.
+
+    `turni` è una sequenza di coppie (inizio, fine) nello stesso giorno, senza
+    sovrapposizioni; `festivi` le date non lavorative oltre al weekend;
+    `settimana` la maschera dei giorni lavorativi da lunedì a domenica.
+    """
+
+    def __init__(self, turni=TURNI_DEFAULT, festivi=(), settimana=SETTIMANA_DEFAULT):
+        turni = tuple(sorted((tuple(t) for t in turni), key=lambda t: t[0]))
+        if not turni:
+            raise ValueError("Il calendario deve avere almeno un turno")
+        for inizio, fine in turni:
+            if fine <= inizio:
+                raise ValueError(f"Turno {inizio:%H:%M}-{fine:%H:%M}: la fine deve seguire l'inizio")
+        for (_, fine), (inizio, _) in zip(turni, turni[1:]):
+            if inizio < fine:
+                raise ValueError("I turni non devono sovrapporsi")
+
+        self.turni = turni
+        self.festivi = tuple(sorted(set(festivi)))
+        self.settimana = settimana
+
+        self._busdaycal = np.busdaycalendar(weekmask=settimana, holidays=list(self.festivi))
+        self._inizi = [_ore_da_mezzanotte(i) for i, _ in turni]
+        self._fini = [_ore_da_mezzanotte(f) for _, f in turni]
+        durate = [f - i for i, f in zip(self._inizi, self._fini)]
+        self._cum_inizio = [sum(durate[:k]) for k in range(len(durate))]
+        self._cum_fine = [c + d for c, d in zip(self._cum_inizio, durate)]
+        self.ore_giornaliere = self._cum_fine[-1]
+        self._origine = np.busday_offset(
+            np.datetime64("2000-01-03", "D"), 0, roll="forward", busdaycal=self._busdaycal
+        )
+
+    # --- Identità: il calendario è un valore, usabile come chiave di cache ---
+    def _chiave(self):
+        return (self.turni, self.festivi, self.settimana)
+
+    def __eq__(self, other):
+        return isinstance(other, WorkCalendar) and self._chiave() == other._chiave()
+
+    def __hash__(self):
+        return hash(self._chiave())
+
+    def __reduce__(self):
+        return (WorkCalendar, self._chiave())
+
+    def __repr__(self):
+        turni = ", ".join(f"{i:%H:%M}-{f:%H:%M}" for i, f in self.turni)
+        return f"WorkCalendar(turni=[{turni}], festivi={len(self.festivi)}, settimana={self.settimana})"
+
+    def firma(self):
+        """Rappresentazione testuale stabile, per gli hash di versione."""
+        return repr(self._chiave())
+
+    @property
+    def busdaycal(self):
+        """`numpy.busdaycalendar` con weekend e festività, per i conteggi vettoriali."""
+        return self._busdaycal
+
+    @property
+    def inizio_giorno(self):
+        return self.turni[0][0]
+
+    @property
+    def fine_giorno(self):
+        return self.turni[-1][1]
+
+    def is_lavorativo(self, giorno):
+        return bool(np.is_busday(np.datetime64(giorno, "D"), busdaycal=self._busdaycal))
+
+    def giorni_lavorativi(self, da, a):
+        """Numero di giorni lavorativi in [da, a)."""
+        return int(np.busday_count(np.datetime64(da, "D"), np.datetime64(a, "D"), busdaycal=self._busdaycal))
+
+    # --- Conversione istante <-> ore lavorative cumulative ---
+    def a_ore(self, dt):
+        """Ore lavorative trascorse dall'origine del calendario fino a `dt`."""
+        giorno = np.datetime64(dt.date(), "D")
+        giorni = int(np.busday_count(self._origine, giorno, busdaycal=self._busdaycal))
+        ore = giorni * self.ore_giornaliere
+        if not np.is_busday(giorno, busdaycal=self._busdaycal):
+            return ore
+        x = _ore_da_mezzanotte(dt.time())
+        k = bisect_right(self._inizi, x) - 1
+        if k < 0:
+            return ore
+        return ore + self._cum_inizio[k] + min(x, self._fini[k]) - self._inizi[k]
+
+    def da_ore(self, ore, fine=False):
+        """Istante corrispondente a `ore` lavorative dall'origine.
+
+        Con `fine=True` un valore che cade esattamente sul cambio turno o di
+        giorno restituisce la fine del periodo precedente invece dell'inizio
+        del successivo (convenzione usata per le date di fine operazione).
+        """
+        n = math.floor(ore / self.ore_giornaliere)
+        resto = ore - n * self.ore_giornaliere
+        if resto < _EPS:
+            resto = 0.0
+        elif self.ore_giornaliere - resto < _EPS:
+            n, resto = n + 1, 0.0
+        if fine and resto == 0.0:
+            n, resto = n - 1, self.ore_giornaliere
+
+        giorno = np.busday_offset(self._origine, n, roll="forward", busdaycal=self._busdaycal)
+        if fine:
+            k = bisect_left(self._cum_fine, resto - _EPS)
+        else:
+            k = bisect_right(self._cum_fine, resto + _EPS)
+        ora = self._inizi[k] + resto - self._cum_inizio[k]
+        # Arrotondato al secondo per non propagare errori di virgola mobile
+        return datetime.combine(giorno.astype(date), time()) + timedelta(seconds=round(ora * 3600))
+
+    def ore_da_date(self, istanti):
+        """Come `a_ore`, ma su un array datetime64 (senza NaT)."""
+        istanti = np.asarray(istanti).astype("datetime64[ns]")
+        giorni = istanti.astype("datetime64[D]")
+        ore = np.busday_count(self._origine, giorni, busdaycal=self._busdaycal) * self.ore_giornaliere
+        x = (istanti - giorni) / np.timedelta64(1, "h")
+        k = np.searchsorted(self._inizi, x, side="right") - 1
+        nel_turno = np.is_busday(giorni, busdaycal=self._busdaycal) & (k >= 0)
+        k = np.maximum(k, 0)
+        fini = np.asarray(self._fini)[k]
+        trascorse = np.asarray(self._cum_inizio)[k] + np.minimum(x, fini) - np.asarray(self._inizi)[k]
+        return ore + np.where(nel_turno, trascorse, 0.0)
+
+    def date_giorni(self, indici):
+        """Date dei giorni lavorativi numero `indici` dall'origine (array datetime64[D])."""
+        return np.busday_offset(self._origine, np.asarray(indici, dtype=np.int64), roll="forward", busdaycal=self._busdaycal)
+
+    def ore_inizio_giorni(self, giorni):
+        """Ore lavorative dall'origine alla mezzanotte di ogni giorno di un array datetime64."""
+        giorni = np.asarray(giorni).astype("datetime64[D]")
+        return np.busday_count(self._origine, giorni, busdaycal=self._busdaycal) * self.ore_giornaliere
+
+    def date_da_ore(self, ore, fine=False):
+        """Come `da_ore`, ma su un array di ore: restituisce un array datetime64[ns]."""
+        ore = np.asarray(ore, dtype=np.float64)
+        n = np.floor(ore / self.ore_giornaliere)
+        resto = ore - n * self.ore_giornaliere
+        resto[resto < _EPS] = 0.0
+        cambio_giorno = self.ore_giornaliere - resto < _EPS
+        n[cambio_giorno] += 1
+        resto[cambio_giorno] = 0.0
+        if fine:
+            a_fine_giorno = resto == 0.0
+            n[a_fine_giorno] -= 1
+            resto[a_fine_giorno] = self.ore_giornaliere
+
+        giorni = np.busday_offset(self._origine, n.astype(np.int64), roll="forward", busdaycal=self._busdaycal)
+        if fine:
+            k = np.searchsorted(self._cum_fine, resto - _EPS, side="left")
+        else:
+            k = np.searchsorted(self._cum_fine, resto + _EPS, side="right")
+        ora = np.asarray(self._inizi)[k] + resto - np.asarray(self._cum_inizio)[k]
+        secondi = np.round(ora * 3600).astype(np.int64)
+        return giorni.astype("datetime64[ns]") + secondi.astype("timedelta64[s]")
+
+    # --- API usata dal pianificatore ---
+    def prossima_data_lavoro(self, dt):
+        """Sposta `dt` all'inizio del primo giorno lavorativo se cade in un giorno di chiusura."""
+        if self.is_lavorativo(dt.date()):
+            return dt
+        giorno = np.busday_offset(np.datetime64(dt.date(), "D"), 0, roll="forward", busdaycal=self._busdaycal)
+        return datetime.combine(giorno.astype(date), self.inizio_giorno)
+
+    def aggiungi_ore_lavoro(self, start_time, ore):
+        """Aggiunge ore lavorative rispettando turni, weekend e festività."""
+        if ore <= 0:
+            return start_time
+        return self.da_ore(self.a_ore(start_time) + ore, fine=True)
+
+    def ore_lavorative(self, inizio, fine):
+        """Ore lavorative comprese tra due istanti."""
+        return self.a_ore(fine) - self.a_ore(inizio)
+
+    def inizio_pianificazione(self, giorno=None):
+        """Istante da cui le macchine sono disponibili (default: oggi a inizio turno)."""
+        return self.prossima_data_lavoro(datetime.combine(giorno or date.today(), self.inizio_giorno))
@@ -0,0 +1,171 @@
+"""Lettura veloce del file ordini con cache colonnare su disco.
+
+Il contenuto del file viene identificato dal suo hash SHA-256: la prima
+lettura usa il motore più veloce disponibile (calamine se installato,
+altrimenti openpyxl in sola lettura), normalizza i tipi delle colonne e salva
+il risultato in Parquet (o pickle, segnalato nel log, se pyarrow non è
+installato o il Parquet non è scrivibile). Le letture successive dello stesso
+contenuto arrivano dalla memoria o dal disco.
+"""
+from collections import OrderedDict
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+from pathlib import Path
+import threading
+
+import pandas as pd
+
+from pianificatore import normalizza_colonne
+
+CARTELLA_CACHE = Path(
+    os.environ.get("PIANIFICAZIONE_CACHE", Path.home() / ".cache" / "pianificazione")
+) / "ordini"
+MAX_FILE_CACHE = 20
+MAX_IN_MEMORIA = 8
+
+COLONNE_CODICE = ["Commessa", "Codice pezzo", "Operazione", "Macchina", "Dipendenza"]
+
+HA_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+HA_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+log = logging.getLogger(__name__)
+if not HA_PYARROW:
+    log.warning("pyarrow non installato: cache degli ordini in pickle ed esportazione Parquet non disponibile")
+
+_in_memoria = OrderedDict()
+_lock = threading.Lock()
+
+
+def hash_contenuto(contenuto):
+    return hashlib.sha256(contenuto).hexdigest()
+
+
+def _leggi_openpyxl(contenuto):
+    """Legge il primo foglio in streaming (openpyxl read-only)."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(contenuto), read_only=True, data_only=True)
+    try:
+        righe = wb.worksheets[0].iter_rows(values_only=True)
+        intestazione = next(righe, None)
+        if intestazione is None:
+            return pd.DataFrame()
+        colonne = [
+            str(c).strip() if c is not None else f"Unnamed: {i}"
+            for i, c in enumerate(intestazione)
+        ]
+        dati = [r for r in righe if any(v is not None for v in r)]
+    finally:
+        wb.close()
+    return pd.DataFrame.from_records(dati, columns=colonne)
+
+
+def leggi_excel(contenuto):
+    """Legge i byte di un file .xlsx con il motore più veloce disponibile."""
+    if HA_CALAMINE:
+        df = pd.read_excel(io.BytesIO(contenuto), engine="calamine")
+        df.columns = [str(c).strip() for c in df.columns]
+        return df.dropna(how="all").reset_index(drop=True)
+    return _leggi_openpyxl(contenuto)
+
+
+def _normalizza_codici(valori):
+    """Codici con il loro tipo: testi senza spazi ai bordi, numeri come numeri.
+
+    Solo una colonna che mescola numeri e testi diventa testo: così resta
+    ordinabile e salvabile in Parquet, mentre i codici numerici mantengono
+    l'ordine numerico (9, 10, 100) e il loro tipo nelle esportazioni.
+    """
+    tipo = pd.api.types.infer_dtype(valori, skipna=True)
+    if tipo in ("empty", "integer", "floating", "mixed-integer-float", "boolean", "datetime", "date"):
+        return valori
+    if tipo != "string":
+        valori = valori.where(valori.isna(), valori.astype(str))
+    return valori.where(valori.isna(), valori.str.strip())
+
+
+def normalizza_ordini(df):
+    """Tipi coerenti per la pianificazione e per il salvataggio colonnare."""
+    df = normalizza_colonne(df)
+    for col in COLONNE_CODICE:
+        if col in df.columns:
+            df[col] = _normalizza_codici(df[col])
+    return df
+
+
+def _percorso_cache(digest, cartella):
+    return Path(cartella) / f"{digest}.{'parquet' if HA_PYARROW else 'pkl'}"
+
+
+def _leggi_cache(percorso):
+    if not percorso.exists():
+        # Eventuale copia salvata in pickle se il Parquet non era scrivibile
+        percorso = percorso.with_suffix(".pkl")
+        if not percorso.exists():
+            return None
+    try:
+        if percorso.suffix == ".parquet":
+            return pd.read_parquet(percorso)
+        return pd.read_pickle(percorso)
+    except Exception:
+        percorso.unlink(missing_ok=True)
+        return None
+
+
+def _scrivi_cache(df, percorso):
+    percorso.parent.mkdir(parents=True, exist_ok=True)
+    temporaneo = percorso.with_name(percorso.name + ".tmp")
+    try:
+        if percorso.suffix == ".parquet":
+            try:
+                df.to_parquet(temporaneo, index=False)
+            except (ValueError, TypeError, ImportError) as e:
+                # Colonne extra con tipi misti: si ripiega sul pickle
+                log.warning("Cache ordini salvata in pickle, Parquet non scrivibile: %s", e)
+                percorso = percorso.with_suffix(".pkl")
+                df.to_pickle(temporaneo)
+        else:
+            df.to_pickle(temporaneo)
+        os.replace(temporaneo, percorso)
+    except OSError:
+        temporaneo.unlink(missing_ok=True)
+        return
+    _pulisci_cache(percorso.parent)
+
+
+def _pulisci_cache(cartella, max_file=MAX_FILE_CACHE):
+    file = sorted(
+        (p for p in cartella.iterdir() if p.suffix in (".parquet", ".pkl")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for vecchio in file[max_file:]:
+        vecchio.unlink(missing_ok=True)
+
+
+def leggi_ordini(contenuto, digest=None, cartella_cache=CARTELLA_CACHE):
+    """DataFrame normalizzato degli ordini contenuti nei byte di un file Excel.
+
+    Il risultato è condiviso: chi deve modificarlo ne faccia una copia.
+    """
+    digest = digest or hash_contenuto(contenuto)
+    with _lock:
+        if digest in _in_memoria:
+            _in_memoria.move_to_end(digest)
+            return _in_memoria[digest]
+
+    percorso = _percorso_cache(digest, cartella_cache) if cartella_cache else None
+    df = _leggi_cache(percorso) if percorso else None
+    if df is None:
+        df = normalizza_ordini(leggi_excel(contenuto))
+        if percorso:
+            _scrivi_cache(df, percorso)
+
+    with _lock:
+        _in_memoria[digest] = df
+        while len(_in_memoria) > MAX_IN_MEMORIA:
+            _in_memoria.popitem(last=False)
+    return df
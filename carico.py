@@ -0,0 +1,151 @@
+"""Carico delle macchine rispetto alle ore lavorative disponibili.
+
+Le operazioni del piano vengono convertite in ore lavorative del calendario
+(vedi `WorkCalendar.a_ore`): in quello spazio ogni giorno lavorativo è un
+intervallo lungo `ore_giornaliere`, e ripartire un'operazione sui giorni che
+attraversa è aritmetica vettoriale sugli estremi. Le ore di ogni macchina per
+giorno lavorativo restano in una matrice macchine × giorni; quando il piano
+cambia si sottraggono e si sommano solo le righe modificate. Le settimane e
+i gruppi di macchine esclusive (una sola capacità condivisa) sono
+aggregazioni della matrice.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from calendario import WorkCalendar
+
+PERIODI_CARICO = {"giorno": "D", "settimana": "W-SUN"}
+COLONNE_INTERVALLI = ["Inizio", "Fine", "Macchina"]
+
+
+class CaricoMacchine:
+    """Ore pianificate per macchina e giorno lavorativo, aggiornate per differenza con `aggiorna`."""
+
+    def __init__(self, calendar=None, groups=()):
+        self.calendar = calendar or WorkCalendar()
+        self.groups = groups
+        self.macchine = []
+        self._righe = {}
+        self.primo_giorno = 0  # giorno lavorativo (dall'origine del calendario) della colonna 0
+        self.ore = np.zeros((0, 0))
+        self._intervalli = pd.DataFrame(columns=COLONNE_INTERVALLI)
+
+    def aggiorna(self, gantt_df):
+        """Allinea la matrice a `gantt_df`; restituisce il numero di righe ricalcolate."""
+        nuovi = gantt_df[COLONNE_INTERVALLI].astype({"Macchina": str})
+        vecchi = self._intervalli
+        comuni = nuovi.index.intersection(vecchi.index)
+        a, b = vecchi.loc[comuni], nuovi.loc[comuni]
+        uguali = ((a == b) | (a.isna() & b.isna())).all(axis=1).to_numpy()
+        diverse = comuni[~uguali]
+        tolte = vecchi.index.difference(nuovi.index).union(diverse)
+        aggiunte = nuovi.index.difference(vecchi.index).union(diverse)
+        self._somma(vecchi.loc[tolte], -1.0)
+        self._somma(nuovi.loc[aggiunte], 1.0)
+        self._intervalli = nuovi
+        return len(aggiunte.union(tolte))
+
+    def _riga(self, macchina):
+        if macchina not in self._righe:
+            self._righe[macchina] = len(self.macchine)
+            self.macchine.append(macchina)
+        return self._righe[macchina]
+
+    def _estendi(self, primo, ultimo):
+        """Allarga la matrice per coprire le righe di tutte le macchine e i giorni [primo, ultimo]."""
+        colonne = self.ore.shape[1]
+        if not colonne:
+            self.primo_giorno = primo
+        prima = max(self.primo_giorno - primo, 0)
+        dopo = max(ultimo - (self.primo_giorno + colonne - 1), 0)
+        self.ore = np.pad(self.ore, ((0, len(self.macchine) - self.ore.shape[0]), (prima, dopo)))
+        self.primo_giorno -= prima
+
+    def _somma(self, intervalli, segno):
+        """Somma (o sottrae, `segno`=-1) le ore delle operazioni ai giorni che attraversano."""
+        intervalli = intervalli[intervalli["Inizio"].notna() & intervalli["Fine"].notna()]
+        if intervalli.empty:
+            return
+        cal = self.calendar
+        h = cal.ore_giornaliere
+        da = cal.ore_da_date(intervalli["Inizio"].to_numpy())
+        a = cal.ore_da_date(intervalli["Fine"].to_numpy())
+        lavorano = a > da
+        da, a = da[lavorano], a[lavorano]
+        if not len(da):
+            return
+        righe = np.array([self._riga(m) for m in intervalli["Macchina"].to_numpy()[lavorano]], dtype=np.int64)
+
+        # Un frammento per ogni giorno attraversato: [max(da, inizio giorno), min(a, fine giorno))
+        primi = np.floor(da / h).astype(np.int64)
+        ultimi = np.maximum(np.ceil(a / h).astype(np.int64) - 1, primi)
+        quanti = ultimi - primi + 1
+        operazione = np.repeat(np.arange(len(da)), quanti)
+        giorno = primi[operazione] + np.arange(quanti.sum()) - np.repeat(np.cumsum(quanti) - quanti, quanti)
+        ore = np.minimum(a[operazione], (giorno + 1) * h) - np.maximum(da[operazione], giorno * h)
+
+        self._estendi(int(giorno.min()), int(giorno.max()))
+        celle = righe[operazione] * self.ore.shape[1] + (giorno - self.primo_giorno)
+        self.ore += segno * np.bincount(celle, weights=ore, minlength=self.ore.size).reshape(self.ore.shape)
+
+    def giorni(self):
+        """Date dei giorni lavorativi delle colonne della matrice."""
+        return pd.DatetimeIndex(self.calendar.date_giorni(self.primo_giorno + np.arange(self.ore.shape[1])))
+
+    def tabella(self, periodo="giorno", inizio=None, fine=None):
+        """Ore pianificate e disponibili per macchina (e gruppo) e periodo ("giorno" o "settimana").
+
+        Restituisce due DataFrame con le stesse righe e colonne (data di
+        inizio del periodo): carico e capacità. Un gruppo esclusivo ha la
+        capacità di una sola macchina, condivisa dalle macchine del gruppo.
+        """
+        giorni = self.giorni()
+        dentro = np.ones(len(giorni), dtype=bool)
+        if inizio is not None:
+            dentro &= giorni >= pd.Timestamp(inizio).normalize()
+        if fine is not None:
+            dentro &= giorni <= pd.Timestamp(fine)
+        carico = pd.DataFrame(np.clip(self.ore[:, dentro], 0, None), index=self.macchine, columns=giorni[dentro])
+        carico = carico.sort_index()
+        gruppi = {
+            f"Gruppo {g['nome']}": [m for m in g["macchine"] if m in self._righe] for g in self.groups
+        }
+        gruppi = {nome: membri for nome, membri in gruppi.items() if membri}
+        if gruppi:
+            carico = pd.concat([carico, pd.DataFrame(
+                {nome: carico.loc[membri].sum() for nome, membri in gruppi.items()}
+            ).T])
+        capacita = pd.DataFrame(self.calendar.ore_giornaliere, index=carico.index, columns=carico.columns)
+
+        if periodo != "giorno":
+            settimane = carico.columns.to_period(PERIODI_CARICO[periodo]).start_time
+            carico = carico.T.groupby(settimane).sum().T
+            capacita = capacita.T.groupby(settimane).sum().T
+        return carico.round(2), capacita
+
+
+def figura_carico(carico, capacita, titolo="🌡️ Carico macchine"):
+    """Heatmap (una sola traccia) del carico in % delle ore disponibili, con le ore nel tooltip."""
+    utilizzo = (100 * carico / capacita).round(0)
+    fig = go.Figure(go.Heatmap(
+        z=utilizzo.to_numpy(),
+        x=carico.columns,
+        y=carico.index,
+        customdata=np.dstack([carico.to_numpy(), capacita.to_numpy()]),
+        colorscale="RdYlGn_r",
+        zmin=0,
+        zmax=max(100.0, float(np.nanmax(utilizzo.to_numpy(), initial=0))),
+        colorbar=dict(title="Carico %"),
+        hovertemplate="%{y}, %{x|%d-%m-%Y}<br>%{customdata[0]:.1f} h su %{customdata[1]:.1f} h (%{z:.0f}%)<extra></extra>",
+        xgap=1,
+        ygap=1,
+    ))
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(
+        title=titolo,
+        xaxis_title="Data",
+        height=max(300, 40 * len(carico.index) + 150),
+        xaxis=dict(type="date", tickformat="%d-%m"),
+    )
+    return fig
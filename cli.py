@@ -0,0 +1,214 @@
+"""Pianificazione da riga di comando, senza Streamlit (ad esempio da cron).
+
+Esempi:
+
+    python cli.py plan ordini.xlsx --out piano.xlsx --lists liste/
+    python cli.py plan cartella_ordini/ --out piani/ --formato csv --processi 4
+
+Usa lo stesso motore, lo stesso calendario e gli stessi gruppi macchine
+dell'applicazione; con più file (o una cartella) li elabora in parallelo e
+stampa i tempi di ogni fase.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import sys
+import time
+
+from caricamento import CARTELLA_CACHE, leggi_ordini
+from calendario import SETTIMANA_DEFAULT, WorkCalendar, leggi_festivi, leggi_turni
+from esportazione import FORMATI, esporta
+from pianificatore import GRUPPI_MACCHINE, pianifica
+
+ESTENSIONI_ORDINI = (".xlsx", ".xlsm")
+
+
+@dataclass
+class OpzioniPiano:
+    calendario: WorkCalendar
+    gruppi: list
+    inizio: date = None
+    formato: str = "xlsx"
+    cartella_liste: Path = None
+    formato_data: str = "GG/MM/AAAA HH:MM"
+    cache: bool = True
+
+
+@dataclass
+class Esito:
+    file: str
+    destinazione: str = None
+    operazioni: int = 0
+    in_ritardo: int = 0
+    tempi: dict = field(default_factory=dict)  # fase -> secondi
+    errore: str = None
+
+
+def file_ordini(percorsi):
+    """Espande le cartelle nei file Excel che contengono."""
+    risultato = []
+    for percorso in map(Path, percorsi):
+        if percorso.is_dir():
+            risultato.extend(sorted(
+                p for p in percorso.iterdir()
+                if p.suffix.lower() in ESTENSIONI_ORDINI and not p.name.startswith("~$")
+            ))
+        else:
+            risultato.append(percorso)
+    return risultato
+
+
+def elabora(sorgente, destinazione, opzioni):
+    """Legge, pianifica ed esporta un file ordini; restituisce l'`Esito` con i tempi per fase."""
+    esito = Esito(str(sorgente), str(destinazione) if destinazione else None)
+    try:
+        t = time.perf_counter()
+        df = leggi_ordini(sorgente.read_bytes(), cartella_cache=CARTELLA_CACHE if opzioni.cache else None)
+        esito.tempi["lettura"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        piano = pianifica(df, opzioni.calendario, opzioni.gruppi, inizio=opzioni.inizio)
+        gantt_df = piano.gantt_df
+        esito.tempi["pianificazione"] = time.perf_counter() - t
+        esito.operazioni = len(gantt_df)
+        esito.in_ritardo = int(gantt_df["In ritardo"].sum())
+
+        if destinazione:
+            t = time.perf_counter()
+            destinazione.parent.mkdir(parents=True, exist_ok=True)
+            destinazione.write_bytes(esporta(gantt_df, opzioni.formato, f"{piano.versione}@{piano.inizio_ore}"))
+            esito.tempi["esportazione"] = time.perf_counter() - t
+
+        if opzioni.cartella_liste:
+            from liste_lavoro import OpzioniLista, excel_lista, html_lista, liste_stampa, nome_file
+
+            t = time.perf_counter()
+            opzioni_lista = OpzioniLista(formato_data=opzioni.formato_data)
+            liste = liste_stampa(gantt_df, sorted(gantt_df["Macchina"].dropna().unique()), opzioni_lista)
+            opzioni.cartella_liste.mkdir(parents=True, exist_ok=True)
+            for macchina, lavori in liste.items():
+                nome = nome_file(macchina)
+                (opzioni.cartella_liste / f"{nome}.html").write_text(html_lista(macchina, lavori), encoding="utf-8")
+                (opzioni.cartella_liste / f"{nome}.xlsx").write_bytes(excel_lista(lavori))
+            esito.tempi["liste"] = time.perf_counter() - t
+    except Exception as e:
+        esito.errore = f"{type(e).__name__}: {e}"
+    return esito
+
+
+def _riga_esito(esito):
+    if esito.errore:
+        return f"✗ {esito.file}: {esito.errore}"
+    tempi = "  ".join(f"{fase} {secondi:.2f}s" for fase, secondi in esito.tempi.items())
+    destinazione = f" → {esito.destinazione}" if esito.destinazione else ""
+    return f"✓ {esito.file}{destinazione}: {esito.operazioni} operazioni, {esito.in_ritardo} in ritardo | {tempi}"
+
+
+def _leggi_data(testo):
+    return datetime.strptime(testo, "%d/%m/%Y").date()
+
+
+def _opzioni(args):
+    turni = leggi_turni(args.turni)
+    festivi = args.festivi or ""
+    if festivi and Path(festivi).is_file():
+        festivi = Path(festivi).read_text(encoding="utf-8")
+    festivi = leggi_festivi(festivi)
+    settimana = "1111110" if args.sabato else SETTIMANA_DEFAULT
+    gruppi = json.loads(Path(args.gruppi).read_text(encoding="utf-8")) if args.gruppi else GRUPPI_MACCHINE
+    return OpzioniPiano(
+        calendario=WorkCalendar(turni, festivi, settimana),
+        gruppi=gruppi,
+        inizio=args.inizio,
+        formato=args.formato,
+        formato_data=args.formato_data,
+        cache=not args.no_cache,
+    )
+
+
+def comando_plan(args):
+    sorgenti = file_ordini(args.input)
+    if not sorgenti:
+        print("Nessun file ordini trovato", file=sys.stderr)
+        return 2
+    opzioni = _opzioni(args)
+    estensione = FORMATI[opzioni.formato][2]
+
+    # Con un solo file --out e --lists sono i percorsi finali, con più file sono cartelle
+    lavori = []
+    for sorgente in sorgenti:
+        if args.out is None:
+            destinazione = None
+        elif len(sorgenti) == 1 and not Path(args.out).is_dir():
+            destinazione = Path(args.out)
+        else:
+            destinazione = Path(args.out) / f"{sorgente.stem}_piano.{estensione}"
+        cartella_liste = None
+        if args.lists:
+            cartella_liste = Path(args.lists) if len(sorgenti) == 1 else Path(args.lists) / sorgente.stem
+        lavori.append((sorgente, destinazione, replace(opzioni, cartella_liste=cartella_liste)))
+
+    avvio = time.perf_counter()
+    processi = min(args.processi or os.cpu_count() or 1, len(lavori))
+    if processi <= 1:
+        esiti = []
+        for lavoro in lavori:
+            esiti.append(elabora(*lavoro))
+            print(_riga_esito(esiti[-1]), flush=True)
+    else:
+        esiti = []
+        with ProcessPoolExecutor(max_workers=processi, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for esito in pool.map(elabora, *zip(*lavori)):
+                esiti.append(esito)
+                print(_riga_esito(esito), flush=True)
+
+    errori = sum(1 for e in esiti if e.errore)
+    print(
+        f"{len(esiti) - errori}/{len(esiti)} file pianificati in {time.perf_counter() - avvio:.2f}s",
+        file=sys.stderr,
+    )
+    return 1 if errori else 0
+
+
+def parser():
+    p = argparse.ArgumentParser(prog="cli.py", description="Pianificazione produzione da riga di comando")
+    comandi = p.add_subparsers(dest="comando", required=True)
+
+    plan = comandi.add_parser("plan", help="pianifica uno o più file ordini")
+    plan.add_argument("input", nargs="+", help="file Excel degli ordini o cartelle che li contengono")
+    plan.add_argument("--out", help="file del piano (con più input: cartella)")
+    plan.add_argument("--formato", choices=sorted(FORMATI), default=None,
+                      help="formato del piano (default: dall'estensione di --out, altrimenti xlsx)")
+    plan.add_argument("--lists", help="cartella per le liste di lavoro per macchina (HTML ed Excel)")
+    plan.add_argument("--formato-data", default="GG/MM/AAAA HH:MM",
+                      choices=["GG/MM/AAAA", "GG/MM/AAAA HH:MM", "Completo"], help="formato date delle liste")
+    plan.add_argument("--turni", default="08:00-17:00", help='turni giornalieri, es. "06:00-14:00, 14:00-22:00"')
+    plan.add_argument("--festivi", help="festività GG/MM/AAAA separate da virgola, o file con una data per riga")
+    plan.add_argument("--sabato", action="store_true", help="sabato lavorativo")
+    plan.add_argument("--gruppi", help="file JSON con i gruppi di macchine esclusive (default: quelli dell'app)")
+    plan.add_argument("--inizio", type=_leggi_data, help="giorno di inizio pianificazione GG/MM/AAAA (default: oggi)")
+    plan.add_argument("--processi", type=int, help="processi in parallelo (default: numero di CPU)")
+    plan.add_argument("--no-cache", action="store_true", help="non usare la cache su disco dei file letti")
+    plan.set_defaults(funzione=comando_plan)
+    return p
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if args.comando == "plan" and args.formato is None:
+        suffisso = Path(args.out).suffix.lower().lstrip(".") if args.out else ""
+        args.formato = suffisso if suffisso in FORMATI else "xlsx"
+    try:
+        return args.funzione(args)
+    except (ValueError, OSError) as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
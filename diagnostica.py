@@ -0,0 +1,219 @@
+"""Strumentazione delle fasi di un aggiornamento della pagina.
+
+Ogni esecuzione dello script registra, fase per fase (download, lettura,
+pianificazione, Gantt, liste...), i secondi trascorsi e, se richiesto, il
+picco di memoria allocata (tracemalloc, che rallenta e per questo è
+opzionale). Le metriche di ogni esecuzione vengono aggiunte come riga JSON a
+`FILE_METRICHE`, per seguire la latenza nel tempo. A richiesta si può
+profilare un'intera esecuzione con pyinstrument, se installato, altrimenti
+con cProfile.
+"""
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+import importlib.util
+import io
+import json
+import marshal
+import os
+from pathlib import Path
+import pstats
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+HA_PYINSTRUMENT = importlib.util.find_spec("pyinstrument") is not None
+
+FILE_METRICHE = Path(
+    os.environ.get("PIANIFICAZIONE_METRICHE", Path.home() / ".cache" / "pianificazione" / "metriche.jsonl")
+)
+MAX_BYTE_METRICHE = 20 * 2**20  # oltre, il file viene ruotato in .1
+RIGHE_PROFILO = 40
+
+_file_lock = threading.Lock()
+
+
+class Diagnostica:
+    """Tempi (e picchi di memoria se `memoria`) delle fasi di un'esecuzione.
+
+    Una fase può essere misurata più volte nella stessa esecuzione (ad
+    esempio una per macchina): tempi e chiamate si sommano.
+    """
+
+    def __init__(self, memoria=False):
+        self.memoria = memoria
+        self.fasi = {}
+        self.info = {}
+        self.avviata_il = datetime.now()
+        self.totale = None
+        self._inizio = time.perf_counter()
+        # tracemalloc è globale al processo: se era già attivo non va fermato
+        self._ferma_tracemalloc = memoria and not tracemalloc.is_tracing()
+        if self._ferma_tracemalloc:
+            tracemalloc.start()
+
+    @contextmanager
+    def fase(self, nome):
+        if self.memoria:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            misura = self.fasi.setdefault(nome, {"secondi": 0.0, "chiamate": 0})
+            misura["secondi"] += time.perf_counter() - t
+            misura["chiamate"] += 1
+            if self.memoria:
+                picco = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+                misura["picco_mb"] = max(misura.get("picco_mb", 0.0), picco)
+
+    def chiudi(self):
+        """Chiude la misura dell'esecuzione e ne restituisce le metriche."""
+        if self.totale is None:
+            self.totale = time.perf_counter() - self._inizio
+            if self._ferma_tracemalloc:
+                tracemalloc.stop()
+        return self.metriche()
+
+    def metriche(self):
+        """Metriche dell'esecuzione come dizionario serializzabile in JSON."""
+        fasi = {
+            nome: {k: round(v, 4) if isinstance(v, float) else v for k, v in misura.items()}
+            for nome, misura in self.fasi.items()
+        }
+        return {
+            "data": self.avviata_il.isoformat(timespec="seconds"),
+            "tipo": "esecuzione",
+            "secondi_totali": round(self.totale, 4) if self.totale is not None else None,
+            "fasi": fasi,
+            **self.info,
+        }
+
+    def tabella(self):
+        """Fasi in ordine di esecuzione, con il tempo non attribuito a nessuna fase (interfaccia)."""
+        tabella = pd.DataFrame.from_dict(self.fasi, orient="index")
+        if tabella.empty:
+            tabella = pd.DataFrame(columns=["secondi", "chiamate"])
+        if self.totale is not None:
+            tabella.loc["altro (interfaccia)", ["secondi", "chiamate"]] = (
+                max(self.totale - tabella["secondi"].sum(), 0.0), 1
+            )
+        tabella["quota %"] = (100 * tabella["secondi"] / (self.totale or tabella["secondi"].sum() or 1)).round(1)
+        tabella["chiamate"] = tabella["chiamate"].astype(int)
+        return tabella.rename_axis("Fase")
+
+
+class Profilo:
+    """Profilo di un'esecuzione: pyinstrument se installato, altrimenti cProfile."""
+
+    def __init__(self):
+        if HA_PYINSTRUMENT:
+            from pyinstrument import Profiler
+
+            self._profiler = Profiler()
+        else:
+            self._profiler = cProfile.Profile()
+
+    def avvia(self):
+        if HA_PYINSTRUMENT:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def ferma(self):
+        if HA_PYINSTRUMENT:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def testo(self, righe=RIGHE_PROFILO):
+        """Riepilogo leggibile: funzioni ordinate per tempo cumulativo."""
+        if HA_PYINSTRUMENT:
+            return self._profiler.output_text(unicode=True, color=False)
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats("cumulative").print_stats(righe)
+        return output.getvalue()
+
+    def file(self):
+        """Profilo completo da scaricare: (byte, estensione, tipo MIME).
+
+        Con cProfile è il formato di `pstats.dump_stats`, leggibile con
+        `python -m pstats` o snakeviz; con pyinstrument è una pagina HTML.
+        """
+        if HA_PYINSTRUMENT:
+            return self._profiler.output_html().encode("utf-8"), "html", "text/html"
+        self._profiler.create_stats()
+        return marshal.dumps(self._profiler.stats), "prof", "application/octet-stream"
+
+
+def registra_metriche(metriche, percorso=FILE_METRICHE, max_byte=MAX_BYTE_METRICHE):
+    """Aggiunge le metriche come riga JSON al file; gli errori di scrittura sono ignorati."""
+    if not percorso:
+        return
+    percorso = Path(percorso)
+    riga = json.dumps(metriche, ensure_ascii=False, default=str) + "\n"
+    with _file_lock:
+        try:
+            percorso.parent.mkdir(parents=True, exist_ok=True)
+            if percorso.exists() and percorso.stat().st_size > max_byte:
+                os.replace(percorso, percorso.with_name(percorso.name + ".1"))
+            with open(percorso, "a", encoding="utf-8") as f:
+                f.write(riga)
+        except OSError:
+            pass
+
+
+def cronometrata(nome, funzione, percorso=FILE_METRICHE, **info):
+    """Versione di `funzione` che registra nel file delle metriche la durata di ogni chiamata.
+
+    Serve per il lavoro fatto fuori dall'esecuzione dello script, come i
+    file generati al click su un bottone di download.
+    """
+    def misurata(*args, **kwargs):
+        avviata_il = datetime.now()
+        t = time.perf_counter()
+        try:
+            return funzione(*args, **kwargs)
+        finally:
+            secondi = round(time.perf_counter() - t, 4)
+            registra_metriche({
+                "data": avviata_il.isoformat(timespec="seconds"),
+                "tipo": "richiesta",
+                "secondi_totali": secondi,
+                "fasi": {nome: {"secondi": secondi, "chiamate": 1}},
+                **info,
+            }, percorso)
+
+    return misurata
+
+
+def storico_metriche(percorso=FILE_METRICHE, ultime=1000):
+    """Riepilogo delle ultime `ultime` righe del file: mediana, 95° percentile e massimo per fase."""
+    percorso = Path(percorso)
+    if not percorso.exists():
+        return pd.DataFrame()
+    with _file_lock, open(percorso, encoding="utf-8") as f:
+        righe = f.readlines()[-ultime:]
+
+    misure = []
+    for riga in righe:
+        try:
+            metriche = json.loads(riga)
+        except json.JSONDecodeError:
+            continue
+        if metriche.get("tipo") == "esecuzione" and metriche.get("secondi_totali") is not None:
+            misure.append(("totale", metriche["secondi_totali"]))
+        misure.extend((fase, m["secondi"]) for fase, m in metriche.get("fasi", {}).items() if "secondi" in m)
+    if not misure:
+        return pd.DataFrame()
+
+    secondi = pd.DataFrame(misure, columns=["Fase", "secondi"]).groupby("Fase", sort=False)["secondi"]
+    return pd.DataFrame({
+        "misure": secondi.size(),
+        "mediana (s)": secondi.median(),
+        "p95 (s)": secondi.quantile(0.95),
+        "massimo (s)": secondi.max(),
+    }).round(3)
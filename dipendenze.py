@@ -0,0 +1,131 @@
+"""Grafo delle dipendenze tra operazioni.
+
+La colonna "Dipendenza" indica il codice pezzo (o più codici separati da
+virgola) che deve essere completato prima dell'operazione. Il grafo viene
+costruito una sola volta, indicizzato per codice pezzo, e fornisce un ordine
+topologico che rispetta la priorità delle righe.
+"""
+import heapq
+import re
+
+_SEPARATORI = re.compile(r"[,;]")
+
+
+def chiave_codice(valore):
+    """Normalizza un codice pezzo per il confronto (123, "123" e "123.0" coincidono)."""
+    testo = str(valore).strip()
+    if testo.endswith(".0") and testo[:-2].isdigit():
+        return testo[:-2]
+    return testo
+
+
+class GrafoDipendenze:
+    """DAG delle operazioni di un DataFrame già preparato e ordinato.
+
+    I nodi sono le posizioni delle righe; ogni operazione con dipendenza ha
+    come predecessori tutte le operazioni del codice pezzo indicato.
+    Predecessori e successori sono tuple, la stessa tupla vuota per tutti i
+    nodi senza archi.
+    """
+
+    def __init__(self, df):
+        codici = [chiave_codice(c) for c in df["Codice pezzo"]]
+        self.n = len(codici)
+
+        # --- Indice per codice pezzo ---
+        self.per_codice = {}
+        for i, codice in enumerate(codici):
+            self.per_codice.setdefault(codice, []).append(i)
+
+        predecessori = {}
+        successori = {}
+        self.mancanti = []  # (posizione, codice dipendenza non trovato)
+        for i, dip in enumerate(df["Dipendenza"]):
+            if not dip:
+                continue
+            for parte in _SEPARATORI.split(dip):
+                codice_dip = chiave_codice(parte)
+                if not codice_dip:
+                    continue
+                if codice_dip not in self.per_codice:
+                    self.mancanti.append((i, codice_dip))
+                    continue
+                for j in self.per_codice[codice_dip]:
+                    if j != i:
+                        predecessori.setdefault(i, []).append(j)
+                        successori.setdefault(j, []).append(i)
+
+        self.predecessori = [()] * self.n
+        self.successori = [()] * self.n
+        for i, nodi in predecessori.items():
+            self.predecessori[i] = tuple(nodi)
+        for j, nodi in successori.items():
+            self.successori[j] = tuple(nodi)
+
+        self.cicli = []  # posizioni pianificate forzando una dipendenza circolare
+
+    @property
+    def archi(self):
+        return sum(len(p) for p in self.predecessori)
+
+    def ordine_topologico(self, chiave=None):
+        """Ordine di pianificazione: topologico, a parità di vincoli per posizione (priorità).
+
+        `chiave` (opzionale, un valore per nodo) sostituisce la posizione come
+        criterio di scelta tra i nodi pronti: è la sequenza esplorata
+        dall'ottimizzatore.
+
+        Se restano nodi bloccati da un ciclo, ne viene sbloccato uno ignorando
+        i predecessori non ancora pianificati, e il nodo viene registrato in
+        `cicli`.
+        """
+        peso = list(range(self.n)) if chiave is None else list(chiave)
+        gradi = [len(p) for p in self.predecessori]
+        pronti = [(peso[i], i) for i in range(self.n) if gradi[i] == 0]
+        heapq.heapify(pronti)
+        visitati = [False] * self.n
+        ordine = []
+        self.cicli = []
+        prossimo_bloccato = 0
+
+        while len(ordine) < self.n:
+            if not pronti:
+                # Ciclo: risale dal primo nodo bloccato fino a un nodo del ciclo e lo sblocca
+                while visitati[prossimo_bloccato]:
+                    prossimo_bloccato += 1
+                nodo = self._nodo_in_ciclo(prossimo_bloccato, visitati)
+                self.cicli.append(nodo)
+                gradi[nodo] = 0
+                pronti.append((peso[nodo], nodo))
+
+            _, i = heapq.heappop(pronti)
+            if visitati[i]:
+                continue
+            visitati[i] = True
+            ordine.append(i)
+            for j in self.successori[i]:
+                gradi[j] -= 1
+                if gradi[j] == 0 and not visitati[j]:
+                    heapq.heappush(pronti, (peso[j], j))
+
+        return ordine
+
+    def _nodo_in_ciclo(self, i, visitati):
+        visti = set()
+        while i not in visti:
+            visti.add(i)
+            i = next(j for j in self.predecessori[i] if not visitati[j])
+        return i
+
+    def avvisi(self, df):
+        """Messaggi leggibili su dipendenze mancanti e circolari."""
+        messaggi = []
+        for i, codice_dip in self.mancanti:
+            messaggi.append(
+                f"Dipendenza '{codice_dip}' di {df['Codice pezzo'].iat[i]} ({df['Operazione'].iat[i]}) non trovata: ignorata"
+            )
+        for i in self.cicli:
+            messaggi.append(
+                f"Dipendenza circolare su {df['Codice pezzo'].iat[i]} ({df['Operazione'].iat[i]}): pianificata senza attendere i predecessori"
+            )
+        return messaggi
@@ -0,0 +1,155 @@
+"""Esportazione del piano in Excel, CSV e Parquet.
+
+I file Excel vengono scritti in streaming, riga per riga, a blocchi di
+`RIGHE_BLOCCO` righe: con xlsxwriter in modalità `constant_memory` se è
+installato, altrimenti con una cartella openpyxl in sola scrittura. In
+nessuno dei due casi si costruisce in memoria il modello completo delle celle.
+I byte prodotti restano in una piccola cache indicizzata per versione del
+piano e formato, così ogni file si genera una sola volta.
+"""
+from collections import OrderedDict
+import hashlib
+import importlib.util
+import io
+import threading
+
+import pandas as pd
+
+from caricamento import HA_PYARROW
+
+HA_XLSXWRITER = importlib.util.find_spec("xlsxwriter") is not None
+
+RIGHE_BLOCCO = 10_000
+MAX_ESPORTAZIONI = 16
+FORMATO_DATA_EXCEL = "yyyy-mm-dd hh:mm:ss"
+
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# formato -> (etichetta, tipo MIME, estensione)
+FORMATI = {
+    "xlsx": ("Excel", MIME_EXCEL, "xlsx"),
+    "csv": ("CSV", "text/csv", "csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet", "parquet"),
+}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def impronta(df):
+    """Hash del contenuto di un DataFrame (valori, indice e nomi di colonna)."""
+    h = hashlib.sha1(pd.util.hash_pandas_object(df).to_numpy().tobytes())
+    h.update(repr(list(df.columns)).encode())
+    return h.hexdigest()[:12]
+
+
+def righe(df):
+    """Righe di `df` come liste di valori Python, con None al posto dei mancanti."""
+    for inizio in range(0, len(df), RIGHE_BLOCCO):
+        blocco = df.iloc[inizio:inizio + RIGHE_BLOCCO].astype(object)
+        blocco = blocco.where(blocco.notna(), None)
+        yield from blocco.itertuples(index=False, name=None)
+
+
+def _nomi_fogli(nomi):
+    """Nomi dei fogli troncati a 31 caratteri (limite di Excel), resi unici con un suffisso "~2", "~3"..."""
+    usati = set()
+    risultato = []
+    for nome in map(str, nomi):
+        candidato, n = nome[:31], 1
+        while candidato.lower() in usati:  # Excel non distingue maiuscole e minuscole
+            n += 1
+            suffisso = f"~{n}"
+            candidato = nome[:31 - len(suffisso)] + suffisso
+        usati.add(candidato.lower())
+        risultato.append(candidato)
+    return risultato
+
+
+def _scrivi_xlsxwriter(fogli, destinazione):
+    import xlsxwriter
+
+    cartella = xlsxwriter.Workbook(destinazione, {
+        "constant_memory": True,
+        "default_date_format": FORMATO_DATA_EXCEL,
+        "remove_timezone": True,
+    })
+    for nome, df in zip(_nomi_fogli(fogli), fogli.values()):
+        foglio = cartella.add_worksheet(nome)
+        foglio.write_row(0, 0, [str(c) for c in df.columns])
+        for r, riga in enumerate(righe(df), start=1):
+            foglio.write_row(r, 0, riga)
+    cartella.close()
+
+
+def _scrivi_openpyxl(fogli, destinazione):
+    from openpyxl import Workbook
+
+    cartella = Workbook(write_only=True)
+    for nome, df in zip(_nomi_fogli(fogli), fogli.values()):
+        foglio = cartella.create_sheet(nome)
+        foglio.append([str(c) for c in df.columns])
+        for riga in righe(df):
+            foglio.append(riga)
+    cartella.save(destinazione)
+
+
+def excel_bytes(fogli):
+    """File Excel (bytes) con un foglio per ogni voce di `fogli` (nome -> DataFrame)."""
+    output = io.BytesIO()
+    if HA_XLSXWRITER:
+        _scrivi_xlsxwriter(fogli, output)
+    else:
+        _scrivi_openpyxl(fogli, output)
+    return output.getvalue()
+
+
+def csv_bytes(df):
+    """CSV UTF-8 con intestazione, separatore virgola e date ISO."""
+    return df.to_csv(index=False, date_format="%Y-%m-%d %H:%M:%S").encode("utf-8")
+
+
+def parquet_bytes(df):
+    if not HA_PYARROW:
+        raise RuntimeError("L'esportazione Parquet richiede il pacchetto pyarrow")
+    output = io.BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def formati_disponibili():
+    return [f for f in FORMATI if f != "parquet" or HA_PYARROW]
+
+
+def esporta(dati, formato="xlsx", versione=None):
+    """Byte del file nel `formato` richiesto, generati una volta per `versione`.
+
+    `dati` è un DataFrame o, solo per Excel, un dizionario nome foglio ->
+    DataFrame. Se `versione` manca si usa l'impronta del contenuto.
+    """
+    fogli = dati if isinstance(dati, dict) else {"Pianificazione": dati}
+    if versione is None:
+        versione = "-".join(f"{nome}:{impronta(df)}" for nome, df in fogli.items())
+    chiave = (versione, formato)
+
+    with _cache_lock:
+        if chiave in _cache:
+            _cache.move_to_end(chiave)
+            return _cache[chiave]
+
+    if formato == "xlsx":
+        contenuto = excel_bytes(fogli)
+    elif len(fogli) != 1:
+        raise ValueError(f"Il formato {formato} supporta un solo foglio")
+    elif formato == "csv":
+        contenuto = csv_bytes(next(iter(fogli.values())))
+    elif formato == "parquet":
+        contenuto = parquet_bytes(next(iter(fogli.values())))
+    else:
+        raise ValueError(f"Formato di esportazione non supportato: {formato}")
+
+    with _cache_lock:
+        _cache[chiave] = contenuto
+        while len(_cache) > MAX_ESPORTAZIONI:
+            _cache.popitem(last=False)
+    return contenuto
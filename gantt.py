@@ -0,0 +1,182 @@
+"""Diagramma di Gantt scalabile per piani con migliaia di operazioni.
+
+Il grafico usa un numero fisso di tracce (le barre sono un'unica traccia
+colorata per codice pezzo con un array di colori) e disegna i periodi non
+lavorativi del calendario come un'unica lista di forme. Si possono mostrare
+solo una finestra di date e alcune macchine: se le barre nella finestra sono
+troppe, le operazioni vengono aggregate per macchina e per giorno, settimana
+o mese.
+"""
+import numpy as np
+import pandas as pd
+import plotly.colors
+import plotly.graph_objects as go
+
+from calendario import WorkCalendar
+
+MAX_BARRE = 2000  # oltre questa soglia le operazioni nella finestra vengono aggregate
+PERIODI_AGGREGAZIONE = (("D", "giorno"), ("W-SUN", "settimana"), ("M", "mese"))
+PALETTE = plotly.colors.qualitative.Plotly
+COLORE_AGGREGATO = "#636EFA"
+COLORE_AGGREGATO_RITARDO = "#EF553B"
+COLORE_EVIDENZIATO = "#B00020"
+
+
+def filtra_finestra(gantt_df, inizio=None, fine=None, macchine=None):
+    """Operazioni che si sovrappongono alla finestra [inizio, fine] sulle `macchine` indicate."""
+    visibili = gantt_df["Inizio"].notna() & gantt_df["Fine"].notna()
+    if inizio is not None:
+        visibili &= gantt_df["Fine"] >= pd.Timestamp(inizio)
+    if fine is not None:
+        visibili &= gantt_df["Inizio"] <= pd.Timestamp(fine)
+    if macchine:
+        visibili &= gantt_df["Macchina"].isin(macchine)
+    return gantt_df[visibili]
+
+
+def periodi_non_lavorativi(calendar, inizio, fine):
+    """Intervalli [da, a) di giorni consecutivi non lavorativi tra `inizio` e `fine`."""
+    giorni = np.arange(
+        np.datetime64(pd.Timestamp(inizio).date(), "D"),
+        np.datetime64(pd.Timestamp(fine).date(), "D") + np.timedelta64(1, "D"),
+    )
+    if not len(giorni):
+        return []
+    chiuso = ~np.is_busday(giorni, busdaycal=calendar.busdaycal)
+    # Inizi e fini delle sequenze di giorni chiusi
+    bordi = np.diff(np.concatenate(([False], chiuso, [False])).astype(np.int8))
+    da = giorni[np.flatnonzero(bordi == 1)]
+    a = giorni[np.flatnonzero(bordi == -1) - 1] + np.timedelta64(1, "D")
+    return list(zip(pd.to_datetime(da), pd.to_datetime(a)))
+
+
+def forme_non_lavorative(calendar, inizio, fine):
+    """Rettangoli di sfondo per i periodi non lavorativi, da assegnare in blocco al layout."""
+    return [
+        dict(
+            type="rect", xref="x", yref="paper", x0=da, x1=a, y0=0, y1=1,
+            fillcolor="lightgray", opacity=0.3, line_width=0, layer="below",
+        )
+        for da, a in periodi_non_lavorativi(calendar, inizio, fine)
+    ]
+
+
+def barre_operazioni(gantt_df, evidenzia=None):
+    """Una sola traccia con tutte le operazioni, colorate per codice pezzo.
+
+    `evidenzia` è il nome di una colonna booleana: quelle operazioni hanno il
+    bordo in evidenza, le altre sono attenuate.
+    """
+    codici = gantt_df["Codice pezzo"].astype(str)
+    colori = np.array(PALETTE)[pd.Categorical(codici).codes % len(PALETTE)]
+    marker = dict(color=colori, line_width=0)
+    if evidenzia is not None:
+        evidenziate = gantt_df[evidenzia].fillna(False).to_numpy(dtype=bool)
+        marker = dict(
+            color=colori,
+            opacity=np.where(evidenziate, 1.0, 0.35),
+            line=dict(color=COLORE_EVIDENZIATO, width=np.where(evidenziate, 2, 0)),
+        )
+    return go.Bar(
+        base=gantt_df["Inizio"],
+        x=(gantt_df["Fine"] - gantt_df["Inizio"]).dt.total_seconds() * 1000,
+        y=gantt_df["Macchina"],
+        orientation="h",
+        marker=marker,
+        text=codici,
+        textposition="inside",
+        insidetextanchor="middle",
+        textfont_size=10,
+        customdata=np.column_stack([
+            codici, gantt_df["Commessa"].astype(str), gantt_df["Operazione"].astype(str),
+            gantt_df["Priorità"], gantt_df["Inizio"].dt.strftime("%d-%m %H:%M"),
+            gantt_df["Fine"].dt.strftime("%d-%m %H:%M"),
+        ]),
+        hovertemplate=(
+            "<b>%{customdata[0]}</b><br>Commessa: %{customdata[1]}<br>Operazione: %{customdata[2]}"
+            "<br>Priorità: %{customdata[3]}<br>%{customdata[4]} → %{customdata[5]}<extra>%{y}</extra>"
+        ),
+        showlegend=False,
+    )
+
+
+def aggrega(gantt_df, periodo):
+    """Una barra per macchina e periodo, dal primo inizio all'ultima fine delle sue operazioni."""
+    periodi = gantt_df["Inizio"].dt.to_period(periodo[0]).dt.start_time.rename("Periodo")
+    return gantt_df.groupby(["Macchina", periodi]).agg(
+        Inizio=("Inizio", "min"),
+        Fine=("Fine", "max"),
+        Operazioni=("Inizio", "size"),
+        Ritardi=("In ritardo", "sum"),
+    ).reset_index()
+
+
+def barre_aggregate(aggregato, nome_periodo):
+    """Traccia delle barre aggregate, in rosso se contengono operazioni in ritardo."""
+    return go.Bar(
+        base=aggregato["Inizio"],
+        x=(aggregato["Fine"] - aggregato["Inizio"]).dt.total_seconds() * 1000,
+        y=aggregato["Macchina"],
+        orientation="h",
+        marker=dict(
+            color=np.where(aggregato["Ritardi"] > 0, COLORE_AGGREGATO_RITARDO, COLORE_AGGREGATO),
+            line_width=0,
+        ),
+        text=aggregato["Operazioni"].astype(str),
+        textposition="inside",
+        customdata=np.column_stack([
+            aggregato["Periodo"].dt.strftime("%d-%m-%Y"), aggregato["Operazioni"], aggregato["Ritardi"],
+        ]),
+        hovertemplate=(
+            f"%{{y}}, {nome_periodo} del %{{customdata[0]}}<br>%{{customdata[1]}} operazioni, "
+            "%{customdata[2]} in ritardo<extra></extra>"
+        ),
+        showlegend=False,
+    )
+
+
+def figura_gantt(gantt_df, calendar=None, titolo="📆 Gantt di Produzione (Aggiornato)",
+                 inizio=None, fine=None, macchine=None, max_barre=MAX_BARRE, evidenzia=None):
+    """Gantt per macchina della finestra [inizio, fine], con i periodi non lavorativi evidenziati.
+
+    Se le operazioni nella finestra sono più di `max_barre` vengono
+    aggregate per giorno, settimana o mese (il primo periodo che basta).
+    `evidenzia` (colonna booleana, vedi `barre_operazioni`) vale solo per le
+    barre non aggregate.
+    """
+    calendar = calendar or WorkCalendar()
+    visibili = filtra_finestra(gantt_df, inizio, fine, macchine)
+
+    periodo = None
+    if len(visibili) > max_barre:
+        for periodo in PERIODI_AGGREGAZIONE:
+            aggregato = aggrega(visibili, periodo)
+            if len(aggregato) <= max_barre:
+                break
+        titolo = f"{titolo} — {len(visibili)} operazioni aggregate per {periodo[1]}"
+        traccia = barre_aggregate(aggregato, periodo[1])
+    else:
+        traccia = barre_operazioni(visibili, evidenzia)
+
+    fig = go.Figure(traccia)
+    macchine_visibili = sorted(visibili["Macchina"].astype(str).unique())
+    fig.update_yaxes(autorange="reversed", categoryorder="array", categoryarray=macchine_visibili)
+    fig.update_layout(
+        title=titolo,
+        xaxis_title="Data",
+        yaxis_title="Macchina",
+        hovermode="closest",
+        height=700,
+        barmode="overlay",
+        xaxis=dict(type="date", showgrid=True, tickformat="%d-%m %H:%M"),
+    )
+
+    if len(visibili):
+        da = pd.Timestamp(inizio) if inizio is not None else visibili["Inizio"].min()
+        a = pd.Timestamp(fine) if fine is not None else visibili["Fine"].max()
+        # Con barre settimanali o mensili i singoli giorni di chiusura non si leggerebbero
+        if periodo is None or periodo[0] == "D":
+            fig.update_layout(shapes=forme_non_lavorative(calendar, da, a))
+        if inizio is not None or fine is not None:
+            fig.update_xaxes(range=[da, a])
+    return fig
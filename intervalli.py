@@ -0,0 +1,165 @@
+"""Disponibilità delle risorse come insieme ordinato di intervalli liberi.
+
+I tempi sono ore lavorative cumulative (vedi `WorkCalendar.a_ore`), quindi
+la lunghezza di un intervallo libero è direttamente confrontabile con la
+durata di un'operazione. Gli intervalli liberi sono tenuti in un treap
+ordinato per inizio e aumentato con la lunghezza massima del sottoalbero:
+la ricerca del primo buco sufficiente e la prenotazione costano O(log n).
+"""
+import math
+import random
+
+_EPS = 1e-9
+
+
+class _Nodo:
+    __slots__ = ("a", "b", "priorita", "sx", "dx", "massimo")
+
+    def __init__(self, a, b, priorita):
+        self.a = a
+        self.b = b
+        self.priorita = priorita
+        self.sx = None
+        self.dx = None
+        self.massimo = b - a
+
+
+def _aggiorna(nodo):
+    massimo = nodo.b - nodo.a
+    if nodo.sx is not None and nodo.sx.massimo > massimo:
+        massimo = nodo.sx.massimo
+    if nodo.dx is not None and nodo.dx.massimo > massimo:
+        massimo = nodo.dx.massimo
+    nodo.massimo = massimo
+
+
+def _dividi(nodo, chiave):
+    """Divide in (inizio < chiave, inizio >= chiave)."""
+    if nodo is None:
+        return None, None
+    if nodo.a < chiave:
+        sinistra, destra = _dividi(nodo.dx, chiave)
+        nodo.dx = sinistra
+        _aggiorna(nodo)
+        return nodo, destra
+    sinistra, destra = _dividi(nodo.sx, chiave)
+    nodo.sx = destra
+    _aggiorna(nodo)
+    return sinistra, nodo
+
+
+def _unisci(sinistra, destra):
+    if sinistra is None:
+        return destra
+    if destra is None:
+        return sinistra
+    if sinistra.priorita > destra.priorita:
+        sinistra.dx = _unisci(sinistra.dx, destra)
+        _aggiorna(sinistra)
+        return sinistra
+    destra.sx = _unisci(sinistra, destra.sx)
+    _aggiorna(destra)
+    return destra
+
+
+class IntervalliLiberi:
+    """Tempo libero di una risorsa (macchina o gruppo di macchine esclusive).
+
+    All'inizio la risorsa è libera da `inizio` in poi; ogni prenotazione
+    toglie un intervallo [inizio, fine) dal tempo libero.
+    """
+
+    def __init__(self, inizio=0.0, seme=0):
+        self._random = random.Random(seme)
+        self._radice = _Nodo(inizio, math.inf, self._random.random())
+        self._n = 1
+
+    def __len__(self):
+        """Numero di intervalli liberi (buchi più la coda illimitata)."""
+        return self._n
+
+    def _contenente(self, t):
+        """Intervallo libero con l'inizio più grande <= t, o None."""
+        nodo, trovato = self._radice, None
+        while nodo is not None:
+            if nodo.a <= t + _EPS:
+                trovato = nodo
+                nodo = nodo.dx
+            else:
+                nodo = nodo.sx
+        return trovato
+
+    def _primo_dopo(self, nodo, t, durata):
+        """Primo intervallo libero del sottoalbero con inizio > t e lunghezza >= durata."""
+        if nodo is None or nodo.massimo + _EPS < durata:
+            return None
+        if nodo.a > t:
+            trovato = self._primo_dopo(nodo.sx, t, durata)
+            if trovato is not None:
+                return trovato
+            if nodo.b - nodo.a + _EPS >= durata:
+                return nodo
+        return self._primo_dopo(nodo.dx, t, durata)
+
+    def primo_inizio(self, t, durata):
+        """Primo istante >= t da cui la risorsa resta libera per `durata` ore."""
+        durata = max(durata, 0.0)
+        nodo = self._contenente(t)
+        if nodo is not None and nodo.b - max(nodo.a, t) + _EPS >= durata:
+            return max(nodo.a, t)
+        return self._primo_dopo(self._radice, t, durata).a
+
+    def occupa(self, inizio, fine):
+        """Prenota [inizio, fine), che deve essere interamente libero."""
+        if fine - inizio <= _EPS:
+            return
+        nodo = self._contenente(inizio)
+        if nodo is None or nodo.b + _EPS < fine:
+            raise ValueError(f"Intervallo [{inizio}, {fine}) non libero")
+        a, b = nodo.a, nodo.b
+        self._rimuovi(a)
+        if inizio - a > _EPS:
+            self._inserisci(a, inizio)
+        if b - fine > _EPS:
+            self._inserisci(fine, b)
+
+    def blocca(self, inizio, fine):
+        """Rende non disponibile [inizio, fine), anche se in parte già occupato (es. un fermo macchina)."""
+        for a, b in self.liberi():
+            if a >= fine:
+                break
+            if b > inizio:
+                self.occupa(max(a, inizio), min(b, fine))
+
+    def _inserisci(self, a, b):
+        sinistra, destra = _dividi(self._radice, a)
+        self._radice = _unisci(_unisci(sinistra, _Nodo(a, b, self._random.random())), destra)
+        self._n += 1
+
+    def _rimuovi(self, a):
+        sinistra, destra = _dividi(self._radice, a)
+        _, destra = _dividi(destra, math.nextafter(a, math.inf))
+        self._radice = _unisci(sinistra, destra)
+        self._n -= 1
+
+    def liberi(self):
+        """Intervalli liberi in ordine, come coppie (inizio, fine)."""
+        risultato, pila, nodo = [], [], self._radice
+        while pila or nodo is not None:
+            while nodo is not None:
+                pila.append(nodo)
+                nodo = nodo.sx
+            nodo = pila.pop()
+            risultato.append((nodo.a, nodo.b))
+            nodo = nodo.dx
+        return risultato
+
+
+def primo_inizio_comune(risorse, t, durata):
+    """Primo istante >= t in cui tutte le `risorse` sono libere per `durata` ore."""
+    while True:
+        precedente = t
+        for risorsa in risorse:
+            t = risorsa.primo_inizio(t, durata)
+        if t == precedente:
+            return t
@@ -0,0 +1,213 @@
+"""Liste di lavoro per macchina: tabelle da stampare, HTML, Excel e pacchetto ZIP.
+
+Le liste di tutte le macchine si preparano con un solo ordinamento e un solo
+`groupby("Macchina")`; HTML ed Excel si generano solo quando servono (ad
+esempio quando si clicca il bottone di download) partendo da un modello HTML
+compilato una volta.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import reduce
+import html
+import io
+from string import Template
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from esportazione import esporta
+
+FORMATI_DATA = {
+    "GG/MM/AAAA": "%d/%m/%Y",
+    "GG/MM/AAAA HH:MM": "%d/%m/%Y %H:%M",
+    "Completo": "%A %d/%m/%Y alle %H:%M",
+}
+
+TEMPLATE_HTML = Template("""
+<html>
+<head>
+    <meta charset="UTF-8">
+    <style>
+        @page {
+            size: A4;
+            margin: 1cm;
+        }
+        body {
+            font-family: Arial, sans-serif;
+            margin: 20px;
+        }
+        h1 {
+            color: #2c3e50;
+            border-bottom: 3px solid #3498db;
+            padding-bottom: 10px;
+        }
+        .info {
+            background-color: #ecf0f1;
+            padding: 15px;
+            border-radius: 5px;
+            margin-bottom: 20px;
+        }
+        table {
+            width: 100%;
+            border-collapse: collapse;
+            margin-top: 20px;
+        }
+        th {
+            background-color: #3498db;
+            color: white;
+            padding: 12px;
+            text-align: left;
+            font-weight: bold;
+        }
+        td {
+            padding: 10px;
+            border-bottom: 1px solid #ddd;
+        }
+        tr:nth-child(even) {
+            background-color: #f9f9f9;
+        }
+        tr:hover {
+            background-color: #f5f5f5;
+        }
+        .ritardo {
+            background-color: #ffcccc !important;
+        }
+        .footer {
+            margin-top: 30px;
+            text-align: center;
+            color: #7f8c8d;
+            font-size: 12px;
+        }
+        @media print {
+            .no-print {
+                display: none;
+            }
+        }
+    </style>
+</head>
+<body>
+    <h1>📋 Lista Lavori - $macchina</h1>
+    <div class="info">
+        <p><strong>Data generazione:</strong> $generata_il</p>
+        <p><strong>Numero operazioni:</strong> $operazioni</p>
+        <p><strong>Operazioni in ritardo:</strong> $ritardi</p>
+    </div>
+    <table>
+        <thead>
+            <tr>$intestazioni</tr>
+        </thead>
+        <tbody>
+$righe
+        </tbody>
+    </table>
+    <div class="footer">
+        <p>Sistema di Pianificazione Produzione</p>
+    </div>
+</body>
+</html>
+""")
+
+
+@dataclass(frozen=True)
+class OpzioniLista:
+    formato_data: str = "GG/MM/AAAA"
+    mostra_priorita: bool = True
+    mostra_tempi: bool = True
+    mostra_ritardi: bool = True
+
+
+def nome_file(macchina):
+    return f"lista_lavori_{str(macchina).replace(' ', '_')}"
+
+
+def _per_macchina(df, macchine, ordinato):
+    gruppi = dict(tuple(df.groupby(ordinato["Macchina"], sort=False)))
+    return {m: gruppi[m] for m in macchine if m in gruppi}
+
+
+def liste_stampa(gantt_df, macchine, opzioni):
+    """Tabelle da stampare per ogni macchina in `macchine`, in ordine di inizio."""
+    ordinato = gantt_df[gantt_df["Macchina"].isin(macchine)].sort_values("Inizio", kind="stable")
+    formato = FORMATI_DATA[opzioni.formato_data]
+
+    colonne = ["Commessa", "Codice pezzo", "Operazione"]
+    if opzioni.mostra_priorita:
+        colonne.append("Priorità")
+    stampa = ordinato[colonne].copy()
+    stampa["Inizio"] = ordinato["Inizio"].dt.strftime(formato)
+    stampa["Fine"] = ordinato["Fine"].dt.strftime(formato)
+    if opzioni.mostra_tempi:
+        stampa["Durata (ore)"] = ((ordinato["Fine"] - ordinato["Inizio"]).dt.total_seconds() / 3600).round(1)
+    if opzioni.mostra_ritardi:
+        stampa["Ritardo (giorni)"] = ordinato["Ritardo (giorni)"]
+        stampa["In ritardo"] = ordinato["In ritardo"]
+    return _per_macchina(stampa, macchine, ordinato)
+
+
+def liste_export(gantt_df, macchine, opzioni):
+    """Tabelle per l'Excel multi-foglio (date non formattate), per macchina."""
+    ordinato = gantt_df[gantt_df["Macchina"].isin(macchine)].sort_values("Inizio", kind="stable")
+    colonne = ["Commessa", "Codice pezzo", "Operazione", "Inizio", "Fine"]
+    if opzioni.mostra_priorita:
+        colonne.insert(3, "Priorità")
+    if opzioni.mostra_ritardi:
+        colonne.extend(["Ritardo (giorni)", "In ritardo"])
+    return _per_macchina(ordinato[colonne], macchine, ordinato)
+
+
+def html_lista(macchina, lavori_stampa, mostra_ritardi=True, ritardi=None, generata_il=None):
+    """Documento HTML stampabile della lista di lavoro di una macchina."""
+    celle = lavori_stampa.copy()
+    in_ritardo = (
+        celle["In ritardo"].fillna(False).astype(bool).to_numpy()
+        if "In ritardo" in celle.columns else np.zeros(len(celle), dtype=bool)
+    )
+    if "In ritardo" in celle.columns:
+        celle["In ritardo"] = np.where(in_ritardo, "✓ SÌ", "No")
+    testi = [celle[c].astype(str).map(html.escape) for c in celle.columns]
+    righe = reduce(lambda a, b: a + "</td><td>" + b, testi) if testi else pd.Series("", index=celle.index)
+    apertura = np.where(in_ritardo & mostra_ritardi, '<tr class="ritardo"><td>', "<tr><td>")
+    righe = (apertura + righe + "</td></tr>").tolist()
+
+    return TEMPLATE_HTML.substitute(
+        macchina=html.escape(str(macchina)),
+        generata_il=(generata_il or datetime.now()).strftime("%d/%m/%Y alle %H:%M"),
+        operazioni=len(lavori_stampa),
+        ritardi=int(in_ritardo.sum()) if ritardi is None else int(ritardi),
+        intestazioni="".join(f"<th>{html.escape(str(c))}</th>" for c in lavori_stampa.columns),
+        righe="\n".join(righe),
+    )
+
+
+def excel_lista(lavori_stampa):
+    """File Excel (bytes) con la lista di lavoro di una macchina."""
+    return esporta({"Lista lavori": lavori_stampa})
+
+
+def excel_multifoglio(liste):
+    """File Excel (bytes) con un foglio per macchina."""
+    return esporta(liste)
+
+
+def zip_liste(liste, mostra_ritardi=True, ritardi=None, processi=8):
+    """Archivio ZIP (bytes) con HTML ed Excel di ogni macchina, generati in parallelo."""
+    ritardi = ritardi or {}
+    generata_il = datetime.now()
+
+    def genera(voce):
+        macchina, lavori = voce
+        return (
+            nome_file(macchina),
+            html_lista(macchina, lavori, mostra_ritardi, ritardi.get(macchina), generata_il),
+            excel_lista(lavori),
+        )
+
+    output = io.BytesIO()
+    with ThreadPoolExecutor(max_workers=processi) as pool, \
+            zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archivio:
+        for nome, documento, excel in pool.map(genera, liste.items()):
+            archivio.writestr(f"{nome}.html", documento)
+            archivio.writestr(f"{nome}.xlsx", excel)
+    return output.getvalue()
@@ -0,0 +1,257 @@
+"""Ottimizzazione della sequenza di pianificazione.
+
+Il pianificatore sceglie tra le operazioni pronte secondo una chiave di
+sequenza. L'ottimizzatore parte dalla chiave greedy (Priorità → Codice pezzo
+→ Tipo operazione), prova le regole di dispatching EDD e ATC e poi migliora la
+migliore con una ricerca tabu: ogni mossa anticipa un'operazione in ritardo
+(o un suo predecessore) nella coda della sua macchina. I candidati di ogni
+iterazione vengono valutati in parallelo in un pool di processi, entro un
+budget di tempo.
+
+Il costo minimizzato è il ritardo pesato (ore lavorative oltre la data
+richiesta, pesate con 1/Priorità) più `peso_makespan` × makespan in ore.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from calendario import WorkCalendar
+from dipendenze import GrafoDipendenze
+from pianificatore import GRUPPI_MACCHINE, Scheduler, data_richiesta_per_codice, prepara_dati
+
+PESO_MAKESPAN = 1.0
+DURATA_TABU = 7  # iterazioni in cui un'operazione appena spostata non può essere rimossa
+K_ATC = 2.0  # parametro di scala della regola ATC
+
+
+@dataclass
+class Valutazione:
+    costo: float
+    ritardo_pesato: float
+    makespan: float  # ore lavorative dall'inizio pianificazione
+    operazioni_in_ritardo: int
+    inizi_ore: np.ndarray
+    ritardi_ore: np.ndarray
+
+
+@dataclass
+class Soluzione:
+    """Migliore soluzione trovata fino a un certo istante della ricerca."""
+
+    chiave: np.ndarray
+    valutazione: Valutazione
+    origine: str  # "Greedy", "EDD", "ATC" o "Tabu"
+    iterazione: int
+    secondi: float
+
+
+class ContestoValutazione:
+    """Dati costanti del problema, preparati una volta per processo."""
+
+    def __init__(self, df, calendar, groups, inizio, peso_makespan=PESO_MAKESPAN):
+        cal = calendar or WorkCalendar()
+        self.df = prepara_dati(df)
+        self.scheduler = Scheduler(cal, groups)
+        self.grafo = GrafoDipendenze(self.df)
+        self.operazioni = self.scheduler.operazioni(self.df)
+        self.tempi = self.operazioni.durate
+        self.inizio_ore = cal.a_ore(cal.inizio_pianificazione(inizio))
+        self.peso_makespan = peso_makespan
+
+        priorita = self.df["Priorità"].to_numpy(dtype=float)
+        self.pesi = np.where(priorita > 0, 1.0 / np.maximum(priorita, 1e-9), 1.0)
+
+        # Scadenza: fine del giorno richiesto, in ore lavorative (come "Ritardo (giorni)")
+        richieste = pd.to_datetime(pd.Series(data_richiesta_per_codice(self.df)))
+        self.scadenze_ore = np.array([
+            cal.a_ore((d.normalize() + pd.Timedelta(days=1)).to_pydatetime()) if pd.notna(d) else math.inf
+            for d in richieste
+        ])
+
+    def valuta(self, chiave):
+        ordine = self.grafo.ordine_topologico(chiave)
+        inizi_ore, fini = self.scheduler.calcola_tempi(ordine, self.grafo, self.operazioni, self.inizio_ore)
+        ritardi = np.maximum(fini - self.scadenze_ore, 0.0)
+        ritardo_pesato = float(self.pesi @ ritardi)
+        makespan = float(fini.max() - self.inizio_ore) if len(fini) else 0.0
+        return Valutazione(
+            costo=ritardo_pesato + self.peso_makespan * makespan,
+            ritardo_pesato=ritardo_pesato,
+            makespan=makespan,
+            operazioni_in_ritardo=int((ritardi > 0).sum()),
+            inizi_ore=inizi_ore,
+            ritardi_ore=ritardi,
+        )
+
+
+# --- Stato dei processi del pool ---
+_contesto = None
+
+
+def _inizializza_processo(df, calendar, groups, inizio, peso_makespan):
+    global _contesto
+    _contesto = ContestoValutazione(df, calendar, groups, inizio, peso_makespan)
+
+
+def _valuta_nel_processo(chiave):
+    return _contesto.valuta(chiave)
+
+
+def _in_ranghi(valori):
+    """Converte una chiave qualunque nei ranghi 0..n-1 (a parità, vince la posizione)."""
+    ordine = np.lexsort((np.arange(len(valori)), valori))
+    ranghi = np.empty(len(valori), dtype=np.float64)
+    ranghi[ordine] = np.arange(len(valori))
+    return ranghi
+
+
+class Ottimizzatore:
+    """Ricerca di una sequenza a ritardo pesato e makespan minimi."""
+
+    def __init__(self, df, calendar=None, groups=None, inizio=None, processi=None,
+                 peso_makespan=PESO_MAKESPAN, vicini=None, seme=0):
+        self.calendar = calendar or WorkCalendar()
+        self.groups = GRUPPI_MACCHINE if groups is None else groups
+        self.inizio = inizio
+        self.df = df
+        self.processi = processi or max(1, min(os.cpu_count() or 1, 8))
+        self.vicini = vicini or max(4, 2 * self.processi)
+        self.peso_makespan = peso_makespan
+        self._random = random.Random(seme)
+        self.contesto = ContestoValutazione(df, self.calendar, self.groups, inizio, peso_makespan)
+
+    # --- Regole di dispatching ---
+    def chiave_greedy(self):
+        return np.arange(len(self.contesto.df), dtype=np.float64)
+
+    def chiave_edd(self):
+        """Earliest Due Date: prima le scadenze più vicine, poi la priorità."""
+        ctx = self.contesto
+        return _in_ranghi(ctx.scadenze_ore + ctx.df["Priorità"].to_numpy(dtype=float) * 1e-3)
+
+    def chiave_atc(self):
+        """Apparent Tardiness Cost (statico, calcolato all'inizio pianificazione)."""
+        ctx = self.contesto
+        durate = np.maximum(np.asarray(ctx.tempi, dtype=float), 1e-3)
+        media = durate.mean() if len(durate) else 1.0
+        margine = np.maximum(ctx.scadenze_ore - durate - ctx.inizio_ore, 0.0)
+        indice = ctx.pesi / durate * np.exp(-np.minimum(margine / (K_ATC * media), 700))
+        return _in_ranghi(-indice)
+
+    # --- Ricerca ---
+    def _code(self, valutazione):
+        """Operazioni di ogni risorsa ordinate per inizio, e posizione di ognuna nella coda."""
+        code = {}
+        operazioni = self.contesto.operazioni
+        prima_risorsa = [rr[0] for rr in operazioni.risorse_macchina]
+        for i, m in enumerate(operazioni.macchina.tolist()):
+            code.setdefault(prima_risorsa[m], []).append(i)
+        posizioni = {}
+        for risorsa, ops in code.items():
+            ops.sort(key=lambda i: valutazione.inizi_ore[i])
+            for p, i in enumerate(ops):
+                posizioni[i] = (risorsa, p)
+        return code, posizioni
+
+    def _mossa(self, chiave, valutazione, code, posizioni, tabu, iterazione):
+        """Anticipa un'operazione (in ritardo, se ce ne sono) nella coda della sua risorsa."""
+        ctx = self.contesto
+        n = len(chiave)
+        ritardi = valutazione.ritardi_ore * ctx.pesi
+        in_ritardo = np.flatnonzero(ritardi > 0)
+        if len(in_ritardo) and self._random.random() < 0.8:
+            i = int(self._random.choices(in_ritardo, weights=ritardi[in_ritardo])[0])
+            predecessori = ctx.grafo.predecessori[i]
+            if predecessori and self._random.random() < 0.3:
+                i = max(predecessori, key=lambda j: valutazione.inizi_ore[j])
+        else:
+            i = self._random.randrange(n)
+
+        risorsa, p = posizioni[i]
+        if p == 0:
+            return None
+        j = code[risorsa][max(0, p - self._random.randint(1, 4))]
+        nuova = chiave.copy()
+        nuova[i] = chiave[j] - 0.5
+        return _in_ranghi(nuova), i, tabu.get(i, -1) >= iterazione
+
+    def esegui(self, budget=30.0, iterazioni=None):
+        """Generatore: restituisce una `Soluzione` ogni volta che il migliore costo scende.
+
+        La prima soluzione restituita è sempre il piano greedy attuale.
+        """
+        avvio = time.monotonic()
+        scadenza = avvio + budget
+        pool = None
+        if self.processi > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=self.processi,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_inizializza_processo,
+                initargs=(self.df, self.calendar, self.groups, self.inizio, self.peso_makespan),
+            )
+
+        def valuta_tutte(chiavi):
+            if pool is None:
+                return [self.contesto.valuta(c) for c in chiavi]
+            return list(pool.map(_valuta_nel_processo, chiavi))
+
+        try:
+            corrente = self.chiave_greedy()
+            valutazione_corrente = self.contesto.valuta(corrente)
+            migliore = Soluzione(corrente, valutazione_corrente, "Greedy", 0, time.monotonic() - avvio)
+            yield migliore
+
+            for nome, chiave in (("EDD", self.chiave_edd()), ("ATC", self.chiave_atc())):
+                valutazione = self.contesto.valuta(chiave)
+                if valutazione.costo < migliore.valutazione.costo:
+                    corrente, valutazione_corrente = chiave, valutazione
+                    migliore = Soluzione(chiave, valutazione, nome, 0, time.monotonic() - avvio)
+                    yield migliore
+
+            tabu = {}
+            iterazione = 0
+            while time.monotonic() < scadenza and (iterazioni is None or iterazione < iterazioni):
+                iterazione += 1
+                code, posizioni = self._code(valutazione_corrente)
+                mosse = [
+                    m for m in (
+                        self._mossa(corrente, valutazione_corrente, code, posizioni, tabu, iterazione)
+                        for _ in range(self.vicini)
+                    ) if m is not None
+                ]
+                if not mosse:
+                    continue
+                valutazioni = valuta_tutte([m[0] for m in mosse])
+
+                # Miglior vicino non tabu (o tabu ma migliore dell'ottimo: criterio di aspirazione)
+                scelta = None
+                for (chiave, operazione, vietata), valutazione in zip(mosse, valutazioni):
+                    if vietata and valutazione.costo >= migliore.valutazione.costo:
+                        continue
+                    if scelta is None or valutazione.costo < scelta[1].costo:
+                        scelta = (chiave, valutazione, operazione)
+                if scelta is None:
+                    continue
+
+                corrente, valutazione_corrente, operazione = scelta
+                tabu[operazione] = iterazione + DURATA_TABU
+                if valutazione_corrente.costo < migliore.valutazione.costo - 1e-9:
+                    migliore = Soluzione(
+                        corrente, valutazione_corrente, "Tabu", iterazione, time.monotonic() - avvio
+                    )
+                    yield migliore
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def piano(self, soluzione):
+        """Piano completo corrispondente a una soluzione."""
+        return Scheduler(self.calendar, self.groups).pianifica(self.df, self.inizio, soluzione.chiave)
@@ -0,0 +1,136 @@
+"""Partizione delle operazioni in componenti indipendenti, pianificate in parallelo.
+
+Due operazioni si influenzano solo se occupano una risorsa in comune
+(macchina o gruppo di macchine esclusive) o sono collegate da una
+dipendenza. Le componenti connesse del grafo risorse + dipendenze si possono
+quindi pianificare separatamente, ognuna con la sua parte dell'ordine di
+pianificazione: i tempi ottenuti sono esattamente quelli del piano unico.
+Le componenti vengono raggruppate in parti di dimensione simile, una per
+processo, e i risultati riscritti nelle posizioni originali.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+import heapq
+import multiprocessing
+import os
+
+import numpy as np
+
+MIN_OPERAZIONI_PARALLELO = 50_000  # sotto, l'avvio dei processi costa più del calcolo
+
+
+class Parte:
+    """Sottoinsieme indipendente di operazioni, con indici locali.
+
+    `posizioni` sono le posizioni originali delle operazioni, `ordine` e
+    `predecessori` usano gli indici locali (0..len(posizioni)-1). Fa anche
+    da grafo per `Scheduler.calcola_tempi`, che ne usa solo i predecessori.
+    """
+
+    __slots__ = ("posizioni", "ordine", "operazioni", "predecessori")
+
+    def __init__(self, posizioni, ordine, operazioni, predecessori):
+        self.posizioni = posizioni
+        self.ordine = ordine
+        self.operazioni = operazioni
+        self.predecessori = predecessori
+
+
+def componenti(operazioni, grafo):
+    """Componente connessa di ogni operazione, numerate in ordine di prima operazione."""
+    padre = list(range(len(operazioni.nomi_risorse)))
+
+    def radice(r):
+        while padre[r] != r:
+            padre[r] = padre[padre[r]]
+            r = padre[r]
+        return r
+
+    def unisci(a, b):
+        a, b = radice(a), radice(b)
+        if a != b:
+            padre[max(a, b)] = min(a, b)
+
+    for risorse in operazioni.risorse_macchina:
+        for r in risorse[1:]:
+            unisci(risorse[0], r)
+
+    # Le dipendenze collegano le macchine delle due operazioni: bastano le coppie distinte
+    n = operazioni.n
+    quanti = np.fromiter((len(p) for p in grafo.predecessori), dtype=np.int64, count=n)
+    da = np.fromiter(chain.from_iterable(grafo.predecessori), dtype=np.int64, count=int(quanti.sum()))
+    a = np.repeat(np.arange(n), quanti)
+    macchine = len(operazioni.macchine)
+    for coppia in np.unique(operazioni.macchina[da] * macchine + operazioni.macchina[a]).tolist():
+        unisci(operazioni.risorse_macchina[coppia // macchine][0], operazioni.risorse_macchina[coppia % macchine][0])
+
+    per_macchina = np.array([radice(rr[0]) for rr in operazioni.risorse_macchina], dtype=np.int64)
+    _, prime, componente = np.unique(per_macchina[operazioni.macchina], return_index=True, return_inverse=True)
+    numerazione = np.empty(len(prime), dtype=np.int64)
+    numerazione[np.argsort(prime, kind="stable")] = np.arange(len(prime))
+    return numerazione[componente]
+
+
+def suddividi(ordine, grafo, operazioni, parti):
+    """Raggruppa le componenti in al più `parti` `Parte` di dimensione simile.
+
+    Le componenti, dalla più grande, vanno alla parte meno carica: la
+    suddivisione dipende solo dai dati, non dal numero di processi disponibili
+    al momento.
+    """
+    componente = componenti(operazioni, grafo)
+    dimensioni = np.bincount(componente)
+    parti = min(parti, len(dimensioni))
+    carichi = [(0, p) for p in range(parti)]
+    parte_di = np.empty(len(dimensioni), dtype=np.int64)
+    for c in np.lexsort((np.arange(len(dimensioni)), -dimensioni)).tolist():
+        carico, p = heapq.heappop(carichi)
+        parte_di[c] = p
+        heapq.heappush(carichi, (carico + int(dimensioni[c]), p))
+    parte = parte_di[componente]
+
+    sequenza = np.asarray(ordine, dtype=np.int64)
+    parte_sequenza = parte[sequenza]
+    locale = np.empty(operazioni.n, dtype=np.int64)
+    risultato = []
+    for p in range(parti):
+        posizioni = np.flatnonzero(parte == p)
+        locale[posizioni] = np.arange(len(posizioni))
+        indici = locale.tolist()
+        risultato.append(Parte(
+            posizioni,
+            locale[sequenza[parte_sequenza == p]].tolist(),
+            operazioni.sottoinsieme(posizioni),
+            [tuple(indici[j] for j in grafo.predecessori[i]) for i in posizioni.tolist()],
+        ))
+    return risultato
+
+
+def _calcola_parte(scheduler, parte, inizio_ore):
+    return scheduler.calcola_tempi(parte.ordine, parte, parte.operazioni, inizio_ore)
+
+
+def calcola_tempi_parallelo(scheduler, ordine, grafo, operazioni, inizio_ore, processi=None,
+                            minimo=MIN_OPERAZIONI_PARALLELO):
+    """Come `scheduler.calcola_tempi`, ma con le componenti indipendenti in un pool di processi.
+
+    Si resta in un solo processo sotto `minimo` operazioni, con una sola
+    componente, o se si è già in un processo figlio (pool degli scenari,
+    del servizio o della riga di comando).
+    """
+    processi = processi or os.cpu_count() or 1
+    if processi <= 1 or operazioni.n < minimo or multiprocessing.parent_process() is not None:
+        return scheduler.calcola_tempi(ordine, grafo, operazioni, inizio_ore)
+    parti = suddividi(ordine, grafo, operazioni, processi)
+    if len(parti) < 2:
+        return scheduler.calcola_tempi(ordine, grafo, operazioni, inizio_ore)
+
+    inizi = np.empty(operazioni.n, dtype=np.float64)
+    fini = np.empty(operazioni.n, dtype=np.float64)
+    with ProcessPoolExecutor(max_workers=len(parti), mp_context=multiprocessing.get_context("spawn")) as pool:
+        for parte, (inizi_parte, fini_parte) in zip(
+            parti, pool.map(_calcola_parte, repeat(scheduler), parti, repeat(inizio_ore))
+        ):
+            inizi[parte.posizioni] = inizi_parte
+            fini[parte.posizioni] = fini_parte
+    return inizi, fini
@@ -0,0 +1,125 @@
+"""Percorso critico e slack delle operazioni di un piano.
+
+La rete unisce le dipendenze tra codici pezzo e la sequenza delle code
+risorsa del piano (ogni operazione attende la precedente sulla sua macchina
+o gruppo): in ordine di rango del `Piano` è topologica, quindi bastano una
+passata in avanti e una all'indietro, in tempo lineare negli archi.
+
+- Inizio minimo: il più presto possibile con la sequenza del piano, senza
+  fermi macchina né buchi.
+- Inizio massimo: il più tardi possibile senza superare la data richiesta
+  (fine del giorno, come per i ritardi) di nessuna operazione a valle; senza
+  data richiesta vale la fine del piano.
+- Slack: differenza in ore lavorative; zero o negativo indica un'operazione
+  critica, che non può ritardare senza spostare (o che già sposta) una
+  consegna.
+
+La catena critica di una commessa parte dalla sua ultima operazione e
+risale lungo il predecessore che ne determina l'inizio minimo: può
+attraversare operazioni di altre commesse in coda sulle stesse macchine.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+_EPS_ORE = 1e-6
+
+COLONNE_CRITICHE = ["Inizio minimo", "Inizio massimo", "Slack (ore)", "Critica"]
+
+
+@dataclass
+class PercorsoCritico:
+    tempi: pd.DataFrame  # COLONNE_CRITICHE, stesso indice del piano
+    riepilogo: pd.DataFrame  # una riga per commessa, dalla meno slack
+    vincolo: np.ndarray  # predecessore che determina l'inizio minimo, -1 se nessuno
+    ultime: dict  # commessa -> posizione della sua operazione che finisce per ultima
+
+    def catena(self, commessa):
+        """Posizioni della catena critica di `commessa`, dalla prima all'ultima operazione."""
+        catena = []
+        i = self.ultime.get(commessa, -1)
+        while i >= 0:
+            catena.append(i)
+            i = self.vincolo[i]
+        return catena[::-1]
+
+
+def _predecessori(piano):
+    """Predecessori nella rete: precedente in ogni coda risorsa e dipendenze in avanti nel rango."""
+    rango = piano.rango.tolist()
+    code = piano.coda_prec.tolist()
+    dipendenze = piano.grafo.predecessori
+    return [
+        [j for j in coda if j >= 0] + [j for j in dipendenze[i] if rango[j] < rango[i]]
+        for i, coda in enumerate(code)
+    ]
+
+
+def analizza(piano):
+    """Inizio minimo e massimo, slack e catene critiche per commessa del `Piano`."""
+    cal = piano.calendar
+    gantt_df = piano.gantt_df
+    n = len(piano.ordine)
+    durate = np.maximum(piano.ore, 0).tolist()
+    predecessori = _predecessori(piano)
+    sequenza = np.argsort(piano.rango).tolist()
+
+    # Passata in avanti: inizio minimo, predecessore che lo determina e lunghezza della catena
+    inizi = [0.0] * n
+    fini = [0.0] * n
+    vincolo = [-1] * n
+    lunghezza = [0] * n
+    ore_catena = [0.0] * n
+    for i in sequenza:
+        t, v = piano.inizio_ore, -1
+        for j in predecessori[i]:
+            if fini[j] > t:
+                t, v = fini[j], j
+        inizi[i] = t
+        fini[i] = t + durate[i]
+        vincolo[i] = v
+        lunghezza[i] = lunghezza[v] + 1 if v >= 0 else 1
+        ore_catena[i] = ore_catena[v] + durate[i] if v >= 0 else durate[i]
+
+    # Passata all'indietro dalle scadenze (fine del giorno richiesto, altrimenti fine del piano)
+    richiesta = gantt_df["Data richiesta"].to_numpy().astype("datetime64[D]")
+    manca = np.isnat(richiesta)
+    scadenze = np.full(n, max(fini, default=piano.inizio_ore))
+    scadenze[~manca] = cal.ore_inizio_giorni(richiesta[~manca] + np.timedelta64(1, "D"))
+    fini_massime = scadenze.tolist()
+    inizi_massimi = [0.0] * n
+    for i in reversed(sequenza):
+        inizio_massimo = fini_massime[i] - durate[i]
+        inizi_massimi[i] = inizio_massimo
+        for j in predecessori[i]:
+            if inizio_massimo < fini_massime[j]:
+                fini_massime[j] = inizio_massimo
+
+    inizi = np.array(inizi, dtype=np.float64)
+    inizi_massimi = np.array(inizi_massimi, dtype=np.float64)
+    slack = inizi_massimi - inizi
+    tempi = pd.DataFrame({
+        "Inizio minimo": cal.date_da_ore(inizi),
+        "Inizio massimo": cal.date_da_ore(inizi_massimi),
+        "Slack (ore)": slack.round(1),
+        "Critica": slack <= _EPS_ORE,
+    }, index=gantt_df.index)
+
+    # Catene critiche: dall'operazione che finisce per ultima, a ritroso lungo i vincoli
+    per_commessa = pd.DataFrame({"fine": fini, "slack": slack}).groupby(
+        gantt_df["Commessa"].astype(str).to_numpy(), sort=True
+    )
+    ultime = per_commessa["fine"].idxmax()
+    riepilogo = pd.DataFrame({
+        "Fine minima": cal.date_da_ore(np.array(fini)[ultime.to_numpy()], fine=True),
+        "Slack minimo (ore)": per_commessa["slack"].min().round(1).to_numpy(),
+        "Operazioni in catena": np.array(lunghezza)[ultime.to_numpy()],
+        "Ore in catena": np.array(ore_catena)[ultime.to_numpy()].round(1),
+    }, index=ultime.index.rename("Commessa"))
+    return PercorsoCritico(
+        tempi,
+        riepilogo.sort_values("Slack minimo (ore)", kind="stable"),
+        np.array(vincolo, dtype=np.int64),
+        {nome: int(i) for nome, i in ultime.items()},
+    )
@@ -0,0 +1,465 @@
+"""Motore di pianificazione della produzione, indipendente da Streamlit.
+
+Uso da script:
+
+    import pandas as pd
+    from pianificatore import plan
+
+    gantt_df = plan(pd.read_excel("ordini.xlsx"))
+"""
+import hashlib
+import heapq
+import math
+
+import numpy as np
+import pandas as pd
+
+from calendario import WorkCalendar
+from dipendenze import GrafoDipendenze
+from intervalli import IntervalliLiberi, primo_inizio_comune
+from partizione import calcola_tempi_parallelo
+from ritardi import aggiorna_ritardi, aggiungi_ritardi
+
+# --- Gruppi macchine che non possono lavorare insieme ---
+GRUPPI_MACCHINE = [
+    {"nome": "GruppoGornatiPontiggia", "macchine": ["Gornati", "Pontiggia"]},
+]
+
+# --- Priorità operazioni per ordinamento ---
+ORDINE_OPERAZIONI = {
+    "tornitura": 1,
+    "fresatura": 2,
+    "foratura": 2,
+}
+
+_EPS_ORE = 1e-6
+
+COLONNE_PIANO = [
+    "Commessa", "Codice pezzo", "Operazione", "Macchina", "Priorità",
+    "Inizio", "Fine", "Data richiesta", "Ritardo (giorni)", "In ritardo",
+]
+COLONNE_CATEGORIA = ["Commessa", "Codice pezzo", "Operazione", "Macchina"]
+
+
+def get_ordine_operazione(operazione):
+    """Restituisce l'ordine di priorità dell'operazione (1=prima, valori più alti=dopo)."""
+    if pd.isna(operazione):
+        return 999
+    operazione_lower = str(operazione).lower().strip()
+    for key, value in ORDINE_OPERAZIONI.items():
+        if key in operazione_lower:
+            return value
+    return 10
+
+
+def normalizza_colonne(df):
+    """Converte le colonne di input nei tipi attesi dal pianificatore."""
+    df = df.copy()
+
+    # --- Gestione colonne Dipendenza e Priorità ---
+    if "Dipendenza" not in df.columns:
+        df["Dipendenza"] = ""
+    df["Dipendenza"] = df["Dipendenza"].fillna("").astype(str)
+
+    if "Priorità" not in df.columns:
+        df["Priorità"] = 5
+    df["Priorità"] = pd.to_numeric(df["Priorità"], errors="coerce").fillna(5)
+
+    # --- Conversione colonne tempo ---
+    for col in ["Tempo unitario (h)", "Setup (h)"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    df["Quantità"] = pd.to_numeric(df["Quantità"], errors="coerce").fillna(1)
+    df["Data richiesta"] = pd.to_datetime(df["Data richiesta"], errors="coerce")
+    return df
+
+
+def prepara_dati(df):
+    """Normalizza le colonne di input e ordina le operazioni per la pianificazione."""
+    df = normalizza_colonne(df)
+
+    # --- Aggiunta colonna per ordinamento operazioni ---
+    df["_ordine_operazione"] = df["Operazione"].apply(get_ordine_operazione)
+
+    # --- Ordinamento del DataFrame ---
+    return df.sort_values(
+        by=["Priorità", "Codice pezzo", "_ordine_operazione"],
+        ascending=[True, True, True]
+    ).reset_index(drop=True)
+
+
+def durate_ore(df):
+    """Ore lavorative di ogni operazione: tempo unitario × quantità + setup."""
+    return (df["Tempo unitario (h)"] * df["Quantità"] + df["Setup (h)"]).to_numpy(dtype=np.float64)
+
+
+def data_richiesta_per_codice(df):
+    """Data richiesta di ogni riga presa dall'ultima riga dello stesso codice pezzo."""
+    codici, _ = pd.factorize(df["Codice pezzo"], use_na_sentinel=False)
+    ultima = np.zeros(codici.max() + 1 if len(codici) else 0, dtype=np.int64)
+    np.maximum.at(ultima, codici, np.arange(len(codici)))
+    return df["Data richiesta"].to_numpy()[ultima[codici]]
+
+
+class Operazioni:
+    """Operazioni di un DataFrame preparato in forma compatta, per il ciclo di pianificazione.
+
+    Le macchine sono codici interi (`macchina[i]` indicizza `macchine`), le
+    durate un array float64; le risorse (macchine e gruppi esclusivi) sono
+    numerate e associate una volta per macchina, non per operazione.
+    """
+
+    __slots__ = ("n", "durate", "macchina", "macchine", "nomi_risorse", "risorse_macchina")
+
+    def __init__(self, df, risorse_di):
+        self.n = len(df)
+        self.durate = durate_ore(df)
+        self.macchina, self.macchine = pd.factorize(df["Macchina"], use_na_sentinel=False)
+        indice_risorse = {}
+        self.risorse_macchina = [
+            tuple(indice_risorse.setdefault(r, len(indice_risorse)) for r in risorse_di(m))
+            for m in self.macchine
+        ]
+        self.nomi_risorse = list(indice_risorse)
+
+    def risorse(self, i):
+        """Indici delle risorse occupate dall'operazione `i`."""
+        return self.risorse_macchina[self.macchina[i]]
+
+    def sottoinsieme(self, posizioni):
+        """Operazioni alle `posizioni` indicate, con la stessa numerazione di macchine e risorse."""
+        parte = object.__new__(Operazioni)
+        parte.n = len(posizioni)
+        parte.durate = self.durate[posizioni]
+        parte.macchina = self.macchina[posizioni]
+        parte.macchine = self.macchine
+        parte.nomi_risorse = self.nomi_risorse
+        parte.risorse_macchina = self.risorse_macchina
+        return parte
+
+
+def gantt_da_tempi(df, inizi, fini):
+    """Piano (senza ritardi) con colonne di testo categoriche e date datetime64 passate senza copie."""
+    gantt_df = pd.DataFrame(
+        {col: pd.Categorical(df[col]) for col in COLONNE_CATEGORIA} | {"Priorità": df["Priorità"].to_numpy()},
+        index=df.index,
+    )
+    gantt_df["Inizio"] = inizi
+    gantt_df["Fine"] = fini
+    gantt_df["Data richiesta"] = data_richiesta_per_codice(df)
+    return gantt_df
+
+
+def versione_piano(df, calendar, groups, chiave=None, fermi=()):
+    """Identificativo breve del piano: cambia se cambiano input, calendario, gruppi, fermi o sequenza.
+
+    La data di inizio non ne fa parte: le modifiche manuali archiviate per
+    una versione restano valide nei giorni successivi (vedi `archivio`).
+    """
+    h = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(repr((calendar.firma(), groups)).encode())
+    if fermi:
+        h.update(repr([(m, str(a), str(b)) for m, a, b in fermi]).encode())
+    if chiave is not None:
+        h.update(np.asarray(chiave, dtype=np.float64).tobytes())
+    return h.hexdigest()[:12]
+
+
+class Piano:
+    """Piano calcolato, con le strutture che servono a ripianificarlo in modo incrementale.
+
+    Ogni risorsa (macchina, o gruppo di macchine esclusive) ha la sua coda di
+    operazioni in ordine di inizio; insieme al grafo delle dipendenze le code
+    permettono di individuare le sole operazioni a valle di una modifica.
+    I tempi interni sono ore lavorative cumulative del calendario.
+    """
+
+    def __init__(self, df, gantt_df, grafo, ordine, operazioni, inizi_ore, fini_ore, inizio_ore, calendar, versione):
+        self.df = df
+        self.gantt_df = gantt_df
+        self.grafo = grafo
+        self.ordine = ordine
+        self.operazioni = operazioni
+        self.ore = operazioni.durate
+        self.inizi_ore = inizi_ore
+        self.fini_ore = fini_ore
+        self.inizio_ore = inizio_ore
+        self.calendar = calendar
+        self.versione = versione
+
+        # Ordine per inizio (a parità, ordine di pianificazione): è topologico
+        # sia per le code risorsa sia per le dipendenze
+        n = len(ordine)
+        rango_pianificazione = np.empty(n, dtype=np.int64)
+        rango_pianificazione[np.asarray(ordine, dtype=np.int64)] = np.arange(n)
+        per_inizio = np.lexsort((rango_pianificazione, inizi_ore))
+        self.rango = np.empty(n, dtype=np.int64)
+        self.rango[per_inizio] = np.arange(n)
+
+        # Code risorsa come matrici (operazione × risorsa della sua macchina) di
+        # precedente e successiva nella coda, -1 se non c'è
+        larghezza = max((len(rr) for rr in operazioni.risorse_macchina), default=1)
+        risorse = np.full((len(operazioni.risorse_macchina), larghezza), -1, dtype=np.int64)
+        for m, rr in enumerate(operazioni.risorse_macchina):
+            risorse[m, :len(rr)] = rr
+        self.coda_prec = np.full((n, larghezza), -1, dtype=np.int64)
+        self.coda_succ = np.full((n, larghezza), -1, dtype=np.int64)
+        if n:
+            ops = np.repeat(np.arange(n), larghezza)
+            posti = np.tile(np.arange(larghezza), n)
+            risorsa = risorse[operazioni.macchina[ops], posti]
+            validi = risorsa >= 0
+            ops, posti, risorsa = ops[validi], posti[validi], risorsa[validi]
+            coda = np.lexsort((self.rango[ops], risorsa))
+            ops, posti, risorsa = ops[coda], posti[coda], risorsa[coda]
+            stessa = risorsa[1:] == risorsa[:-1]
+            self.coda_prec[ops[1:][stessa], posti[1:][stessa]] = ops[:-1][stessa]
+            self.coda_succ[ops[:-1][stessa], posti[:-1][stessa]] = ops[1:][stessa]
+
+    def _successori(self, i):
+        yield from (j for j in self.coda_succ[i].tolist() if j >= 0)
+        # Le dipendenze all'indietro nell'ordine sono quelle ignorate per rompere un ciclo
+        yield from (j for j in self.grafo.successori[i] if self.rango[j] > self.rango[i])
+
+    def ripianifica(self, fissate, gantt_df=None):
+        """Ripropaga a valle le date fissate a mano.
+
+        `fissate` associa la posizione di un'operazione alla coppia (inizio,
+        fine) scelta dal pianificatore (posizione ed etichetta di riga
+        coincidono nel piano). Vengono ricalcolate solo le operazioni
+        raggiungibili lungo le code risorsa e le dipendenze, mantenendo
+        l'ordine delle code e fermandosi dove le date non cambiano.
+        Restituisce il piano aggiornato (copia di `gantt_df`, di default il
+        piano originale) e l'insieme delle posizioni spostate.
+        """
+        cal = self.calendar
+        inizi = {}
+        fini = {}
+        fini_ore = {}
+        for i, (inizio, fine) in fissate.items():
+            inizi[i] = pd.Timestamp(inizio)
+            fini[i] = pd.Timestamp(fine)
+            if fini[i] < inizi[i]:
+                raise ValueError(
+                    f"Riga {i}: la fine {fini[i]:%d/%m/%Y %H:%M} precede l'inizio {inizi[i]:%d/%m/%Y %H:%M}"
+                )
+            fini_ore[i] = cal.a_ore(fini[i])
+
+        def fine_ore_di(j):
+            return fini_ore[j] if j in fini_ore else self.fini_ore[j]
+
+        da_fare = []
+        in_coda = set()
+
+        def accoda_successori(i):
+            for j in self._successori(i):
+                if j not in fissate and j not in in_coda:
+                    in_coda.add(j)
+                    heapq.heappush(da_fare, (self.rango[j], j))
+
+        for i in fissate:
+            accoda_successori(i)
+
+        spostate = set()
+        while da_fare:
+            _, i = heapq.heappop(da_fare)
+            in_coda.discard(i)
+
+            t = self.inizio_ore
+            for j in self.coda_prec[i].tolist():
+                if j >= 0:
+                    t = max(t, fine_ore_di(j))
+            for j in self.grafo.predecessori[i]:
+                if self.rango[j] < self.rango[i]:
+                    t = max(t, fine_ore_di(j))
+            fine_t = t + max(self.ore[i], 0)
+
+            if abs(t - self.inizi_ore[i]) < _EPS_ORE and abs(fine_t - self.fini_ore[i]) < _EPS_ORE:
+                continue
+            inizi[i] = pd.Timestamp(cal.da_ore(t))
+            fini[i] = pd.Timestamp(cal.da_ore(fine_t, fine=True)) if fine_t > t else inizi[i]
+            fini_ore[i] = fine_t
+            spostate.add(i)
+            accoda_successori(i)
+
+        risultato = (self.gantt_df if gantt_df is None else gantt_df).copy()
+        toccate = [i for i in sorted(set(fissate) | spostate) if i in risultato.index]
+        if toccate:
+            risultato.loc[toccate, "Inizio"] = [inizi[i] for i in toccate]
+            risultato.loc[toccate, "Fine"] = [fini[i] for i in toccate]
+            aggiorna_ritardi(risultato, toccate, cal)
+        return risultato, spostate
+
+
+class Scheduler:
+    """Pianificatore a passata singola in ordine topologico.
+
+    Ogni operazione viene inserita nel primo intervallo libero abbastanza
+    lungo della sua macchina (e di tutti i gruppi esclusivi che la
+    contengono) dopo la fine delle sue dipendenze: i buchi lasciati dalle
+    attese sulle dipendenze vengono riempiti dalle operazioni successive.
+
+    `fermi` è una sequenza di fermi macchina (macchina, inizio, fine): in
+    quegli intervalli la macchina (e i gruppi che la contengono) non lavora.
+    `processi` limita i processi con cui `pianifica` calcola in parallelo le
+    componenti indipendenti (vedi `partizione`; default: numero di CPU).
+    """
+
+    def __init__(self, calendar=None, groups=None, fermi=(), processi=None):
+        self.calendar = calendar or WorkCalendar()
+        self.groups = GRUPPI_MACCHINE if groups is None else groups
+        self.fermi = tuple(fermi)
+        self.processi = processi
+
+    def plan(self, df, inizio=None):
+        """Pianifica le operazioni di `df` e restituisce il piano come DataFrame."""
+        return self.pianifica(df, inizio).gantt_df
+
+    def risorse_di(self, macchina):
+        """Risorse da occupare per lavorare su `macchina`: i suoi gruppi esclusivi, o la macchina stessa."""
+        gruppi = [g["nome"] for g in self.groups if macchina in g["macchine"]]
+        return gruppi or [macchina]
+
+    def operazioni(self, df):
+        """Rappresentazione compatta (`Operazioni`) delle righe di `df`."""
+        return Operazioni(df, self.risorse_di)
+
+    def code_indipendenti(self, ordine, grafo, operazioni, bloccate=()):
+        """Operazioni pianificabili in blocco, raggruppate per macchina.
+
+        Su una macchina fuori dai gruppi e senza fermi (risorse `bloccate`),
+        le operazioni senza dipendenze che in `ordine` precedono la prima con
+        dipendenze vengono messe una dopo l'altra da `inizio_ore`, senza
+        buchi: i loro tempi sono la somma cumulata delle durate. Restituisce
+        una lista di (risorsa, array delle posizioni in ordine di pianificazione).
+        """
+        n = operazioni.n
+        if not n:
+            return []
+        macchine_per_risorsa = {}
+        for rr in operazioni.risorse_macchina:
+            for r in rr:
+                macchine_per_risorsa[r] = macchine_per_risorsa.get(r, 0) + 1
+        semplice = np.array([
+            len(rr) == 1 and macchine_per_risorsa[rr[0]] == 1 and rr[0] not in bloccate
+            for rr in operazioni.risorse_macchina
+        ])
+        if not semplice.any():
+            return []
+
+        sequenza = np.asarray(ordine, dtype=np.int64)
+        macchina = operazioni.macchina[sequenza]
+        con_dipendenze = np.fromiter((len(p) > 0 for p in grafo.predecessori), dtype=bool, count=n)[sequenza]
+        prima_dipendenza = np.full(len(operazioni.macchine), n, dtype=np.int64)
+        np.minimum.at(prima_dipendenza, macchina[con_dipendenze], np.flatnonzero(con_dipendenze))
+        veloci = semplice[macchina] & (np.arange(n) < prima_dipendenza[macchina])
+
+        sequenza, macchina = sequenza[veloci], macchina[veloci]
+        per_macchina = np.argsort(macchina, kind="stable")
+        sequenza, macchina = sequenza[per_macchina], macchina[per_macchina]
+        tagli = np.flatnonzero(macchina[1:] != macchina[:-1]) + 1
+        return [
+            (operazioni.risorse_macchina[gruppo[0]][0], posizioni)
+            for gruppo, posizioni in zip(np.split(macchina, tagli), np.split(sequenza, tagli))
+            if len(posizioni)
+        ]
+
+    def calcola_tempi(self, ordine, grafo, operazioni, inizio_ore, in_blocco=True):
+        """Assegna inizio e fine (in ore lavorative) a ogni operazione, seguendo `ordine`.
+
+        Le code senza vincoli (`code_indipendenti`) sono calcolate in blocco,
+        salvo con `in_blocco=False` (riferimento per le verifiche); le altre
+        operazioni una alla volta. Restituisce due array float64; le fini
+        delle operazioni non ancora pianificate restano NaN durante il ciclo.
+        """
+        liberi = [IntervalliLiberi(inizio_ore) for _ in operazioni.nomi_risorse]
+        indice_risorse = {r: k for k, r in enumerate(operazioni.nomi_risorse)}
+        bloccate = set()
+        for macchina, inizio, fine in self.fermi:
+            da, a = self.calendar.a_ore(inizio), self.calendar.a_ore(fine)
+            for r in self.risorse_di(macchina):
+                if r in indice_risorse:
+                    liberi[indice_risorse[r]].blocca(da, a)
+                    bloccate.add(indice_risorse[r])
+
+        durate = np.maximum(operazioni.durate, 0)
+        inizi = np.zeros(operazioni.n, dtype=np.float64)
+        fini = np.full(operazioni.n, math.nan)
+        veloci = np.zeros(operazioni.n, dtype=bool)
+        code = self.code_indipendenti(ordine, grafo, operazioni, bloccate) if in_blocco else []
+        for risorsa, posizioni in code:
+            # Somma sequenziale come nel ciclo, per avere gli stessi arrotondamenti
+            tempi = np.cumsum(np.concatenate(([inizio_ore], durate[posizioni])))
+            inizi[posizioni] = tempi[:-1]
+            fini[posizioni] = tempi[1:]
+            veloci[posizioni] = True
+            liberi[risorsa].occupa(inizio_ore, tempi[-1])
+        if veloci.any():
+            ordine = [i for i in ordine if not veloci[i]]
+
+        # Nel ciclo si usano liste Python (accesso per elemento più rapido), copiate alla fine negli array
+        durate = durate.tolist()
+        insiemi_macchina = [[liberi[r] for r in rr] for rr in operazioni.risorse_macchina]
+        macchina = operazioni.macchina.tolist()
+        predecessori = grafo.predecessori
+        inizi = inizi.tolist()
+        fini = fini.tolist()
+
+        for i in ordine:
+            durata = durate[i]
+
+            # Gestione dipendenze: attende la fine dei predecessori già pianificati (NaN > t è falso)
+            t = inizio_ore
+            for j in predecessori[i]:
+                if fini[j] > t:
+                    t = fini[j]
+
+            # Primo buco libero su macchina e gruppi (Gornati-Pontiggia)
+            insiemi = insiemi_macchina[macchina[i]]
+            t = primo_inizio_comune(insiemi, t, durata)
+            for insieme in insiemi:
+                insieme.occupa(t, t + durata)
+
+            inizi[i] = t
+            fini[i] = t + durata
+
+        return np.array(inizi, dtype=np.float64), np.array(fini, dtype=np.float64)
+
+    def pianifica(self, df, inizio=None, chiave=None):
+        """Pianifica le operazioni di `df` e restituisce il `Piano` completo.
+
+        `chiave` (opzionale) è la sequenza con cui scegliere tra le operazioni
+        pronte, allineata alle righe di `prepara_dati(df)`; di default si usa
+        l'ordine Priorità → Codice pezzo → Tipo operazione.
+        """
+        df = prepara_dati(df)
+        cal = self.calendar
+
+        grafo = GrafoDipendenze(df)
+        ordine = grafo.ordine_topologico(chiave)
+
+        operazioni = self.operazioni(df)
+        inizio_ore = cal.a_ore(cal.inizio_pianificazione(inizio))
+        inizi_ore, fini_ore = calcola_tempi_parallelo(self, ordine, grafo, operazioni, inizio_ore, self.processi)
+
+        inizi = cal.date_da_ore(inizi_ore)
+        fini = np.where(fini_ore > inizi_ore, cal.date_da_ore(fini_ore, fine=True), inizi)
+
+        gantt_df = gantt_da_tempi(df, inizi, fini)
+        versione = versione_piano(df, cal, self.groups, chiave, self.fermi)
+        gantt_df.attrs["avvisi"] = grafo.avvisi(df)
+        gantt_df.attrs["versione"] = versione
+
+        # --- Calcolo ritardi rispetto alla data richiesta ---
+        gantt_df = aggiungi_ritardi(gantt_df, cal)
+
+        return Piano(df, gantt_df, grafo, ordine, operazioni, inizi_ore, fini_ore, inizio_ore, cal, versione)
+
+
+def plan(df, calendar=None, groups=None, inizio=None):
+    """Pianifica `df` con il calendario e i gruppi macchine indicati."""
+    return Scheduler(calendar, groups).plan(df, inizio)
+
+
+def pianifica(df, calendar=None, groups=None, inizio=None, chiave=None, fermi=(), processi=None):
+    """Come `plan`, ma restituisce il `Piano` che consente la ripianificazione incrementale."""
+    return Scheduler(calendar, groups, fermi, processi).pianifica(df, inizio, chiave)
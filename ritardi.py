@@ -0,0 +1,68 @@
+"""Calcolo vettoriale dei ritardi rispetto alla data richiesta."""
+import numpy as np
+import pandas as pd
+
+from calendario import WorkCalendar
+
+
+def ritardo_giorni(fine, richiesta, calendario=None):
+    """Giorni lavorativi di ritardo, colonna per colonna.
+
+    Conta i giorni lavorativi del calendario (weekend e festività esclusi)
+    nell'intervallo (data richiesta, giorno di fine]; 0 se la data richiesta
+    manca o se l'operazione finisce in tempo.
+    """
+    calendario = calendario or WorkCalendar()
+    fine_giorno = pd.to_datetime(pd.Series(fine)).to_numpy().astype("datetime64[D]")
+    richiesta_giorno = pd.to_datetime(pd.Series(richiesta)).to_numpy().astype("datetime64[D]")
+
+    validi = ~(np.isnat(fine_giorno) | np.isnat(richiesta_giorno))
+    validi[validi] = fine_giorno[validi] > richiesta_giorno[validi]
+
+    giorni = np.zeros(len(fine_giorno), dtype=np.int64)
+    uno = np.timedelta64(1, "D")
+    giorni[validi] = np.busday_count(
+        richiesta_giorno[validi] + uno, fine_giorno[validi] + uno, busdaycal=calendario.busdaycal
+    )
+    return giorni
+
+
+def aggiungi_ritardi(gantt_df, calendario=None):
+    """Aggiunge (o ricalcola) le colonne "Ritardo (giorni)" e "In ritardo"."""
+    gantt_df["Ritardo (giorni)"] = ritardo_giorni(gantt_df["Fine"], gantt_df["Data richiesta"], calendario)
+    gantt_df["In ritardo"] = gantt_df["Ritardo (giorni)"] > 0
+    return gantt_df
+
+
+def aggiorna_ritardi(gantt_df, etichette, calendario=None):
+    """Ricalcola i ritardi solo per le righe `etichette` (modifica `gantt_df` sul posto)."""
+    etichette = list(etichette)
+    if etichette:
+        giorni = ritardo_giorni(
+            gantt_df.loc[etichette, "Fine"], gantt_df.loc[etichette, "Data richiesta"], calendario
+        )
+        gantt_df.loc[etichette, "Ritardo (giorni)"] = giorni
+        gantt_df.loc[etichette, "In ritardo"] = giorni > 0
+    return gantt_df
+
+
+def riepilogo_ritardi(gantt_df, per):
+    """Statistiche di ritardo raggruppate per `per` ("Commessa", "Macchina", ...).
+
+    Restituisce un DataFrame indicizzato per gruppo con numero operazioni,
+    operazioni in ritardo, ritardo medio (sulle sole operazioni in ritardo)
+    e ritardo massimo.
+    """
+    ritardo_se_tardi = gantt_df["Ritardo (giorni)"].where(gantt_df["In ritardo"])
+    return pd.DataFrame({
+        per: gantt_df[per],
+        "Operazioni": 1,
+        "In ritardo": gantt_df["In ritardo"].astype(int),
+        "Ritardo medio (giorni)": ritardo_se_tardi,
+        "Ritardo massimo (giorni)": gantt_df["Ritardo (giorni)"],
+    }).groupby(per, sort=True).agg({
+        "Operazioni": "sum",
+        "In ritardo": "sum",
+        "Ritardo medio (giorni)": "mean",
+        "Ritardo massimo (giorni)": "max",
+    }).fillna({"Ritardo medio (giorni)": 0})
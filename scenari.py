@@ -0,0 +1,132 @@
+"""Scenari "what-if": varianti del piano calcolate in parallelo e confrontate.
+
+Uno `Scenario` descrive le modifiche rispetto ai dati di partenza (calendario,
+fermi macchina, priorità delle commesse, gruppi di macchine esclusive). Tutti
+gli scenari vengono pianificati in un pool di processi: il DataFrame di
+partenza viene inviato una sola volta a ogni processo e ogni scenario porta
+con sé solo le proprie modifiche.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+import multiprocessing
+import os
+
+import pandas as pd
+
+from calendario import WorkCalendar
+from pianificatore import GRUPPI_MACCHINE, pianifica
+
+COLONNE_CONFRONTO = [
+    "Scenario", "Fine pianificazione", "Durata (giorni)", "Durata (ore lavorative)",
+    "Operazioni in ritardo", "Ritardo medio (giorni)", "Ritardo massimo (giorni)",
+]
+
+
+@dataclass
+class Scenario:
+    """Modifiche da applicare ai dati e al calendario di partenza.
+
+    I campi lasciati a `None` (o vuoti) mantengono il valore di partenza.
+    `fermi` contiene terne (macchina, dal, al) con date incluse;
+    `priorita` associa una commessa alla sua nuova priorità.
+    """
+
+    nome: str
+    settimana: str = None
+    turni: tuple = None
+    festivi: tuple = ()  # aggiunte alle festività del calendario di partenza
+    fermi: tuple = ()
+    priorita: dict = field(default_factory=dict)
+    gruppi: list = None
+
+    def calendario(self, base):
+        return WorkCalendar(
+            turni=self.turni or base.turni,
+            festivi=base.festivi + tuple(self.festivi),
+            settimana=self.settimana or base.settimana,
+        )
+
+    def intervalli_fermo(self):
+        """Fermi come (macchina, inizio, fine) con fine esclusa, dalla mezzanotte del primo giorno."""
+        return tuple(
+            (macchina, datetime.combine(dal, time()), datetime.combine(al + timedelta(days=1), time()))
+            for macchina, dal, al in self.fermi
+        )
+
+    def applica(self, df):
+        """Copia di `df` con le priorità modificate."""
+        if not self.priorita:
+            return df
+        df = df.copy()
+        commesse = df["Commessa"].astype(str)
+        for commessa, priorita in self.priorita.items():
+            df.loc[commesse == str(commessa), "Priorità"] = priorita
+        return df
+
+
+def confronto_piano(nome, gantt_df, calendar):
+    """Riga della tabella di confronto per un piano calcolato."""
+    in_ritardo = int(gantt_df["In ritardo"].sum())
+    inizio, fine = gantt_df["Inizio"].min(), gantt_df["Fine"].max()
+    return {
+        "Scenario": nome,
+        "Fine pianificazione": fine,
+        "Durata (giorni)": (fine - inizio).days if len(gantt_df) else 0,
+        "Durata (ore lavorative)": round(calendar.ore_lavorative(inizio, fine), 1) if len(gantt_df) else 0.0,
+        "Operazioni in ritardo": in_ritardo,
+        "Ritardo medio (giorni)": gantt_df["Ritardo (giorni)"].sum() / in_ritardo if in_ritardo else 0.0,
+        "Ritardo massimo (giorni)": int(gantt_df["Ritardo (giorni)"].max()) if len(gantt_df) else 0,
+    }
+
+
+def pianifica_scenario(df, scenario, calendar=None, groups=None, inizio=None):
+    """Piano di uno scenario, a partire dai dati e dal calendario di partenza."""
+    cal = scenario.calendario(calendar or WorkCalendar())
+    gruppi = scenario.gruppi if scenario.gruppi is not None else groups
+    return pianifica(
+        scenario.applica(df), cal, gruppi, inizio=inizio, fermi=scenario.intervalli_fermo()
+    )
+
+
+# --- Stato dei processi del pool ---
+_df = None
+
+
+def _inizializza_processo(df):
+    global _df
+    _df = df
+
+
+def _confronta(df, scenario, calendar, groups, inizio):
+    piano = pianifica_scenario(df, scenario, calendar, groups, inizio)
+    return confronto_piano(scenario.nome, piano.gantt_df, piano.calendar)
+
+
+def _confronta_nel_processo(scenario, calendar, groups, inizio):
+    return _confronta(_df, scenario, calendar, groups, inizio)
+
+
+def confronta_scenari(df, scenari, calendar=None, groups=None, inizio=None, processi=None, base=True):
+    """Pianifica tutti gli `scenari` in parallelo e restituisce la tabella di confronto.
+
+    Con `base=True` la prima riga è il piano senza modifiche ("Attuale").
+    """
+    calendar = calendar or WorkCalendar()
+    groups = GRUPPI_MACCHINE if groups is None else groups
+    scenari = ([Scenario("Attuale")] if base else []) + list(scenari)
+    processi = min(processi or os.cpu_count() or 1, len(scenari), 8)
+
+    if processi <= 1:
+        righe = [_confronta(df, s, calendar, groups, inizio) for s in scenari]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=processi,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inizializza_processo,
+            initargs=(df,),
+        ) as pool:
+            futuri = [pool.submit(_confronta_nel_processo, s, calendar, groups, inizio) for s in scenari]
+            righe = [f.result() for f in futuri]
+
+    return pd.DataFrame(righe, columns=COLONNE_CONFRONTO).set_index("Scenario")
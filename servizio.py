@@ -0,0 +1,297 @@
+"""Servizio HTTP/JSON locale di pianificazione, con cache dei piani recenti.
+
+Avvio:
+
+    python servizio.py --port 8502
+
+Endpoint:
+
+- `GET /salute`: stato del servizio e della cache;
+- `POST /piano`: operazioni come JSON (`{"operazioni": [...], "calendario": {...},
+  "gruppi": [...], "inizio": "AAAA-MM-GG"}`) oppure come stream Arrow IPC
+  (`Content-Type: application/vnd.apache.arrow.stream`, opzioni nella query
+  string: `turni`, `festivi`, `settimana`, `inizio`). Restituisce piano,
+  ritardi (totali, per macchina e per commessa), liste per macchina e avvisi.
+
+I calendari letti restano in memoria; i piani sono tenuti in una cache LRU
+indicizzata dall'hash della richiesta e dalla data del giorno (senza
+`inizio` il piano parte da oggi, quindi una risposta vale solo per il giorno
+in cui è stata calcolata). Le pianificazioni girano in un pool di
+processi, così più richieste concorrenti non si bloccano a vicenda. Usa solo
+la libreria standard oltre alle dipendenze del motore (pyarrow solo per Arrow).
+"""
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+import hashlib
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import multiprocessing
+import os
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from caricamento import HA_PYARROW, normalizza_ordini
+from calendario import SETTIMANA_DEFAULT, WorkCalendar, leggi_festivi, leggi_turni
+from liste_lavoro import OpzioniLista, liste_export
+from pianificatore import GRUPPI_MACCHINE, pianifica
+from ritardi import riepilogo_ritardi
+
+MAX_PIANI = 32
+MAX_CORPO = 64 * 2**20  # byte
+TIPO_ARROW = "application/vnd.apache.arrow.stream"
+
+
+class RichiestaNonValida(ValueError):
+    pass
+
+
+@lru_cache(maxsize=64)
+def calendario(turni="08:00-17:00", festivi="", settimana=SETTIMANA_DEFAULT):
+    """Calendario costruito dalla sua descrizione testuale, condiviso tra le richieste."""
+    return WorkCalendar(leggi_turni(turni), leggi_festivi(festivi), settimana)
+
+
+def _records(df):
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+
+def calcola_piano(operazioni, opzioni_calendario, gruppi, inizio):
+    """Pianifica e restituisce la risposta già codificata in JSON (eseguita nei processi del pool)."""
+    cal = calendario(**opzioni_calendario)
+    piano = pianifica(normalizza_ordini(operazioni), cal, gruppi, inizio=inizio)
+    gantt_df = piano.gantt_df
+    macchine = sorted(gantt_df["Macchina"].dropna().unique())
+    risposta = {
+        "versione": piano.versione,
+        "operazioni": len(gantt_df),
+        "piano": _records(gantt_df),
+        "ritardi": {
+            "operazioni_in_ritardo": int(gantt_df["In ritardo"].sum()),
+            "per_macchina": _records(riepilogo_ritardi(gantt_df, "Macchina").reset_index()),
+            "per_commessa": _records(riepilogo_ritardi(gantt_df, "Commessa").reset_index()),
+        },
+        "liste": {
+            str(m): _records(lavori)
+            for m, lavori in liste_export(gantt_df, macchine, OpzioniLista()).items()
+        },
+        "avvisi": gantt_df.attrs.get("avvisi", []),
+    }
+    return json.dumps(risposta, ensure_ascii=False).encode("utf-8")
+
+
+def _leggi_inizio(valore):
+    if not valore:
+        return None
+    try:
+        return date.fromisoformat(valore)
+    except ValueError:
+        raise RichiestaNonValida(f"Data di inizio non valida: '{valore}' (formato atteso AAAA-MM-GG)")
+
+
+def _leggi_calendario(calendario):
+    """Opzioni del calendario JSON come testi: turni e festivi possono essere liste di testi."""
+    if not isinstance(calendario, dict):
+        raise RichiestaNonValida("'calendario' deve essere un oggetto {\"turni\", \"festivi\", \"settimana\"}")
+    opzioni = dict(calendario)
+    for chiave in ("turni", "festivi", "settimana"):
+        valore = opzioni.get(chiave)
+        if isinstance(valore, list) and chiave != "settimana" and all(isinstance(v, str) for v in valore):
+            opzioni[chiave] = ",".join(valore)
+        elif valore is not None and not isinstance(valore, str):
+            tipo = "un testo" if chiave == "settimana" else "un testo o una lista di testi"
+            raise RichiestaNonValida(f"'calendario.{chiave}' deve essere {tipo}")
+    return opzioni
+
+
+def _leggi_gruppi(gruppi):
+    if not isinstance(gruppi, list) or not all(
+        isinstance(g, dict) and isinstance(g.get("nome"), str)
+        and isinstance(g.get("macchine"), list) and all(isinstance(m, str) for m in g["macchine"])
+        for g in gruppi
+    ):
+        raise RichiestaNonValida(
+            "'gruppi' deve essere una lista di oggetti {\"nome\": testo, \"macchine\": [testo, ...]}"
+        )
+    return [{"nome": g["nome"], "macchine": g["macchine"]} for g in gruppi]
+
+
+def leggi_richiesta(corpo, tipo, query, oggi=None):
+    """Operazioni (DataFrame) e opzioni di pianificazione da una richiesta /piano.
+
+    Senza data di inizio nella richiesta il piano parte da `oggi` (default:
+    la data corrente).
+    """
+    if tipo == TIPO_ARROW:
+        if not HA_PYARROW:
+            raise RichiestaNonValida("Il formato Arrow richiede il pacchetto pyarrow sul server")
+        import pyarrow as pa
+
+        try:
+            operazioni = pa.ipc.open_stream(io.BytesIO(corpo)).read_pandas()
+            opzioni = {k: v[-1] for k, v in parse_qs(query).items()}
+            gruppi = json.loads(opzioni["gruppi"]) if "gruppi" in opzioni else GRUPPI_MACCHINE
+        except ValueError as e:  # include pyarrow.ArrowInvalid e json.JSONDecodeError
+            raise RichiestaNonValida(f"Richiesta Arrow non valida: {e}")
+    else:
+        try:
+            dati = json.loads(corpo)
+        except json.JSONDecodeError as e:
+            raise RichiestaNonValida(f"JSON non valido: {e}")
+        if not isinstance(dati, dict) or not isinstance(dati.get("operazioni"), list):
+            raise RichiestaNonValida("Il corpo deve contenere la lista 'operazioni'")
+        operazioni = pd.DataFrame.from_records(dati["operazioni"])
+        opzioni = _leggi_calendario(dati.get("calendario") or {})
+        opzioni["inizio"] = dati.get("inizio")
+        gruppi = dati.get("gruppi", GRUPPI_MACCHINE)
+
+    mancanti = {"Macchina", "Operazione", "Codice pezzo", "Tempo unitario (h)", "Setup (h)",
+                "Quantità", "Data richiesta", "Commessa"} - set(operazioni.columns)
+    if mancanti:
+        raise RichiestaNonValida(f"Colonne mancanti: {', '.join(sorted(mancanti))}")
+
+    opzioni_calendario = {
+        k: opzioni[k] for k in ("turni", "festivi", "settimana") if opzioni.get(k)
+    }
+    try:
+        calendario(**opzioni_calendario)
+    except ValueError as e:
+        raise RichiestaNonValida(str(e))
+    inizio = _leggi_inizio(opzioni.get("inizio")) or oggi or date.today()
+    return operazioni, opzioni_calendario, _leggi_gruppi(gruppi), inizio
+
+
+class ServizioPianificazione:
+    """Pool di processi e cache LRU dei piani calcolati."""
+
+    def __init__(self, processi=None, max_piani=MAX_PIANI):
+        self.pool = ProcessPoolExecutor(
+            max_workers=processi or max(1, min(os.cpu_count() or 1, 8)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.max_piani = max_piani
+        self._piani = OrderedDict()
+        self._in_corso = {}
+        self._lock = threading.Lock()
+        self.richieste = 0
+        self.dalla_cache = 0
+
+    def piano(self, corpo, tipo, query):
+        """Risposta JSON (bytes) per una richiesta /piano e se arriva dalla cache."""
+        oggi = date.today()
+        chiave = hashlib.sha256(b"\0".join([tipo.encode(), query.encode(), corpo, oggi.isoformat().encode()])).hexdigest()
+        with self._lock:
+            self.richieste += 1
+            if chiave in self._piani:
+                self._piani.move_to_end(chiave)
+                self.dalla_cache += 1
+                return self._piani[chiave], True
+
+        argomenti = leggi_richiesta(corpo, tipo, query, oggi)
+        with self._lock:
+            futuro = self._in_corso.get(chiave)
+            if futuro is None:
+                # Richieste identiche concorrenti condividono lo stesso calcolo
+                futuro = self._in_corso[chiave] = self.pool.submit(calcola_piano, *argomenti)
+
+        try:
+            risposta = futuro.result()
+        finally:
+            with self._lock:
+                self._in_corso.pop(chiave, None)
+        with self._lock:
+            self._piani[chiave] = risposta
+            while len(self._piani) > self.max_piani:
+                self._piani.popitem(last=False)
+        return risposta, False
+
+    def stato(self):
+        with self._lock:
+            return {
+                "stato": "ok",
+                "piani_in_cache": len(self._piani),
+                "richieste": self.richieste,
+                "dalla_cache": self.dalla_cache,
+            }
+
+    def chiudi(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class GestoreRichieste(BaseHTTPRequestHandler):
+    server_version = "Pianificazione/1.0"
+
+    @property
+    def servizio(self):
+        return self.server.servizio
+
+    def _rispondi(self, stato, corpo, intestazioni=None):
+        if not isinstance(corpo, bytes):
+            corpo = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(stato)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valore in (intestazioni or {}).items():
+            self.send_header(nome, valore)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/salute":
+            self._rispondi(HTTPStatus.OK, self.servizio.stato())
+        else:
+            self._rispondi(HTTPStatus.NOT_FOUND, {"errore": "Percorso non trovato"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/piano":
+            self._rispondi(HTTPStatus.NOT_FOUND, {"errore": "Percorso non trovato"})
+            return
+        lunghezza = int(self.headers.get("Content-Length") or 0)
+        if lunghezza > MAX_CORPO:
+            self._rispondi(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"errore": "Richiesta troppo grande"})
+            return
+        tipo = (self.headers.get("Content-Type") or "application/json").split(";")[0].strip()
+        try:
+            risposta, da_cache = self.servizio.piano(self.rfile.read(lunghezza), tipo, url.query)
+        except RichiestaNonValida as e:
+            self._rispondi(HTTPStatus.BAD_REQUEST, {"errore": str(e)})
+        except Exception as e:
+            self._rispondi(HTTPStatus.INTERNAL_SERVER_ERROR, {"errore": f"{type(e).__name__}: {e}"})
+        else:
+            self._rispondi(HTTPStatus.OK, risposta, {"X-Cache": "HIT" if da_cache else "MISS"})
+
+
+def crea_server(host="127.0.0.1", porta=8502, processi=None):
+    server = ThreadingHTTPServer((host, porta), GestoreRichieste)
+    server.daemon_threads = True
+    server.servizio = ServizioPianificazione(processi)
+    return server
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Servizio HTTP/JSON di pianificazione produzione")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8502)
+    p.add_argument("--processi", type=int, help="processi di pianificazione (default: numero di CPU, max 8)")
+    args = p.parse_args(argv)
+
+    server = crea_server(args.host, args.port, args.processi)
+    print(f"Servizio di pianificazione su http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.servizio.chiudi()
+
+
+if __name__ == "__main__":
+    main()
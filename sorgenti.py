@@ -0,0 +1,196 @@
+"""Scaricamento del file ordini da Google Drive con cache condivisa.
+
+Una sola `requests.Session` (connessioni riutilizzate) per processo, richieste
+condizionali con ETag/Last-Modified e, se il server non li supporta, confronto
+dell'hash del contenuto. L'ultima versione valida (byte e DataFrame letto)
+resta in cache per `ttl` secondi ed è condivisa da tutte le sessioni: se Drive
+non risponde si continua a usare l'ultima versione scaricata.
+
+Con `FonteDrive.sorveglia` un thread in background, uno per file e condiviso
+da tutte le sessioni, verifica periodicamente il file e legge subito le nuove
+versioni; le sessioni confrontano solo l'hash in memoria.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+import threading
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from caricamento import hash_contenuto, leggi_ordini
+
+DRIVE_URL = "https://drive.google.com/uc?export=download&id={file_id}"
+TTL_DEFAULT = 60  # secondi tra due verifiche sul server
+TIMEOUT = (5, 30)  # connessione, lettura
+INTERVALLO_SORVEGLIANZA = 300  # secondi tra due verifiche in background
+INTERESSE_SORVEGLIANZA = 3  # intervalli senza richieste dopo cui la sorveglianza si ferma
+
+_FIRMA_XLSX = b"PK"  # i file .xlsx sono archivi zip
+
+_sessione = None
+_sessione_lock = threading.Lock()
+_fonti = {}
+_fonti_lock = threading.Lock()
+
+
+def sessione_http():
+    """Sessione HTTP condivisa con pool di connessioni."""
+    global _sessione
+    with _sessione_lock:
+        if _sessione is None:
+            _sessione = requests.Session()
+            adattatore = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2)
+            _sessione.mount("https://", adattatore)
+            _sessione.mount("http://", adattatore)
+        return _sessione
+
+
+@dataclass
+class VersioneFile:
+    """Contenuto di una versione del file, con il DataFrame letto una sola volta."""
+
+    contenuto: bytes
+    hash: str
+    etag: str = None
+    last_modified: str = None
+    scaricato_il: datetime = field(default_factory=datetime.now)
+    _df: pd.DataFrame = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def dataframe(self):
+        """DataFrame della versione, letto al primo accesso e poi riutilizzato."""
+        with self._lock:
+            if self._df is None:
+                self._df = leggi_ordini(self.contenuto, self.hash)
+            return self._df
+
+
+@dataclass
+class EsitoDownload:
+    versione: VersioneFile
+    cambiato: bool  # contenuto diverso dalla versione precedente
+    verificato_il: datetime
+    errore: str = None  # valorizzato se si sta usando la copia in cache per un errore
+
+
+class FonteDrive:
+    """File Google Drive scaricato in modo condizionale e tenuto in cache."""
+
+    def __init__(self, file_id, ttl=TTL_DEFAULT, url=None):
+        self.file_id = file_id
+        self.ttl = ttl
+        self.url = url or DRIVE_URL.format(file_id=file_id)
+        self.versione = None
+        self._verificato = 0.0  # time.monotonic() dell'ultima verifica riuscita
+        self._verificato_il = None
+        self._lock = threading.Lock()
+        self._sorvegliante = None
+        self._intervallo = INTERVALLO_SORVEGLIANZA
+        self._richiesta_sorveglianza = 0.0
+        self._sorveglianza_lock = threading.Lock()
+
+    def scarica(self, forza=False):
+        """Restituisce la versione corrente, interrogando Drive al massimo ogni `ttl` secondi."""
+        with self._lock:
+            if (
+                not forza
+                and self.versione is not None
+                and time.monotonic() - self._verificato < self.ttl
+            ):
+                return EsitoDownload(self.versione, False, self._verificato_il)
+
+            try:
+                return self._verifica()
+            except (requests.RequestException, ValueError) as e:
+                if self.versione is None:
+                    raise
+                return EsitoDownload(self.versione, False, self._verificato_il, errore=str(e))
+
+    def _verifica(self):
+        headers = {}
+        if self.versione is not None:
+            if self.versione.etag:
+                headers["If-None-Match"] = self.versione.etag
+            if self.versione.last_modified:
+                headers["If-Modified-Since"] = self.versione.last_modified
+
+        response = sessione_http().get(self.url, headers=headers, timeout=TIMEOUT)
+        ora = datetime.now()
+
+        if response.status_code == 304 and self.versione is not None:
+            self._segna_verificato(ora)
+            return EsitoDownload(self.versione, False, ora)
+
+        if response.status_code != 200:
+            raise ValueError(
+                f"Risposta HTTP {response.status_code}. Verifica che il file sia condiviso pubblicamente."
+            )
+        contenuto = response.content
+        if not contenuto.startswith(_FIRMA_XLSX):
+            raise ValueError("Il file scaricato non è un Excel. Verifica che il file sia condiviso pubblicamente.")
+
+        digest = hash_contenuto(contenuto)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        cambiato = self.versione is None or digest != self.versione.hash
+        if cambiato:
+            self.versione = VersioneFile(contenuto, digest, etag, last_modified)
+        else:
+            self.versione.etag, self.versione.last_modified = etag, last_modified
+        self._segna_verificato(ora)
+        return EsitoDownload(self.versione, cambiato, ora)
+
+    def _segna_verificato(self, ora):
+        self._verificato = time.monotonic()
+        self._verificato_il = ora
+
+    @property
+    def hash(self):
+        """Hash della versione corrente (None se il file non è ancora stato scaricato)."""
+        versione = self.versione
+        return versione.hash if versione is not None else None
+
+    def sorveglia(self, intervallo=INTERVALLO_SORVEGLIANZA):
+        """Avvia (o mantiene attiva) la verifica in background ogni `intervallo` secondi.
+
+        Va richiamata periodicamente da chi è interessato: senza richieste per
+        `INTERESSE_SORVEGLIANZA` intervalli il thread si ferma da solo.
+        """
+        with self._sorveglianza_lock:
+            self._intervallo = intervallo
+            self._richiesta_sorveglianza = time.monotonic()
+            if self._sorvegliante is None or not self._sorvegliante.is_alive():
+                self._sorvegliante = threading.Thread(
+                    target=self._sorveglia, name=f"sorveglianza-{self.file_id}", daemon=True
+                )
+                self._sorvegliante.start()
+
+    def _sorveglia(self):
+        while True:
+            with self._sorveglianza_lock:
+                intervallo = self._intervallo
+            time.sleep(intervallo)
+            with self._sorveglianza_lock:
+                if time.monotonic() - self._richiesta_sorveglianza > INTERESSE_SORVEGLIANZA * self._intervallo:
+                    self._sorvegliante = None
+                    return
+            try:
+                esito = self.scarica(forza=True)
+                if esito.cambiato:
+                    # Lettura anticipata: le sessioni trovano il DataFrame già pronto
+                    esito.versione.dataframe()
+            except Exception:
+                # Nessuna versione valida ancora disponibile: si riprova al giro successivo
+                pass
+
+
+def fonte_drive(file_id, ttl=TTL_DEFAULT):
+    """Fonte condivisa (una per file) tra tutte le sessioni del processo."""
+    with _fonti_lock:
+        fonte = _fonti.get(file_id)
+        if fonte is None:
+            fonte = _fonti[file_id] = FonteDrive(file_id, ttl)
+        fonte.ttl = ttl
+        return fonte
@@ -0,0 +1,37 @@
+"""Archivio con codici numerici: le letture devono restituire gli stessi codici del piano."""
+from datetime import date
+
+import numpy as np
+
+from archivio import ArchivioPiani
+from benchmark import genera_ordini
+from pianificatore import pianifica
+
+
+def _piano_macchine_numeriche():
+    df, _ = genera_ordini(500, macchine=12, seme=1)
+    df["Macchina"] = df["Macchina"].str[1:].astype(int) + 100  # M03 -> 103
+    gruppi = [{"nome": "Gruppo0", "macchine": [100, 101]}]
+    return pianifica(df, None, gruppi, inizio=date(2026, 1, 5))
+
+
+def test_letture_con_macchine_numeriche(tmp_path):
+    piano = _piano_macchine_numeriche()
+    gantt_df = piano.gantt_df
+    ArchivioPiani(tmp_path / "piani.sqlite").salva_piano(piano.versione, gantt_df)
+    archivio = ArchivioPiani(tmp_path / "piani.sqlite")  # i tipi si rileggono dall'archivio
+
+    macchine = [103, 107]
+    lette = archivio.operazioni(piano.versione, macchine=macchine)
+    attese = gantt_df[gantt_df["Macchina"].isin(macchine)]
+    assert len(lette) and sorted(lette.index) == sorted(attese.index)
+    assert set(lette["Macchina"]) == set(macchine)
+    assert (lette["Macchina"] == attese.loc[lette.index, "Macchina"].astype(int)).all()
+
+    periodi = archivio.periodi_macchine(piano.versione, macchine)
+    for macchina in macchine:
+        assert periodi.at[macchina, "fine"] == attese.loc[attese["Macchina"] == macchina, "Fine"].max()
+
+    riepilogo = archivio.riepilogo_ritardi(piano.versione, "Macchina")
+    assert list(riepilogo.index) == sorted(gantt_df["Macchina"].unique())
+    assert np.issubdtype(riepilogo.index.dtype, np.integer)